@@ -19,7 +19,53 @@ SCOPES = [
 
 # Database settings
 DATABASE_URL = os.getenv('DATABASE_URL', 'sqlite:///emails.db')
+# Trigram full-text index for contains conditions on subject/from (SQLite FTS5 or PostgreSQL pg_trgm)
+FULL_TEXT_INDEX = os.getenv('FULL_TEXT_INDEX', 'false').lower() == 'true'
 
 # Email provider settings
 EMAIL_PROVIDER = os.getenv('EMAIL_PROVIDER', 'gmail')
-FETCH_LIMIT = int(os.getenv('FETCH_LIMIT', 10))
\ No newline at end of file
+# Set FETCH_LIMIT to 0 to fetch the whole mailbox
+FETCH_LIMIT = int(os.getenv('FETCH_LIMIT', 10))
+# messages.list returns at most 500 ids per page
+FETCH_PAGE_SIZE = int(os.getenv('FETCH_PAGE_SIZE', 500))
+# 'incremental' syncs from the stored history cursor, 'full' always re-lists
+SYNC_MODE = os.getenv('SYNC_MODE', 'incremental')
+# 'auto' picks the smallest message format the loaded rules need; 'metadata' or 'full' forces one
+FETCH_FORMAT = os.getenv('FETCH_FORMAT', 'auto')
+# Gmail accepts at most 100 calls per HTTP batch request
+FETCH_BATCH_SIZE = int(os.getenv('FETCH_BATCH_SIZE', 100))
+# Use the asyncio Gmail provider (httpx connection pool) behind a blocking adapter
+ASYNC_PROVIDER = os.getenv('ASYNC_PROVIDER', 'false').lower() == 'true'
+# Requests the async provider keeps in flight at once
+ASYNC_MAX_IN_FLIGHT = int(os.getenv('ASYNC_MAX_IN_FLIGHT', 100))
+# Seconds to wait for a provider HTTP response
+HTTP_TIMEOUT = float(os.getenv('HTTP_TIMEOUT', 60))
+# Kept-alive connections the Gmail provider shares across threads
+HTTP_POOL_SIZE = int(os.getenv('HTTP_POOL_SIZE', 10))
+# Seconds a request waits for a free pooled connection
+HTTP_POOL_TIMEOUT = float(os.getenv('HTTP_POOL_TIMEOUT', 30))
+# Attempts per Gmail API call before a rate-limited or transient error is given up on
+API_MAX_ATTEMPTS = int(os.getenv('API_MAX_ATTEMPTS', 5))
+# Exponential backoff between attempts: base * 2**attempt seconds, capped, with full jitter
+API_BACKOFF_BASE = float(os.getenv('API_BACKOFF_BASE', 0.5))
+API_BACKOFF_MAX = float(os.getenv('API_BACKOFF_MAX', 32))
+# Seconds a listed set of labels is trusted; 0 keeps it for the whole run
+LABEL_CACHE_TTL = float(os.getenv('LABEL_CACHE_TTL', 3600))
+# Keep the label list in the database so the next run can skip listing labels
+PERSIST_LABEL_CACHE = os.getenv('PERSIST_LABEL_CACHE', 'false').lower() == 'true'
+
+# Rule processing settings
+PROCESS_BATCH_SIZE = int(os.getenv('PROCESS_BATCH_SIZE', 1000))
+# Let the database evaluate the rule conditions it can and load only rows that may match;
+# pending rows no rule can match are left unloaded (and pending) instead of scanned in Python
+RULE_PUSHDOWN = os.getenv('RULE_PUSHDOWN', 'true').lower() == 'true'
+# Worker processes for rule matching; 1 matches in the main process. Each batch is split
+# evenly across the workers in shards of at least 64 emails, so PROCESS_BATCH_SIZE is raised
+# to at least RULE_WORKERS * 64 to give every worker a shard
+RULE_WORKERS = int(os.getenv('RULE_WORKERS', 1))
+# Threads running provider actions; keep at or below HTTP_POOL_SIZE so none waits for a connection
+ACTION_WORKERS = int(os.getenv('ACTION_WORKERS', 4))
+# Merge the label changes of all matched actions into one call per email
+COALESCE_ACTIONS = os.getenv('COALESCE_ACTIONS', 'true').lower() == 'true'
+# Gmail allows 250 quota units per user per second
+ACTION_QUOTA_PER_SECOND = float(os.getenv('ACTION_QUOTA_PER_SECOND', 250))
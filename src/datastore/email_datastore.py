@@ -1,59 +1,128 @@
-from typing import List, Optional
+from typing import Dict, Iterator, List, Optional, Tuple
 from enums.email_enums import EmailProviderType
-from sqlalchemy import create_engine
+from sqlalchemy import and_, bindparam, create_engine, delete, false, insert, inspect, or_, select, text, update
 from sqlalchemy.orm import sessionmaker, Session
 from datetime import datetime
 import json
 
-from .email_info import Base as EmailBase, Email
+from .email_info import Base as EmailBase, Email, EmailLabel, encode_labels, decode_labels
 from .rule_execution import Base as RuleBase, RuleExecution
-from config.settings import DATABASE_URL
+from .sync_state import Base as SyncBase, SyncState, LabelCache
+from .query_planner import QueryPlanner
+from .text_index import create_text_index
+from config.settings import DATABASE_URL, FULL_TEXT_INDEX
 from utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+# Rows per IN-list lookup and executemany batch; stays under SQLite's bound parameter limit
+SAVE_CHUNK_SIZE = 500
+
 class EmailRepository:
     """Repository for email database operations"""
     
-    def __init__(self, database_url: str = DATABASE_URL):
+    def __init__(self, database_url: str = DATABASE_URL, full_text_index: bool = FULL_TEXT_INDEX):
         self.engine = create_engine(database_url, echo=False)
         EmailBase.metadata.create_all(self.engine)
         RuleBase.metadata.create_all(self.engine)
+        SyncBase.metadata.create_all(self.engine)
+        self._add_missing_columns()
+        self.text_index = create_text_index(self.engine) if full_text_index else None
         self.SessionLocal = sessionmaker(bind=self.engine)
         logger.info(f"Database initialized at {database_url}")
     
+    def _add_missing_columns(self):
+        """Add columns (and their indexes) introduced after the database was created"""
+        inspector = inspect(self.engine)
+        for metadata in (EmailBase.metadata, RuleBase.metadata, SyncBase.metadata):
+            for table in metadata.sorted_tables:
+                existing = {column['name'] for column in inspector.get_columns(table.name)}
+                missing = [column for column in table.columns if column.name not in existing]
+                if not missing:
+                    continue
+                
+                with self.engine.begin() as conn:
+                    for column in missing:
+                        column_type = column.type.compile(dialect=self.engine.dialect)
+                        conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                        logger.info(f"Added column {table.name}.{column.name}")
+                for index in table.indexes:
+                    index.create(self.engine, checkfirst=True)
+    
     def get_session(self) -> Session:
         """Get a new database session"""
         return self.SessionLocal()
     
     def save_emails(self, emails: List[dict], provider_type: str = 'gmail') -> int:
-        """Save emails to database"""
+        """Save emails to database, inserting new ones and updating known ones in bulk"""
         session = self.get_session()
         new_count = 0
+        provider_type_value = EmailProviderType.from_string(provider_type).value
+        
+        # The last copy of a message wins if it appears more than once
+        unique_emails = list({email_data['id']: email_data for email_data in emails}.values())
         
         try:
-            for email_data in emails:
-                existing = session.query(Email).filter_by(
-                    provider_id=email_data['id']
-                ).first()
+            for start in range(0, len(unique_emails), SAVE_CHUNK_SIZE):
+                chunk = unique_emails[start:start + SAVE_CHUNK_SIZE]
+                existing = {
+                    provider_id: (row_id, is_read, labels, thread_id)
+                    for provider_id, row_id, is_read, labels, thread_id in session.query(
+                        Email.provider_id, Email.id, Email.is_read, Email.labels, Email.thread_id
+                    ).filter(Email.provider_id.in_([email_data['id'] for email_data in chunk]))
+                }
+                
+                now = datetime.utcnow()
+                new_rows = []
+                updated_rows = []
+                relabelled = {}
+                for email_data in chunk:
+                    labels = encode_labels(email_data.get('labels'))
+                    if email_data['id'] in existing:
+                        row_id, old_is_read, old_labels, old_thread_id = existing[email_data['id']]
+                        # Rows stored before thread ids were kept get theirs on the next fetch
+                        thread_id = old_thread_id or email_data.get('thread_id')
+                        # Leave updated_at alone for unchanged emails so they are not reprocessed
+                        if (email_data['is_read'] == old_is_read and labels == old_labels
+                                and thread_id == old_thread_id):
+                            continue
+                        updated_rows.append({
+                            'id': row_id,
+                            'thread_id': thread_id,
+                            'is_read': email_data['is_read'],
+                            'labels': labels,
+                            'updated_at': now
+                        })
+                        if labels != old_labels:
+                            relabelled[row_id] = email_data.get('labels') or []
+                    else:
+                        new_rows.append({
+                            'provider_id': email_data['id'],
+                            'provider_type': provider_type_value,
+                            'thread_id': email_data.get('thread_id'),
+                            'from_address': email_data['from'],
+                            'to_address': email_data['to'],
+                            'subject': email_data['subject'],
+                            'received_date': email_data['received_date'],
+                            'is_read': email_data['is_read'],
+                            'labels': labels,
+                            'created_at': now,
+                            'updated_at': now
+                        })
                 
-                if existing:
-                    existing.is_read = email_data['is_read']
-                    existing.labels = json.dumps(email_data['labels'])
-                    existing.updated_at = datetime.utcnow()
-                else:
-                    email = Email(
-                        provider_id=email_data['id'],
-                        provider_type_enum=EmailProviderType.from_string(provider_type),
-                        from_address=email_data['from'],
-                        to_address=email_data['to'],
-                        subject=email_data['subject'],     
-                        received_date=email_data['received_date'],
-                        is_read=email_data['is_read']
-                    
-                    )
-                    session.add(email)
-                    new_count += 1
+                if new_rows:
+                    inserted = session.execute(
+                        insert(Email).returning(Email.id, Email.labels, Email.subject, Email.from_address),
+                        new_rows
+                    ).all()
+                    for row_id, labels, _, _ in inserted:
+                        relabelled[row_id] = decode_labels(labels) or []
+                    if self.text_index:
+                        self.text_index.add(session, [(row_id, subject, sender) for row_id, _, subject, sender in inserted])
+                if updated_rows:
+                    session.execute(update(Email), updated_rows)
+                self._replace_label_links(session, relabelled)
+                new_count += len(new_rows)
             
             session.commit()
             logger.info(f"Saved {new_count} new emails, updated {len(emails) - new_count}")
@@ -66,6 +135,127 @@ class EmailRepository:
         finally:
             session.close()
     
+    def _replace_label_links(self, session: Session, labels_by_row_id: Dict[int, List[str]]):
+        """Rewrite email_labels rows for the given emails"""
+        if not labels_by_row_id:
+            return
+        session.execute(delete(EmailLabel).where(EmailLabel.email_id.in_(list(labels_by_row_id))))
+        links = [
+            {'email_id': row_id, 'label_id': label_id}
+            for row_id, labels in labels_by_row_id.items()
+            for label_id in dict.fromkeys(labels)
+        ]
+        if links:
+            session.execute(insert(EmailLabel), links)
+    
+    def delete_emails(self, provider_ids: List[str]) -> int:
+        """Delete emails that were removed from the mailbox"""
+        if not provider_ids:
+            return 0
+        
+        session = self.get_session()
+        try:
+            row_ids = select(Email.id).where(Email.provider_id.in_(provider_ids))
+            session.execute(delete(EmailLabel).where(EmailLabel.email_id.in_(row_ids)))
+            if self.text_index:
+                self.text_index.remove(session, row_ids)
+            deleted = session.query(Email).filter(
+                Email.provider_id.in_(provider_ids)
+            ).delete(synchronize_session=False)
+            session.commit()
+            logger.info(f"Deleted {deleted} emails")
+            return deleted
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error deleting emails: {str(e)}")
+            raise
+        finally:
+            session.close()
+    
+    def get_sync_cursor(self, provider_type: str = 'gmail', account: str = 'me') -> Optional[str]:
+        """Get the stored mailbox sync cursor, if any"""
+        session = self.get_session()
+        try:
+            state = session.query(SyncState).filter_by(
+                provider_type=EmailProviderType.from_string(provider_type).value,
+                account=account
+            ).first()
+            return state.history_id if state else None
+        finally:
+            session.close()
+    
+    def save_sync_cursor(self, history_id: str, provider_type: str = 'gmail', account: str = 'me'):
+        """Store the mailbox sync cursor reached by the last fetch"""
+        session = self.get_session()
+        try:
+            provider_value = EmailProviderType.from_string(provider_type).value
+            state = session.query(SyncState).filter_by(
+                provider_type=provider_value,
+                account=account
+            ).first()
+            
+            if state:
+                state.history_id = str(history_id)
+                state.updated_at = datetime.utcnow()
+            else:
+                session.add(SyncState(
+                    provider_type=provider_value,
+                    account=account,
+                    history_id=str(history_id)
+                ))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error saving sync cursor: {str(e)}")
+            raise
+        finally:
+            session.close()
+    
+    def get_cached_labels(self, provider_type: str = 'gmail',
+                          account: str = 'me') -> Optional[Tuple[List[Dict[str, str]], datetime]]:
+        """Get the stored label list and when it was saved, if any"""
+        session = self.get_session()
+        try:
+            rows = session.query(LabelCache).filter_by(
+                provider_type=EmailProviderType.from_string(provider_type).value,
+                account=account
+            ).all()
+            if not rows:
+                return None
+            labels = [{'id': row.label_id, 'name': row.name} for row in rows]
+            return labels, min(row.updated_at for row in rows)
+        finally:
+            session.close()
+    
+    def save_cached_labels(self, labels: List[Dict[str, str]], provider_type: str = 'gmail',
+                           account: str = 'me'):
+        """Replace the stored label list"""
+        session = self.get_session()
+        try:
+            provider_value = EmailProviderType.from_string(provider_type).value
+            session.query(LabelCache).filter_by(
+                provider_type=provider_value,
+                account=account
+            ).delete(synchronize_session=False)
+            now = datetime.utcnow()
+            session.add_all([
+                LabelCache(
+                    provider_type=provider_value,
+                    account=account,
+                    label_id=label['id'],
+                    name=label['name'],
+                    updated_at=now
+                )
+                for label in labels
+            ])
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error saving labels: {str(e)}")
+            raise
+        finally:
+            session.close()
+    
     def get_all_emails(self) -> List[Email]:
         """Get all emails from database"""
         session = self.get_session()
@@ -74,17 +264,189 @@ class EmailRepository:
         finally:
             session.close()
     
-    def get_emails_for_processing(self, limit: Optional[int] = None) -> List[Email]:
-        """Get emails that need rule processing"""
+    def get_emails_with_label(self, label_id: str) -> List[Email]:
+        """Get emails carrying a label, using the label association index"""
+        session = self.get_session()
+        try:
+            return (
+                session.query(Email)
+                .join(EmailLabel, EmailLabel.email_id == Email.id)
+                .filter(EmailLabel.label_id == label_id)
+                .order_by(Email.received_date.desc())
+                .all()
+            )
+        finally:
+            session.close()
+    
+    def get_emails_for_processing(self, limit: Optional[int] = None,
+                                  rules_version: Optional[str] = None) -> List[Email]:
+        """
+        Get emails that need rule processing.
+        With a rules_version, only emails pending for that version are returned.
+        """
         session = self.get_session()
         try:
             query = session.query(Email).order_by(Email.received_date.desc())
+            if rules_version is not None:
+                query = query.filter(self._pending_filter(rules_version))
             if limit:
                 query = query.limit(limit)
             return query.all()
         finally:
             session.close()
     
+    def iter_emails_for_processing(self, batch_size: int = 1000,
+                                   rules_version: Optional[str] = None,
+                                   rules: Optional[list] = None,
+                                   now: Optional[datetime] = None) -> Iterator[List[dict]]:
+        """
+        Yield batches of email dicts for rule processing, newest first.
+        Uses keyset pagination on (received_date, id) so each batch is one indexed query.
+        With a rules_version, only emails pending for that version are yielded.
+        With rules, only emails that may match one of them are yielded (see candidate_filter).
+        """
+        candidates = self.candidate_filter(rules, now) if rules is not None else None
+        last_key = None
+        while True:
+            session = self.get_session()
+            try:
+                query = session.query(*Email.processing_columns()).order_by(
+                    Email.received_date.desc(), Email.id.desc()
+                )
+                if candidates is not None:
+                    query = query.filter(candidates)
+                if rules_version is not None:
+                    query = query.filter(self._pending_filter(rules_version))
+                if last_key is not None:
+                    last_date, last_id = last_key
+                    query = query.filter(or_(
+                        Email.received_date < last_date,
+                        and_(Email.received_date == last_date, Email.id < last_id)
+                    ))
+                rows = query.limit(batch_size).all()
+            finally:
+                session.close()
+            
+            if not rows:
+                return
+            yield [Email.row_to_dict(row) for row in rows]
+            
+            if len(rows) < batch_size:
+                return
+            last_key = (rows[-1].received_date, rows[-1].id)
+    
+    def candidate_filter(self, rules: list, now: Optional[datetime] = None):
+        """
+        SQL filter selecting the rows that may match at least one rule, or None when
+        a rule cannot be narrowed in SQL and every row has to be checked in Python
+        """
+        planner = QueryPlanner(now, self.text_index)
+        filters = []
+        for rule in rules:
+            plan = planner.plan(rule)
+            if plan.filter is None:
+                return None
+            filters.append(plan.filter)
+        return or_(*filters) if filters else false()
+    
+    def find_matching_emails(self, rule, now: Optional[datetime] = None,
+                             rules_version: Optional[str] = None) -> List[dict]:
+        """
+        Get email dicts matching a rule, newest first.
+        Conditions with a SQL translation are evaluated by the database so only
+        candidate rows are loaded; the rest are checked in Python.
+        """
+        plan = QueryPlanner(now, self.text_index).plan(rule)
+        session = self.get_session()
+        try:
+            query = session.query(*Email.processing_columns()).order_by(
+                Email.received_date.desc(), Email.id.desc()
+            )
+            if plan.filter is not None:
+                query = query.filter(plan.filter)
+            if rules_version is not None:
+                query = query.filter(self._pending_filter(rules_version))
+            rows = query.all()
+        finally:
+            session.close()
+        
+        emails = [Email.row_to_dict(row) for row in rows]
+        if plan.fully_pushed:
+            return emails
+        return [email for email in emails if plan.matches_residual(email)]
+    
+    def find_contains_candidates(self, field: str, needle: str) -> Optional[List[str]]:
+        """
+        Get provider ids of emails whose field contains needle (case-insensitive)
+        using the full-text index, or None if the index cannot answer the lookup
+        """
+        search_value = str(needle).lower()
+        if not self.text_index:
+            return None
+        candidates = self.text_index.candidate_filter(field, search_value)
+        if candidates is None:
+            return None
+        
+        session = self.get_session()
+        try:
+            return [provider_id for (provider_id,) in session.query(Email.provider_id).filter(candidates)]
+        finally:
+            session.close()
+    
+    def _pending_filter(self, rules_version: str):
+        """
+        Emails never evaluated, changed since their last evaluation, evaluated
+        under different rules, or whose date conditions may have started matching
+        """
+        return or_(
+            Email.processed_at.is_(None),
+            Email.updated_at > Email.processed_at,
+            Email.rules_version.is_(None),
+            Email.rules_version != rules_version,
+            # next_evaluation_at is in local time, like the date conditions
+            Email.next_evaluation_at <= datetime.now()
+        )
+    
+    def mark_processed(self, provider_ids: List[str], rules_version: str,
+                       processed_at: Optional[datetime] = None,
+                       next_evaluation_at: Optional[Dict[str, datetime]] = None):
+        """
+        Record that emails were evaluated under rules_version.
+        processed_at should be taken before the emails were loaded so that
+        changes saved during processing still count as pending.
+        """
+        if not provider_ids:
+            return
+        
+        processed_at = processed_at or datetime.utcnow()
+        next_evaluation_at = next_evaluation_at or {}
+        table = Email.__table__
+        statement = (
+            update(table)
+            .where(table.c.provider_id == bindparam('b_provider_id'))
+            .values(
+                processed_at=processed_at,
+                rules_version=rules_version,
+                next_evaluation_at=bindparam('b_next_evaluation_at'),
+                # Keep updated_at as is; it tracks email changes, not evaluations
+                updated_at=table.c.updated_at
+            )
+        )
+        
+        session = self.get_session()
+        try:
+            session.execute(statement, [
+                {'b_provider_id': provider_id, 'b_next_evaluation_at': next_evaluation_at.get(provider_id)}
+                for provider_id in provider_ids
+            ])
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error marking emails processed: {str(e)}")
+            raise
+        finally:
+            session.close()
+    
     def log_rule_execution(self, email_id: str, rule_name: str, 
                           matched: bool, actions: List[str]):
         """Log a rule execution"""
@@ -104,6 +466,36 @@ class EmailRepository:
         finally:
             session.close()
     
+    def log_rule_executions_bulk(self, executions: List[dict]) -> int:
+        """
+        Log many rule executions with a single executemany.
+        Each entry has email_id, rule_name, matched and actions keys.
+        """
+        if not executions:
+            return 0
+        
+        session = self.get_session()
+        try:
+            now = datetime.utcnow()
+            session.execute(insert(RuleExecution), [
+                {
+                    'email_id': execution['email_id'],
+                    'rule_name': execution['rule_name'],
+                    'matched': execution['matched'],
+                    'actions_executed': json.dumps(execution['actions']),
+                    'executed_at': now
+                }
+                for execution in executions
+            ])
+            session.commit()
+            return len(executions)
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Error logging rule executions: {str(e)}")
+            return 0
+        finally:
+            session.close()
+    
     def get_rule_executions(self, email_id: str) -> List[RuleExecution]:
         """Get all rule executions for an email"""
         session = self.get_session()
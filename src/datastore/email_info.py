@@ -1,11 +1,30 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean
+from sqlalchemy import Column, Integer, String, Text, DateTime, Boolean, ForeignKey
 from sqlalchemy.ext.declarative import declarative_base
 from datetime import datetime
+from typing import Optional
 from enums.email_enums import EmailProviderType
 import json
 
 Base = declarative_base()
 
+LABEL_SEPARATOR = ','
+
+def encode_labels(labels) -> Optional[str]:
+    """Encode label ids compactly for the labels column; None keeps them unknown"""
+    if labels is None:
+        return None
+    return LABEL_SEPARATOR.join(labels)
+
+def decode_labels(value) -> Optional[list]:
+    """
+    Decode the labels column back into a list of label ids. NULL (rows stored
+    before labels were kept, or without label data) stays None for unknown,
+    while an empty string is an email known to have no labels.
+    """
+    if value is None:
+        return None
+    return value.split(LABEL_SEPARATOR) if value else []
+
 class Email(Base):
     """Email model"""
     __tablename__ = 'email_info'
@@ -13,24 +32,57 @@ class Email(Base):
     id = Column(Integer, primary_key=True, autoincrement=True)
     provider_id = Column(String(255), unique=True, nullable=False, index=True)
     provider_type = Column(Integer, nullable=False, default=EmailProviderType.GMAIL.value)
+    thread_id = Column(String(255), index=True)
     from_address = Column(String(500), nullable=False, index=True)
     to_address = Column(Text)
     subject = Column(Text, index=True)
     received_date = Column(DateTime, nullable=False, index=True)
     is_read = Column(Boolean, default=False, index=True)
+    labels = Column(Text)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    processed_at = Column(DateTime, index=True)
+    rules_version = Column(String(64))
+    next_evaluation_at = Column(DateTime, index=True)
     
     def to_dict(self):
         """Convert to dictionary for rule processing"""
         return {
             'id': self.provider_id,
+            'thread_id': self.thread_id,
             'from': self.from_address,
             'to': self.to_address,
             'subject': self.subject or '',
             'received_date': self.received_date,
-            'is_read': self.is_read
+            'is_read': self.is_read,
+            'labels': self.label_ids
+        }
+    
+    @classmethod
+    def processing_columns(cls) -> tuple:
+        """Columns needed to build a rule-processing dict without loading ORM instances"""
+        return (cls.id, cls.provider_id, cls.thread_id, cls.from_address, cls.to_address,
+                cls.subject, cls.received_date, cls.is_read, cls.labels)
+    
+    @staticmethod
+    def row_to_dict(row) -> dict:
+        """Convert a processing_columns() row into the same dict as to_dict()"""
+        return {
+            'id': row.provider_id,
+            'thread_id': row.thread_id,
+            'from': row.from_address,
+            'to': row.to_address,
+            'subject': row.subject or '',
+            'received_date': row.received_date,
+            'is_read': row.is_read,
+            'labels': decode_labels(row.labels)
         }
+    
+    @property
+    def label_ids(self) -> Optional[list]:
+        """Get labels as a list of label ids, or None when they are unknown"""
+        return decode_labels(self.labels)
+    
     @property
     def provider_type_enum(self) -> EmailProviderType:
         """Get provider type as enum"""
@@ -43,4 +95,15 @@ class Email(Base):
     
     
     def __repr__(self):
-        return f"<Email(id={self.id}, from={self.from_address}, subject={self.subject[:30]})>"
\ No newline at end of file
+        return f"<Email(id={self.id}, from={self.from_address}, subject={self.subject[:30]})>"
+
+
+class EmailLabel(Base):
+    """Association between an email and one of its labels, indexed by label"""
+    __tablename__ = 'email_labels'
+    
+    email_id = Column(Integer, ForeignKey('email_info.id', ondelete='CASCADE'), primary_key=True)
+    label_id = Column(String(255), primary_key=True, index=True)
+    
+    def __repr__(self):
+        return f"<EmailLabel(email_id={self.email_id}, label_id={self.label_id})>"
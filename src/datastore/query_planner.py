@@ -0,0 +1,162 @@
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timedelta
+from sqlalchemy import and_, false, func, or_, true
+from sqlalchemy.sql.elements import ColumnElement
+from .email_info import Email
+from .text_index import TextIndex
+from rules.context import EvaluationContext
+from rules.conditions.string_conditions import (
+    ContainsCondition,
+    DoesNotContainCondition,
+    EqualsCondition,
+    DoesNotEqualCondition
+)
+from rules.conditions.date_conditions import DateCondition
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Rule fields stored as text columns, keyed by their name in the email dict,
+# with the text Python sees for NULL: str(None) except where row_to_dict substitutes ''
+TEXT_COLUMNS = {
+    'from': (Email.from_address, 'None'),
+    'to': (Email.to_address, 'None'),
+    'subject': (Email.subject, ''),
+    'thread_id': (Email.thread_id, 'None'),
+    'id': (Email.provider_id, 'None'),
+}
+
+DATE_COLUMNS = {
+    'received_date': Email.received_date,
+}
+
+BOOLEAN_COLUMNS = {
+    'is_read': Email.is_read,
+}
+
+# Every character str.strip() removes, so SQL trim() strips exactly what EqualsCondition does
+WHITESPACE = (
+    '\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0\u1680\u2000\u2001\u2002\u2003\u2004\u2005'
+    '\u2006\u2007\u2008\u2009\u200a\u2028\u2029\u202f\u205f\u3000'
+)
+
+
+class QueryPlan:
+    """
+    A rule split into a SQL filter selecting candidate rows and the
+    residual conditions that still have to be checked in Python
+    """
+    
+    def __init__(self, rule: Any, filter: Optional[ColumnElement], residual: List[Any],
+                 match_all: bool, now: datetime):
+        self.rule = rule
+        self.filter = filter
+        self.residual = residual
+        self.match_all = match_all
+        self._predicates = [condition.compile(now) for condition in residual]
+    
+    @property
+    def fully_pushed(self) -> bool:
+        """Whether the SQL filter alone decides the rule"""
+        return not self.residual
+    
+    def matches_residual(self, email: Dict[str, Any]) -> bool:
+        """Check a candidate row against the conditions SQL could not evaluate"""
+        if not self._predicates:
+            return True
+        context = EvaluationContext(email)
+        combine = all if self.match_all else any
+        return combine(predicate(context) for predicate in self._predicates)
+
+
+class QueryPlanner:
+    """Translates rule conditions into SQLAlchemy filters on email_info"""
+    
+    def __init__(self, now: Optional[datetime] = None, text_index: Optional[TextIndex] = None):
+        self.now = now or datetime.now()
+        self.text_index = text_index
+    
+    def plan(self, rule: Any) -> QueryPlan:
+        """
+        Push down as much of a rule as SQL can evaluate exactly.
+        ALL rules push every translatable condition and keep the rest as residual;
+        ANY rules are pushed only when every condition translates.
+        """
+        match_all = rule.predicate.value == 'all'
+        if not rule.conditions:
+            return QueryPlan(rule, false(), [], match_all, self.now)
+        
+        filters, residual = [], []
+        for condition in rule.conditions:
+            expression = self.condition_filter(condition)
+            if expression is None:
+                residual.append(condition)
+            else:
+                filters.append(expression)
+        
+        if match_all:
+            return QueryPlan(rule, and_(*filters) if filters else None, residual, True, self.now)
+        if residual:
+            # One unpushable alternative can match any row, so nothing narrows the scan
+            return QueryPlan(rule, None, list(rule.conditions), False, self.now)
+        return QueryPlan(rule, or_(*filters), [], False, self.now)
+    
+    def condition_filter(self, condition: Any) -> Optional[ColumnElement]:
+        """SQL expression equivalent to a condition, or None if it has no exact translation"""
+        kind = type(condition)
+        if kind in (ContainsCondition, DoesNotContainCondition):
+            return self._contains_filter(condition, negate=kind is DoesNotContainCondition)
+        if kind in (EqualsCondition, DoesNotEqualCondition):
+            return self._equals_filter(condition, negate=kind is DoesNotEqualCondition)
+        if isinstance(condition, DateCondition):
+            return self._date_filter(condition)
+        return None
+    
+    def _text_value(self, field: str, search_value: str) -> Optional[ColumnElement]:
+        """Lowercased text column for a field, or None if it cannot be compared exactly"""
+        # SQL lower() only folds ASCII on some backends, so other values stay in Python
+        if field not in TEXT_COLUMNS or not search_value.isascii():
+            return None
+        column, null_text = TEXT_COLUMNS[field]
+        return func.lower(func.coalesce(column, null_text))
+    
+    def _contains_filter(self, condition: Any, negate: bool) -> Optional[ColumnElement]:
+        value = self._text_value(condition.field, condition.search_value)
+        if value is None:
+            return None
+        expression = value.contains(condition.search_value, autoescape=True)
+        if negate:
+            return ~expression
+        if self.text_index is None:
+            return expression
+        # The full-text index narrows the rows; the exact comparison still decides
+        candidates = self.text_index.candidate_filter(condition.field, condition.search_value)
+        return expression if candidates is None else and_(candidates, expression)
+    
+    def _equals_filter(self, condition: Any, negate: bool) -> Optional[ColumnElement]:
+        search_value = condition.search_value
+        if condition.field in BOOLEAN_COLUMNS:
+            # str(True).lower() == 'true'; any other value can never match
+            column = BOOLEAN_COLUMNS[condition.field]
+            values = {'true': True, 'false': False, 'none': None}
+            if search_value not in values:
+                return true() if negate else false()
+            value = values[search_value]
+            return column.is_not(value) if negate else column.is_(value)
+        
+        value = self._text_value(condition.field, search_value)
+        if value is None:
+            return None
+        expression = func.trim(value, WHITESPACE) == search_value
+        return ~expression if negate else expression
+    
+    def _date_filter(self, condition: DateCondition) -> Optional[ColumnElement]:
+        column = DATE_COLUMNS.get(condition.field)
+        if column is None:
+            return None
+        try:
+            cutoff = self.now - timedelta(days=condition.days)
+        except Exception as e:
+            logger.error(f"Error evaluating {type(condition).__name__}: {str(e)}")
+            return false()
+        return column > cutoff if condition.after_cutoff else column < cutoff
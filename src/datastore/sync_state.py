@@ -0,0 +1,36 @@
+from sqlalchemy import Column, Integer, String, DateTime, UniqueConstraint
+from sqlalchemy.ext.declarative import declarative_base
+from datetime import datetime
+from enums.email_enums import EmailProviderType
+
+Base = declarative_base()
+
+class SyncState(Base):
+    """Mailbox sync cursor persisted between fetch runs"""
+    __tablename__ = 'sync_state'
+    __table_args__ = (UniqueConstraint('provider_type', 'account'),)
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    provider_type = Column(Integer, nullable=False, default=EmailProviderType.GMAIL.value)
+    account = Column(String(255), nullable=False)
+    history_id = Column(String(64), nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<SyncState(account={self.account}, history_id={self.history_id})>"
+
+
+class LabelCache(Base):
+    """Provider label list kept between runs so label lookups can skip the API"""
+    __tablename__ = 'label_cache'
+    __table_args__ = (UniqueConstraint('provider_type', 'account', 'label_id'),)
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    provider_type = Column(Integer, nullable=False, default=EmailProviderType.GMAIL.value)
+    account = Column(String(255), nullable=False)
+    label_id = Column(String(255), nullable=False)
+    name = Column(String(255), nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f"<LabelCache(name={self.name}, label_id={self.label_id})>"
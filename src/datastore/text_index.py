@@ -0,0 +1,198 @@
+from abc import ABC, abstractmethod
+from typing import Iterable, Optional, Tuple
+from sqlalchemy import column, delete, insert, literal_column, select, table, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+from sqlalchemy.sql.elements import ColumnElement
+from .email_info import Email
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Trigram indexes can only answer substrings of at least three characters
+MIN_NEEDLE_LENGTH = 3
+
+# Indexed rule fields and their email_info columns
+INDEXED_FIELDS = {
+    'subject': 'subject',
+    'from': 'from_address',
+}
+
+
+class TextIndex(ABC):
+    """Full-text index over the subject and sender of stored emails"""
+    
+    def __init__(self, engine: Engine):
+        self.engine = engine
+    
+    @abstractmethod
+    def create(self) -> bool:
+        """Create the index if needed; False if the database cannot support it"""
+        pass
+    
+    def add(self, session: Session, rows: Iterable[Tuple[int, Optional[str], str]]):
+        """Index newly inserted (row id, subject, from_address) rows"""
+        pass
+    
+    def remove(self, session: Session, row_ids):
+        """Drop rows from the index; row_ids may be a list or a select of ids"""
+        pass
+    
+    @abstractmethod
+    def candidate_filter(self, field: str, needle: str) -> Optional[ColumnElement]:
+        """
+        Filter on email_info selecting rows whose field contains the lowercase
+        ASCII needle, or None if the index cannot answer this lookup
+        """
+        pass
+    
+    def can_search(self, field: str, needle: str) -> bool:
+        """Whether a needle is long enough and plain enough for the index"""
+        return field in INDEXED_FIELDS and len(needle) >= MIN_NEEDLE_LENGTH and needle.isascii()
+
+
+class SqliteTextIndex(TextIndex):
+    """FTS5 table with the trigram tokenizer, keyed by email_info.id"""
+    
+    TABLE = 'email_fts'
+    STATE_TABLE = 'email_fts_state'
+    
+    def __init__(self, engine: Engine):
+        super().__init__(engine)
+        self.fts = table(self.TABLE, column('rowid'), column('subject'), column('from_address'))
+    
+    def create(self) -> bool:
+        with self.engine.begin() as conn:
+            if not self._table_exists(conn, self.TABLE):
+                try:
+                    conn.execute(text(
+                        f"CREATE VIRTUAL TABLE {self.TABLE} USING fts5(subject, from_address, tokenize='trigram')"
+                    ))
+                except Exception as e:
+                    logger.warning(f"Full-text index unavailable: {str(e)}")
+                    return False
+                logger.info(f"Created full-text index {self.TABLE}")
+            # Sync only a new index, or one that missed writes made while it was turned off
+            if self._create_change_counter(conn) or self._unindexed_changes(conn):
+                self._sync(conn)
+        return True
+    
+    @staticmethod
+    def _table_exists(conn, name: str) -> bool:
+        """Whether the database has a table with this name"""
+        return conn.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': name}
+        ).first() is not None
+    
+    def _create_change_counter(self, conn) -> bool:
+        """
+        Count email_info writes with triggers, so writes made by repositories with the
+        index turned off are noticed; False if the counter already exists
+        """
+        if self._table_exists(conn, self.STATE_TABLE):
+            return False
+        conn.execute(text(
+            f"CREATE TABLE {self.STATE_TABLE} (id INTEGER PRIMARY KEY CHECK (id = 1), changes INTEGER NOT NULL)"
+        ))
+        conn.execute(text(f"INSERT INTO {self.STATE_TABLE} (id, changes) VALUES (1, 0)"))
+        for name, event in (('insert', 'INSERT'), ('delete', 'DELETE'), ('update', 'UPDATE OF subject, from_address')):
+            conn.execute(text(
+                f"CREATE TRIGGER {self.TABLE}_count_{name} AFTER {event} ON email_info "
+                f"BEGIN UPDATE {self.STATE_TABLE} SET changes = changes + 1; END"
+            ))
+        return True
+    
+    def _unindexed_changes(self, conn) -> int:
+        """Email writes the index has not applied; add() and remove() subtract theirs"""
+        return conn.execute(text(f"SELECT changes FROM {self.STATE_TABLE}")).scalar()
+    
+    def _count_indexed(self, session: Session, count: int):
+        """Take writes applied to the index off the change counter"""
+        if count:
+            session.execute(text(f"UPDATE {self.STATE_TABLE} SET changes = changes - :count"), {'count': count})
+    
+    def _sync(self, conn):
+        """Drop index rows that no longer match email_info, then index the rows missing from it"""
+        # Row ids of deleted emails can be reused, so stale entries are found by content too
+        stale = conn.execute(text(
+            f"DELETE FROM {self.TABLE} WHERE rowid NOT IN ("
+            f"SELECT e.id FROM email_info e JOIN {self.TABLE} f ON f.rowid = e.id "
+            f"AND f.subject = COALESCE(e.subject, '') AND f.from_address = e.from_address)"
+        )).rowcount
+        missing = conn.execute(text(
+            f"INSERT INTO {self.TABLE} (rowid, subject, from_address) "
+            f"SELECT id, COALESCE(subject, ''), from_address FROM email_info "
+            f"WHERE id NOT IN (SELECT rowid FROM {self.TABLE})"
+        )).rowcount
+        conn.execute(text(f"UPDATE {self.STATE_TABLE} SET changes = 0"))
+        if stale or missing:
+            logger.info(f"Full-text index {self.TABLE}: dropped {stale} stale rows, indexed {missing} missing rows")
+    
+    def add(self, session: Session, rows: Iterable[Tuple[int, Optional[str], str]]):
+        entries = [
+            {'rowid': row_id, 'subject': subject or '', 'from_address': from_address}
+            for row_id, subject, from_address in rows
+        ]
+        if entries:
+            session.execute(insert(self.fts), entries)
+            self._count_indexed(session, len(entries))
+    
+    def remove(self, session: Session, row_ids):
+        removed = session.execute(delete(self.fts).where(self.fts.c.rowid.in_(row_ids))).rowcount
+        self._count_indexed(session, removed)
+    
+    def candidate_filter(self, field: str, needle: str) -> Optional[ColumnElement]:
+        if not self.can_search(field, needle):
+            return None
+        # A quoted trigram phrase matches the needle as a case-insensitive substring
+        phrase = needle.replace('"', '""')
+        query = f'{{{INDEXED_FIELDS[field]}}} : "{phrase}"'
+        matches = select(self.fts.c.rowid).where(literal_column(self.TABLE).op('MATCH')(query))
+        return Email.id.in_(matches)
+
+
+class PostgresTextIndex(TextIndex):
+    """
+    pg_trgm GIN indexes on the same lowercased expressions the query planner
+    compares, so its LIKE filters use them directly and no extra table is kept
+    """
+    
+    EXPRESSIONS = {
+        'subject': "lower(coalesce(subject, ''))",
+        'from_address': "lower(coalesce(from_address, 'None'))",
+    }
+    
+    def create(self) -> bool:
+        try:
+            with self.engine.begin() as conn:
+                conn.execute(text("CREATE EXTENSION IF NOT EXISTS pg_trgm"))
+                for name, expression in self.EXPRESSIONS.items():
+                    conn.execute(text(
+                        f"CREATE INDEX IF NOT EXISTS ix_email_info_{name}_trgm "
+                        f"ON email_info USING gin (({expression}) gin_trgm_ops)"
+                    ))
+        except Exception as e:
+            logger.warning(f"Full-text index unavailable: {str(e)}")
+            return False
+        return True
+    
+    def candidate_filter(self, field: str, needle: str) -> Optional[ColumnElement]:
+        if not self.can_search(field, needle):
+            return None
+        expression = literal_column(self.EXPRESSIONS[INDEXED_FIELDS[field]])
+        return expression.contains(needle, autoescape=True)
+
+
+def create_text_index(engine: Engine) -> Optional[TextIndex]:
+    """Create the full-text index for the engine's database, or None if unsupported"""
+    index_classes = {
+        'sqlite': SqliteTextIndex,
+        'postgresql': PostgresTextIndex,
+    }
+    index_class = index_classes.get(engine.dialect.name)
+    if index_class is None:
+        logger.warning(f"Full-text index not supported on {engine.dialect.name}")
+        return None
+    
+    index = index_class(engine)
+    return index if index.create() else None
@@ -4,15 +4,77 @@ from pathlib import Path
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent))
 
+from typing import Tuple
 from provider.factory import EmailProviderFactory
+from provider.email_provider import EmailProvider, SyncCursorExpiredError
 from datastore.email_datastore import EmailRepository
-from config.settings import EMAIL_PROVIDER, FETCH_LIMIT
+from rules.parser import RuleParser
+from config.settings import EMAIL_PROVIDER, FETCH_LIMIT, SYNC_MODE, FETCH_FORMAT, RULES_FILE, ASYNC_PROVIDER
 from utils.logger import setup_logger
 
 
 logger = setup_logger(__name__)
 logger = setup_logger(__name__)
 
+def configure_fetch_format(provider: EmailProvider):
+    """Let the provider download only the message parts the loaded rules reference"""
+    if FETCH_FORMAT != 'auto':
+        return
+    try:
+        rules = RuleParser().parse_file(str(RULES_FILE))
+    except Exception as e:
+        logger.warning(f"Could not load rules to pick a fetch format: {str(e)}")
+        return
+    
+    fields = set()
+    for rule in rules:
+        fields |= rule.fields
+    fetch_format = provider.configure_fetch(fields)
+    logger.info(f"Using '{fetch_format}' message format for fields {sorted(fields)}")
+
+def full_sync(provider: EmailProvider, repo: EmailRepository) -> Tuple[int, int]:
+    """Fetch the newest FETCH_LIMIT emails, saving each chunk as it arrives"""
+    # Read the cursor before listing so changes made during the crawl are picked up next run
+    cursor = provider.get_sync_cursor()
+    
+    logger.info(f"Fetching up to {FETCH_LIMIT or 'all'} emails from INBOX...")
+    total_fetched = 0
+    new_count = 0
+    for emails in provider.iter_emails(folder="None", limit=FETCH_LIMIT):
+        logger.info(f"Saving {len(emails)} emails to database...")
+        new_count += repo.save_emails(emails, provider_type=EMAIL_PROVIDER)
+        total_fetched += len(emails)
+    
+    if cursor:
+        repo.save_sync_cursor(cursor, provider_type=EMAIL_PROVIDER)
+    return total_fetched, new_count
+
+def incremental_sync(provider: EmailProvider, repo: EmailRepository, cursor: str) -> Tuple[int, int]:
+    """Apply mailbox changes since the stored cursor"""
+    logger.info(f"Fetching changes since history {cursor}...")
+    changes = provider.fetch_changes(cursor)
+    
+    emails = changes['emails']
+    new_count = repo.save_emails(emails, provider_type=EMAIL_PROVIDER) if emails else 0
+    repo.delete_emails(changes['deleted_ids'])
+    failed_ids = changes.get('failed_ids')
+    if failed_ids:
+        # Keep the old cursor so the next run fetches the missed changes again
+        logger.warning(f"Could not fetch {len(failed_ids)} changed emails, keeping sync cursor {cursor}")
+    else:
+        repo.save_sync_cursor(changes['cursor'], provider_type=EMAIL_PROVIDER)
+    return len(emails), new_count
+
+def sync_mailbox(provider: EmailProvider, repo: EmailRepository) -> Tuple[int, int]:
+    """Sync incrementally when a cursor is stored, otherwise (or once it expires) fully"""
+    cursor = repo.get_sync_cursor(EMAIL_PROVIDER) if SYNC_MODE == 'incremental' else None
+    if cursor:
+        try:
+            return incremental_sync(provider, repo, cursor)
+        except SyncCursorExpiredError as e:
+            logger.warning(f"{str(e)}, falling back to full sync")
+    return full_sync(provider, repo)
+
 def main():
     """Main function to fetch and store emails"""
     try:
@@ -22,30 +84,28 @@ def main():
         
         # Create email provider
         logger.info(f"Creating {EMAIL_PROVIDER} provider...")
-        provider = EmailProviderFactory.create(EMAIL_PROVIDER)
+        provider = EmailProviderFactory.create(EMAIL_PROVIDER, use_async=ASYNC_PROVIDER)
         
-        # Authenticate
-        logger.info("Authenticating with Gmail API...")
-        provider.authenticate()
+        try:
+            # Authenticate
+            logger.info("Authenticating with Gmail API...")
+            provider.authenticate()
+            
+            configure_fetch_format(provider)
+            repo = EmailRepository()
+            total_fetched, new_count = sync_mailbox(provider, repo)
+        finally:
+            provider.close()
         
-        # Fetch emails
-        logger.info(f"Fetching up to {FETCH_LIMIT} emails from INBOX...")
-        emails = provider.fetch_emails(folder="None", limit=FETCH_LIMIT)
-        
-        if not emails:
-            logger.info("No emails found.")
+        if not total_fetched:
+            logger.info("No new or changed emails found.")
             return
         
-        # Save to database
-        logger.info("Saving emails to database...")
-        repo = EmailRepository()
-        new_count = repo.save_emails(emails, provider_type=EMAIL_PROVIDER)
-        
         logger.info("=" * 70)
         logger.info("✓ SUCCESS")
-        logger.info(f"  Total emails fetched: {len(emails)}")
+        logger.info(f"  Total emails fetched: {total_fetched}")
         logger.info(f"  New emails saved: {new_count}")
-        logger.info(f"  Updated emails: {len(emails) - new_count}")
+        logger.info(f"  Updated emails: {total_fetched - new_count}")
         logger.info("=" * 70)
         
     except Exception as e:
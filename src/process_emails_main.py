@@ -5,21 +5,72 @@ Usage:
     python -m src.process_emails
 """
 
+import itertools
 import sys
+from datetime import datetime
 from pathlib import Path
+from typing import List
 
 # Add src to path
 sys.path.insert(0, str(Path(__file__).parent))
 
 from provider.factory import EmailProviderFactory
+from provider.email_provider import EmailProvider
 from datastore.email_datastore import EmailRepository
 from rules.parser import RuleParser
 from rules.engine import RulesEngine
-from config.settings import EMAIL_PROVIDER, RULES_FILE
+from rules.parallel import ParallelRulesEngine, batch_size_for_workers
+from rules.executor import ActionExecutor
+from utils.rate_limit import TokenBucket
+from config.settings import (
+    EMAIL_PROVIDER, RULES_FILE, PROCESS_BATCH_SIZE,
+    RULE_WORKERS, ACTION_WORKERS, ACTION_QUOTA_PER_SECOND, COALESCE_ACTIONS, PERSIST_LABEL_CACHE,
+    ASYNC_PROVIDER, RULE_PUSHDOWN
+)
 from utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+def build_rules_engine(rules: list, workers: int = RULE_WORKERS,
+                       action_workers: int = ACTION_WORKERS) -> RulesEngine:
+    """
+    Create the rules engine, matching in worker processes when more than one is configured
+    and running actions on a rate-limited thread pool
+    """
+    action_executor = ActionExecutor(action_workers, TokenBucket(ACTION_QUOTA_PER_SECOND), COALESCE_ACTIONS)
+    if workers > 1:
+        return ParallelRulesEngine(rules, workers=workers, action_executor=action_executor)
+    return RulesEngine(rules, action_executor=action_executor)
+
+def process_batch(engine: RulesEngine, provider: EmailProvider, repo: EmailRepository,
+                  emails: List[dict], rules_version: str, run_started: datetime) -> List[dict]:
+    """Evaluate one batch of emails, log matched rules and advance the processing watermark"""
+    results = engine.process_emails(provider, emails)
+    
+    # Log results to database in one write per batch
+    repo.log_rule_executions_bulk([
+        {
+            'email_id': email['id'],
+            'rule_name': rule_name,
+            'matched': True,
+            'actions': result['actions_executed']
+        }
+        for email, result in zip(emails, results)
+        for rule_name in result['rules_matched']
+    ])
+    
+    # Emails with failed actions stay pending so the next run retries them
+    # Same clock the date conditions were evaluated against, so no threshold falls between the two
+    now = engine.now
+    evaluated = [email for email, result in zip(emails, results) if not result['actions_failed']]
+    repo.mark_processed(
+        [email['id'] for email in evaluated],
+        rules_version,
+        processed_at=run_started,
+        next_evaluation_at={email['id']: engine.next_evaluation_at(email, now) for email in evaluated}
+    )
+    return results
+
 def main():
     """Main function to process emails with rules"""
     try:
@@ -36,56 +87,63 @@ def main():
             logger.error("No rules found.")
             return
         
-        # Get emails from database
+        # Stream emails from database in batches
         logger.info("Loading emails from database...")
         repo = EmailRepository()
-        emails = repo.get_emails_for_processing()
+        run_started = datetime.utcnow()
+        batches = repo.iter_emails_for_processing(
+            batch_size=batch_size_for_workers(PROCESS_BATCH_SIZE, RULE_WORKERS),
+            rules_version=parser.rules_version,
+            rules=rules if RULE_PUSHDOWN else None
+        )
+        first_batch = next(batches, None)
         
-        if not emails:
-            logger.info("No emails found in database.")
-            logger.info("Run 'python -m src.fetch_emails' first to fetch emails.")
+        if not first_batch:
+            logger.info("No new or changed emails to process.")
+            logger.info("Run 'python -m src.fetch_emails' first to fetch new emails.")
             return
         
-        logger.info(f"Found {len(emails)} emails to process")
-        
         # Authenticate with provider
         logger.info(f"Authenticating with {EMAIL_PROVIDER}...")
-        provider = EmailProviderFactory.create(EMAIL_PROVIDER)
-        provider.authenticate()
+        provider = EmailProviderFactory.create(EMAIL_PROVIDER, use_async=ASYNC_PROVIDER)
+        engine = None
+        total_processed = 0
+        matched_count = 0
+        total_actions = 0
+        failed_actions = 0
         
-        # Process emails
-        logger.info("\nProcessing emails with rules...")
-        logger.info("-" * 70)
-        
-        email_dicts = [email.to_dict() for email in emails]
-
-          # Create rules engine
-        engine = RulesEngine(rules)
-        results = engine.process_emails(provider, email_dicts)
-        
-        # Log results to database
-        logger.info("\nLogging results to database...")
-        for email, result in zip(emails, results):
-            for rule_name in result['rules_matched']:
-                repo.log_rule_execution(
-                    email_id=email.provider_id,
-                    rule_name=rule_name,
-                    matched=True,
-                    actions=result['actions_executed']
-                )
+        try:
+            provider.authenticate()
+            if PERSIST_LABEL_CACHE:
+                provider.use_label_store(repo)
+            
+            # Process emails
+            logger.info("\nProcessing emails with rules...")
+            logger.info("-" * 70)
+            
+            # Create rules engine
+            engine = build_rules_engine(rules)
+            
+            # Create missing destination labels up front; fails the run if one cannot be created
+            engine.prepare(provider)
+            for emails in itertools.chain([first_batch], batches):
+                results = process_batch(engine, provider, repo, emails, parser.rules_version, run_started)
+                
+                total_processed += len(results)
+                matched_count += sum(1 for r in results if r['rules_matched'])
+                total_actions += sum(len(r['actions_executed']) for r in results)
+                failed_actions += sum(len(r['actions_failed']) for r in results)
+        finally:
+            if engine is not None:
+                engine.close()
+            provider.close()
         
         # Summary
         logger.info("=" * 70)
         logger.info("✓ PROCESSING COMPLETE")
-        logger.info(f"  Total emails processed: {len(results)}")
-        
-        matched_count = sum(1 for r in results if r['rules_matched'])
+        logger.info(f"  Total emails processed: {total_processed}")
         logger.info(f"  Emails matching rules: {matched_count}")
-        
-        total_actions = sum(len(r['actions_executed']) for r in results)
         logger.info(f"  Total actions executed: {total_actions}")
-        
-        failed_actions = sum(len(r['actions_failed']) for r in results)
         if failed_actions > 0:
             logger.info(f"  Failed actions: {failed_actions}")
         
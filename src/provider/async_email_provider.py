@@ -0,0 +1,178 @@
+import asyncio
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, AsyncIterator, Awaitable, Dict, FrozenSet, Iterable, Iterator, List, Optional
+from .email_provider import EmailProvider
+
+
+class AsyncEmailProvider(ABC):
+    """
+    Asyncio counterpart of EmailProvider: every call that talks to the provider
+    is a coroutine, so many requests can be in flight on one thread
+    """
+
+    # Labels that are states rather than folders, so moving an email keeps them
+    system_labels: FrozenSet[str] = frozenset()
+
+    @abstractmethod
+    async def authenticate(self) -> bool:
+        """Authenticate with the email service"""
+        pass
+
+    async def fetch_emails(self, folder: str = "INBOX", limit: int = 100) -> List[Dict[str, Any]]:
+        """Fetch emails from specified folder"""
+        emails = []
+        async for chunk in self.iter_emails(folder=folder, limit=limit):
+            emails.extend(chunk)
+        return emails
+
+    def configure_fetch(self, fields: Iterable[str]) -> str:
+        """Choose how much of each message to download for the given email fields"""
+        return 'full'
+
+    @abstractmethod
+    def iter_emails(self, folder: str = "INBOX", limit: Optional[int] = None) -> AsyncIterator[List[Dict[str, Any]]]:
+        """Yield fetched emails in chunks"""
+        pass
+
+    async def get_sync_cursor(self) -> Optional[str]:
+        """Get the provider's current mailbox change cursor; None if unsupported"""
+        return None
+
+    async def fetch_changes(self, cursor: str) -> Dict[str, Any]:
+        """
+        Fetch changes since the cursor as {'cursor', 'emails', 'deleted_ids', 'failed_ids'};
+        raises SyncCursorExpiredError when the cursor can no longer be used
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support incremental sync")
+
+    @abstractmethod
+    async def mark_as_read(self, email_id: str) -> bool:
+        """Mark email as read"""
+        pass
+
+    @abstractmethod
+    async def mark_as_unread(self, email_id: str) -> bool:
+        """Mark email as unread"""
+        pass
+
+    @abstractmethod
+    async def move_email(self, email_id: str, destination: str,
+                         current_labels: Optional[List[str]] = None) -> bool:
+        """Move email to destination folder; current_labels avoids a lookup when known"""
+        pass
+
+    async def modify_labels(self, email_id: str, add_labels: Iterable[str] = (),
+                            remove_labels: Iterable[str] = ()) -> bool:
+        """Add and remove label ids on an email in one change"""
+        raise NotImplementedError(f"{type(self).__name__} does not support label changes")
+
+    async def bulk_modify(self, email_ids: List[str], add_labels: Iterable[str] = (),
+                          remove_labels: Iterable[str] = ()) -> List[str]:
+        """Apply the same label change to many emails concurrently; returns the ids that were changed"""
+        add_labels, remove_labels = list(add_labels), list(remove_labels)
+        results = await asyncio.gather(*(
+            self.modify_labels(email_id, add_labels, remove_labels) for email_id in email_ids
+        ))
+        return [email_id for email_id, changed in zip(email_ids, results) if changed]
+
+    async def get_label_id(self, label_name: str) -> Optional[str]:
+        """Id of the label with this name; None if there is no such label"""
+        return None
+
+    async def ensure_labels(self, label_names: Iterable[str]) -> Dict[str, str]:
+        """
+        Resolve label names to ids, creating the missing ones;
+        raises LabelUnavailableError naming every label that could not be created.
+        Providers without labels resolve nothing and leave moves to move_email.
+        """
+        return {}
+
+    def use_label_store(self, store: Any):
+        """Keep the provider's label cache in the datastore between runs; no-op if it has none"""
+        pass
+
+    async def aclose(self):
+        """Release the provider's connections"""
+        pass
+
+
+class SyncProviderAdapter(EmailProvider):
+    """
+    Blocking EmailProvider over an AsyncEmailProvider, for the fetch and process scripts.
+    Coroutines run on one event loop in a background thread, so calls from several
+    action worker threads share the async provider's connection pool.
+    """
+
+    def __init__(self, provider: AsyncEmailProvider):
+        self.provider = provider
+        self.system_labels = provider.system_labels
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name='provider-loop', daemon=True)
+        self._thread.start()
+
+    def _run(self, coroutine: Awaitable) -> Any:
+        """Run a coroutine on the provider loop and wait for its result"""
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def authenticate(self) -> bool:
+        return self._run(self.provider.authenticate())
+
+    def fetch_emails(self, folder: str = "INBOX", limit: int = 100) -> List[Dict[str, Any]]:
+        return self._run(self.provider.fetch_emails(folder=folder, limit=limit))
+
+    def configure_fetch(self, fields: Iterable[str]) -> str:
+        return self.provider.configure_fetch(fields)
+
+    def iter_emails(self, folder: str = "INBOX", limit: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+        chunks = self.provider.iter_emails(folder=folder, limit=limit)
+        try:
+            while True:
+                try:
+                    yield self._run(chunks.__anext__())
+                except StopAsyncIteration:
+                    return
+        finally:
+            self._run(chunks.aclose())
+
+    def get_sync_cursor(self) -> Optional[str]:
+        return self._run(self.provider.get_sync_cursor())
+
+    def fetch_changes(self, cursor: str) -> Dict[str, Any]:
+        return self._run(self.provider.fetch_changes(cursor))
+
+    def mark_as_read(self, email_id: str) -> bool:
+        return self._run(self.provider.mark_as_read(email_id))
+
+    def mark_as_unread(self, email_id: str) -> bool:
+        return self._run(self.provider.mark_as_unread(email_id))
+
+    def move_email(self, email_id: str, destination: str,
+                   current_labels: Optional[List[str]] = None) -> bool:
+        return self._run(self.provider.move_email(email_id, destination, current_labels))
+
+    def modify_labels(self, email_id: str, add_labels: Iterable[str] = (),
+                      remove_labels: Iterable[str] = ()) -> bool:
+        return self._run(self.provider.modify_labels(email_id, add_labels, remove_labels))
+
+    def bulk_modify(self, email_ids: List[str], add_labels: Iterable[str] = (),
+                    remove_labels: Iterable[str] = ()) -> List[str]:
+        return self._run(self.provider.bulk_modify(email_ids, add_labels, remove_labels))
+
+    def _get_label_id(self, label_name: str) -> Optional[str]:
+        return self._run(self.provider.get_label_id(label_name))
+
+    def ensure_labels(self, label_names: Iterable[str]) -> Dict[str, str]:
+        return self._run(self.provider.ensure_labels(label_names))
+
+    def use_label_store(self, store: Any):
+        self.provider.use_label_store(store)
+
+    def close(self):
+        """Close the async provider and stop its event loop"""
+        if self._loop.is_closed():
+            return
+        self._run(self.provider.aclose())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
@@ -0,0 +1,361 @@
+import asyncio
+from typing import Any, AsyncIterator, Dict, Iterable, List, Optional
+
+import httpx
+from google.auth.transport.requests import Request
+
+from .async_email_provider import AsyncEmailProvider
+from .email_provider import SyncCursorExpiredError, LabelUnavailableError
+from .gmail_provider import (
+    HISTORY_TYPES, METADATA_FIELDS, METADATA_HEADERS, METADATA_PARTIAL_RESPONSE, SYSTEM_LABELS,
+    BATCH_MODIFY_LIMIT, load_credentials, parse_message, move_label_changes
+)
+from .label_registry import LabelRegistry
+from .request_executor import AsyncAimdLimiter, AsyncRequestExecutor
+from config.settings import FETCH_PAGE_SIZE, FETCH_FORMAT, LABEL_CACHE_TTL, ASYNC_MAX_IN_FLIGHT, HTTP_TIMEOUT
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+GMAIL_API_URL = 'https://gmail.googleapis.com/gmail/v1/users/me/'
+
+
+class AsyncGmailProvider(AsyncEmailProvider):
+    """
+    Gmail REST API over a pooled httpx client. Connections are kept alive and
+    reused, and up to max_in_flight requests run concurrently on the event loop,
+    fewer while Gmail is rate limiting. Rate limited and transient errors are retried.
+    """
+
+    system_labels = SYSTEM_LABELS
+
+    def __init__(self, max_in_flight: int = ASYNC_MAX_IN_FLIGHT, timeout: float = HTTP_TIMEOUT,
+                 transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.client: Optional[httpx.AsyncClient] = None
+        self.creds = None
+        self.max_in_flight = max(1, max_in_flight)
+        self.timeout = timeout
+        self.transport = transport
+        self.fetch_format = 'full' if FETCH_FORMAT == 'full' else 'metadata'
+        self.labels = LabelRegistry(None, ttl=LABEL_CACHE_TTL)
+        # Every API call goes through one executor so retries and throttling see all traffic
+        self.requests = AsyncRequestExecutor(limiter=AsyncAimdLimiter(self.max_in_flight))
+        # asyncio primitives bind to the loop that first waits on them
+        self._labels_lock = asyncio.Lock()
+        self._auth_lock = asyncio.Lock()
+
+    async def authenticate(self) -> bool:
+        """Authenticate with OAuth 2.0 and open the connection pool"""
+        try:
+            # The OAuth flow and token refresh are blocking
+            self.creds = await asyncio.to_thread(load_credentials)
+            self.open()
+            logger.info("Successfully authenticated with Gmail API")
+            return True
+        except Exception as e:
+            logger.error(f"Authentication failed: {str(e)}")
+            raise
+
+    def open(self):
+        """Create the pooled HTTP client"""
+        limits = httpx.Limits(max_connections=self.max_in_flight, max_keepalive_connections=self.max_in_flight)
+        self.client = httpx.AsyncClient(
+            base_url=GMAIL_API_URL,
+            limits=limits,
+            timeout=self.timeout,
+            transport=self.transport
+        )
+
+    async def aclose(self):
+        if self.client is not None:
+            await self.client.aclose()
+            self.client = None
+
+    async def _request(self, method: str, path: str, **kwargs) -> Dict[str, Any]:
+        """
+        Send one API request, waiting for a free in-flight slot and retrying rate limited
+        and transient errors; raises httpx.HTTPStatusError on errors
+        """
+        if self.client is None:
+            raise RuntimeError("Not authenticated. Call authenticate() first.")
+
+        async def send() -> Dict[str, Any]:
+            response = await self.client.request(method, path, headers=await self._auth_headers(), **kwargs)
+            response.raise_for_status()
+            return response.json() if response.content else {}
+
+        return await self.requests.call(send, f"{method} {path}")
+
+    async def _auth_headers(self) -> Dict[str, str]:
+        """Authorization header with a valid token, refreshing it if it expired"""
+        if self.creds is None:
+            return {}
+        if not self.creds.valid:
+            async with self._auth_lock:
+                # Only the first request to see the expired token refreshes it
+                if not self.creds.valid:
+                    await asyncio.to_thread(self.creds.refresh, Request())
+        return {'Authorization': f"Bearer {self.creds.token}"}
+
+    def configure_fetch(self, fields: Iterable[str]) -> str:
+        extra_fields = set(fields) - METADATA_FIELDS
+        if extra_fields:
+            logger.info(f"Rules reference {sorted(extra_fields)}, fetching full messages")
+            self.fetch_format = 'full'
+        else:
+            self.fetch_format = 'full' if FETCH_FORMAT == 'full' else 'metadata'
+        return self.fetch_format
+
+    async def iter_emails(self, folder: Optional[str] = "None", limit: Optional[int] = None,
+                          page_size: int = FETCH_PAGE_SIZE) -> AsyncIterator[List[Dict[str, Any]]]:
+        """
+        Yield parsed emails one messages.list page at a time; the messages
+        of a page are fetched concurrently
+        """
+        remaining = limit if limit and limit > 0 else None
+        page_token = None
+
+        logger.info(f"Fetching up to {remaining or 'all'} emails from {folder}...")
+        while True:
+            max_results = page_size if remaining is None else min(page_size, remaining)
+            params = {'maxResults': max_results}
+            if folder and folder != "None":
+                params['labelIds'] = folder
+            if page_token:
+                params['pageToken'] = page_token
+            try:
+                results = await self._request('GET', 'messages', params=params)
+            except httpx.HTTPError as e:
+                logger.error(f"Gmail API error: {str(e)}")
+                raise
+
+            messages = results.get('messages', [])[:max_results]
+            if messages:
+                yield await self._get_messages([msg['id'] for msg in messages])
+
+            if remaining is not None:
+                remaining -= len(messages)
+                if remaining <= 0:
+                    break
+
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+
+    async def _get_message(self, msg_id: str,
+                           failures: Optional[Dict[str, Exception]] = None) -> Optional[Dict[str, Any]]:
+        if self.fetch_format == 'metadata':
+            params = [('format', 'metadata'), ('fields', METADATA_PARTIAL_RESPONSE)]
+            params += [('metadataHeaders', header) for header in METADATA_HEADERS]
+        else:
+            params = [('format', 'full')]
+        try:
+            return parse_message(await self._request('GET', f'messages/{msg_id}', params=params))
+        except httpx.HTTPError as e:
+            logger.error(f"Error fetching email {msg_id}: {str(e)}")
+            if failures is not None:
+                failures[msg_id] = e
+            return None
+
+    async def _get_messages(self, message_ids: List[str],
+                            failures: Optional[Dict[str, Exception]] = None) -> List[Dict[str, Any]]:
+        """
+        Fetch and parse messages concurrently; failed messages are logged and
+        skipped, and recorded in failures when given
+        """
+        emails = await asyncio.gather(*(self._get_message(msg_id, failures) for msg_id in message_ids))
+        logger.info(f"Fetched {len(message_ids)} emails")
+        return [email for email in emails if email is not None]
+
+    async def get_sync_cursor(self) -> Optional[str]:
+        """Get the mailbox's current historyId"""
+        profile = await self._request('GET', 'profile')
+        return profile.get('historyId')
+
+    async def fetch_changes(self, cursor: str) -> Dict[str, Any]:
+        """
+        Fetch messages added, deleted or relabelled since the given historyId.
+        Raises SyncCursorExpiredError when Gmail no longer has that history.
+        """
+        changed_ids = {}
+        deleted_ids = set()
+        history_id = cursor
+        page_token = None
+
+        while True:
+            params = [('startHistoryId', cursor)] + [('historyTypes', kind) for kind in HISTORY_TYPES]
+            if page_token:
+                params.append(('pageToken', page_token))
+            try:
+                results = await self._request('GET', 'history', params=params)
+            except httpx.HTTPStatusError as e:
+                if e.response.status_code == 404:
+                    raise SyncCursorExpiredError(f"History {cursor} is no longer available") from e
+                logger.error(f"Gmail API error: {str(e)}")
+                raise
+
+            for record in results.get('history', []):
+                for key in ('messagesAdded', 'labelsAdded', 'labelsRemoved'):
+                    for item in record.get(key, []):
+                        msg_id = item['message']['id']
+                        deleted_ids.discard(msg_id)
+                        changed_ids[msg_id] = None
+                for item in record.get('messagesDeleted', []):
+                    msg_id = item['message']['id']
+                    changed_ids.pop(msg_id, None)
+                    deleted_ids.add(msg_id)
+
+            history_id = results.get('historyId', history_id)
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+
+        logger.info(f"History since {cursor}: {len(changed_ids)} changed, {len(deleted_ids)} deleted")
+        failures = {}
+        emails = await self._get_messages(list(changed_ids), failures)
+        failed_ids = []
+        for msg_id, error in failures.items():
+            # Deleted since the history was read
+            if isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 404:
+                deleted_ids.add(msg_id)
+            else:
+                failed_ids.append(msg_id)
+        return {
+            'cursor': history_id,
+            'emails': emails,
+            'deleted_ids': sorted(deleted_ids),
+            'failed_ids': failed_ids
+        }
+
+    def _forget_labels_on_error(self, error: httpx.HTTPError):
+        """A rejected change may name a label deleted since the labels were cached"""
+        if isinstance(error, httpx.HTTPStatusError) and error.response.status_code == 400:
+            self.labels.invalidate()
+
+    async def modify_labels(self, email_id: str, add_labels: Iterable[str] = (),
+                            remove_labels: Iterable[str] = ()) -> bool:
+        body = {'addLabelIds': sorted(add_labels), 'removeLabelIds': sorted(remove_labels)}
+        try:
+            await self._request('POST', f'messages/{email_id}/modify', json=body)
+            logger.info(f"Updated labels of email {email_id}")
+            return True
+        except httpx.HTTPError as e:
+            logger.error(f"Error updating labels: {str(e)}")
+            self._forget_labels_on_error(e)
+            return False
+
+    async def bulk_modify(self, email_ids: List[str], add_labels: Iterable[str] = (),
+                          remove_labels: Iterable[str] = ()) -> List[str]:
+        body = {'addLabelIds': sorted(add_labels), 'removeLabelIds': sorted(remove_labels)}
+
+        async def modify_chunk(chunk: List[str]) -> List[str]:
+            try:
+                await self._request('POST', 'messages/batchModify', json={'ids': chunk, **body})
+                return chunk
+            except httpx.HTTPError as e:
+                logger.error(f"Error updating labels of {len(chunk)} emails: {str(e)}")
+                self._forget_labels_on_error(e)
+                return []
+
+        chunks = [list(email_ids[start:start + BATCH_MODIFY_LIMIT])
+                  for start in range(0, len(email_ids), BATCH_MODIFY_LIMIT)]
+        modified = [email_id for chunk in await asyncio.gather(*map(modify_chunk, chunks)) for email_id in chunk]
+        logger.info(f"Updated labels of {len(modified)} emails")
+        return modified
+
+    async def mark_as_read(self, email_id: str) -> bool:
+        return await self.modify_labels(email_id, remove_labels=['UNREAD'])
+
+    async def mark_as_unread(self, email_id: str) -> bool:
+        return await self.modify_labels(email_id, add_labels=['UNREAD'])
+
+    async def move_email(self, email_id: str, destination: str,
+                         current_labels: Optional[List[str]] = None) -> bool:
+        """
+        Move email to destination label safely.
+        Pass the stored current_labels to skip reading them from the API.
+        """
+        label_id = await self.get_label_id(destination)
+        if not label_id:
+            logger.error(f"Label '{destination}' not found")
+            return False
+
+        try:
+            if current_labels is None:
+                message = await self._request('GET', f'messages/{email_id}', params={'format': 'minimal'})
+                current_labels = message.get('labelIds', [])
+        except httpx.HTTPError as e:
+            logger.error(f"Error moving email: {str(e)}")
+            return False
+
+        add_labels, remove_labels = move_label_changes(label_id, current_labels)
+        if not add_labels and not remove_labels:
+            logger.info(f"No label changes needed for email {email_id}")
+            return True
+        return await self.modify_labels(email_id, add_labels, remove_labels)
+
+    async def _label_registry(self) -> Optional[LabelRegistry]:
+        """The label registry, listing labels first if it has none; None if they could not be listed"""
+        # One listing serves every lookup that was waiting for it
+        async with self._labels_lock:
+            if not self.labels.is_loaded():
+                try:
+                    results = await self._request('GET', 'labels')
+                except httpx.HTTPError as e:
+                    logger.error(f"Error fetching labels: {str(e)}")
+                    return None
+                labels = results.get('labels', [])
+                self.labels.load([{'id': label['id'], 'name': label['name']} for label in labels])
+                logger.info(f"Listed {len(labels)} labels")
+        return self.labels
+
+    async def get_label_id(self, label_name: str) -> Optional[str]:
+        if label_name in SYSTEM_LABELS:
+            return label_name
+        registry = await self._label_registry()
+        return registry.get_id(label_name) if registry else None
+
+    async def get_labels(self) -> List[Dict[str, str]]:
+        registry = await self._label_registry()
+        return registry.labels() if registry else []
+
+    async def create_label(self, label_name: str) -> Optional[str]:
+        label_object = {
+            'name': label_name,
+            'labelListVisibility': 'labelShow',
+            'messageListVisibility': 'show'
+        }
+        try:
+            created_label = await self._request('POST', 'labels', json=label_object)
+        except httpx.HTTPError as e:
+            logger.error(f"Error creating label: {str(e)}")
+            return None
+        self.labels.add(created_label['id'], created_label.get('name', label_name))
+        logger.info(f"Created label: {label_name}")
+        return created_label['id']
+
+    async def ensure_labels(self, label_names: Iterable[str]) -> Dict[str, str]:
+        names = {}
+        for name in label_names:
+            names.setdefault(name.lower(), name)
+        system = [name for name in names.values() if name in SYSTEM_LABELS]
+        wanted = [name for name in names.values() if name not in SYSTEM_LABELS]
+
+        registry = await self._label_registry()
+        resolved = registry.resolve(wanted) if registry else None
+        if resolved is None:
+            raise LabelUnavailableError("Could not list labels to check action destinations")
+
+        missing = [name for name in wanted if resolved[name] is None]
+        created = await asyncio.gather(*(self.create_label(name) for name in missing))
+        resolved.update(zip(missing, created))
+        failed = [name for name, label_id in zip(missing, created) if label_id is None]
+        if failed:
+            raise LabelUnavailableError(f"Could not create labels: {', '.join(sorted(failed))}")
+
+        resolved.update((name, name) for name in system)
+        return resolved
+
+    def use_label_store(self, store: Any):
+        """Keep the label cache in the datastore between runs"""
+        self.labels.store = store
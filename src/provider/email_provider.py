@@ -1,9 +1,22 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, Iterable, FrozenSet
+
+class SyncCursorExpiredError(Exception):
+    """Raised when a stored sync cursor is too old for incremental sync"""
+    pass
+
+
+class LabelUnavailableError(Exception):
+    """Raised when labels that actions need can neither be found nor created"""
+    pass
+
 
 class EmailProvider(ABC):
     """Abstract base class for all email providers"""
     
+    # Labels that are states rather than folders, so moving an email keeps them
+    system_labels: FrozenSet[str] = frozenset()
+    
     @abstractmethod
     def authenticate(self) -> bool:
         """Authenticate with the email service"""
@@ -13,6 +26,36 @@ class EmailProvider(ABC):
     def fetch_emails(self, folder: str = "INBOX", limit: int = 100) -> List[Dict[str, Any]]:
         """Fetch emails from specified folder"""
         pass
+
+    def configure_fetch(self, fields: Iterable[str]) -> str:
+        """Choose how much of each message to download for the given email fields"""
+        return 'full'
+
+    def iter_emails(self, folder: str = "INBOX", limit: Optional[int] = None) -> Iterator[List[Dict[str, Any]]]:
+        """Yield fetched emails in chunks; providers without paging yield a single chunk"""
+        emails = self.fetch_emails(folder=folder, limit=limit)
+        if emails:
+            yield emails
+
+    def get_sync_cursor(self) -> Optional[str]:
+        """Get the provider's current mailbox change cursor; None if unsupported"""
+        return None
+
+    def use_label_store(self, store: Any):
+        """Keep the provider's label cache in the datastore between runs; no-op if it has none"""
+        pass
+
+    def close(self):
+        """Release the provider's connections; no-op if it holds none"""
+        pass
+    
+    def fetch_changes(self, cursor: str) -> Dict[str, Any]:
+        """
+        Fetch mailbox changes since cursor as
+        {'cursor': ..., 'emails': [...], 'deleted_ids': [...], 'failed_ids': [...]},
+        where failed_ids are changed messages that could not be fetched
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support incremental sync")
     
     @abstractmethod
     def mark_as_read(self, email_id: str) -> bool:
@@ -25,7 +68,26 @@ class EmailProvider(ABC):
         pass
     
     @abstractmethod
-    def move_email(self, email_id: str, destination: str) -> bool:
-        """Move email to destination folder"""
+    def move_email(self, email_id: str, destination: str,
+                   current_labels: Optional[List[str]] = None) -> bool:
+        """Move email to destination folder; current_labels avoids a lookup when known"""
         pass
-    
\ No newline at end of file
+    
+    def ensure_labels(self, label_names: Iterable[str]) -> Dict[str, str]:
+        """
+        Resolve label names to ids, creating the missing ones;
+        raises LabelUnavailableError naming every label that could not be created.
+        Providers without labels resolve nothing and leave moves to move_email.
+        """
+        return {}
+    
+    def modify_labels(self, email_id: str, add_labels: Iterable[str] = (),
+                      remove_labels: Iterable[str] = ()) -> bool:
+        """Add and remove label ids on an email in one change"""
+        raise NotImplementedError(f"{type(self).__name__} does not support label changes")
+    
+    def bulk_modify(self, email_ids: List[str], add_labels: Iterable[str] = (),
+                    remove_labels: Iterable[str] = ()) -> List[str]:
+        """Apply the same label change to many emails; returns the ids that were changed"""
+        add_labels, remove_labels = list(add_labels), list(remove_labels)
+        return [email_id for email_id in email_ids if self.modify_labels(email_id, add_labels, remove_labels)]
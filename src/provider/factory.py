@@ -1,5 +1,7 @@
 from .email_provider import EmailProvider
 from .gmail_provider import GmailProvider
+from .async_email_provider import AsyncEmailProvider, SyncProviderAdapter
+from .async_gmail_provider import AsyncGmailProvider
 
 
 class EmailProviderFactory:
@@ -11,14 +13,33 @@ class EmailProviderFactory:
         'outlook': None,  # Future implementation
     }
     
+    _async_providers = {
+        'gmail': AsyncGmailProvider,
+    }
+    
     @classmethod
-    def create(cls, provider_type: str) -> EmailProvider:
+    def create(cls, provider_type: str, use_async: bool = False) -> EmailProvider:
+        """Create a provider; use_async wraps the asyncio implementation in a blocking adapter"""
+        if use_async:
+            return SyncProviderAdapter(cls.create_async(provider_type))
         provider_class = cls._providers.get(provider_type.lower())
         if not provider_class:
             raise ValueError(f"Unsupported provider: {provider_type}")
         return provider_class()
     
+    @classmethod
+    def create_async(cls, provider_type: str) -> AsyncEmailProvider:
+        provider_class = cls._async_providers.get(provider_type.lower())
+        if not provider_class:
+            raise ValueError(f"Unsupported async provider: {provider_type}")
+        return provider_class()
+    
     @classmethod
     def register_provider(cls, name: str, provider_class: type):
         """Register a new email provider"""
-        cls._providers[name.lower()] = provider_class
\ No newline at end of file
+        cls._providers[name.lower()] = provider_class
+    
+    @classmethod
+    def register_async_provider(cls, name: str, provider_class: type):
+        """Register a new asyncio email provider"""
+        cls._async_providers[name.lower()] = provider_class
\ No newline at end of file
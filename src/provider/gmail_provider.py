@@ -1,7 +1,7 @@
 import os
 import base64
 import json
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterator, Iterable
 from datetime import datetime
 from email.utils import parsedate_to_datetime
 
@@ -11,20 +11,112 @@ from google_auth_oauthlib.flow import InstalledAppFlow
 from googleapiclient.discovery import build
 from googleapiclient.errors import HttpError
 
-from .email_provider import EmailProvider
-from config.settings import SCOPES, CREDENTIALS_FILE, TOKEN_FILE
+from .email_provider import EmailProvider, SyncCursorExpiredError, LabelUnavailableError
+from .label_registry import LabelRegistry
+from .http_pool import HttpPool
+from .request_executor import RequestExecutor, ErrorKind, classify
+from config.settings import (
+    SCOPES, CREDENTIALS_FILE, TOKEN_FILE, FETCH_BATCH_SIZE, FETCH_PAGE_SIZE, FETCH_FORMAT, LABEL_CACHE_TTL
+)
 from utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+MAX_BATCH_SIZE = 100
+# messages.batchModify accepts at most 1000 ids per call
+BATCH_MODIFY_LIMIT = 1000
+HISTORY_TYPES = ['messageAdded', 'messageDeleted', 'labelAdded', 'labelRemoved']
+
+# Everything _parse_email produces can be built from these headers and labelIds
+METADATA_HEADERS = ['From', 'To', 'Subject', 'Date']
+METADATA_FIELDS = {'id', 'thread_id', 'from', 'to', 'subject', 'date', 'received_date', 'is_read', 'labels'}
+METADATA_PARTIAL_RESPONSE = 'id,threadId,labelIds,payload/headers'
+
+SYSTEM_LABELS = frozenset({"INBOX", "SENT", "DRAFT", "SPAM", "TRASH", "UNREAD", "STARRED", "IMPORTANT"})
+
+
+def load_credentials() -> Credentials:
+    """
+    Load the stored OAuth 2.0 token, refreshing it or running the consent flow as needed;
+    the token is saved to TOKEN_FILE whenever it changes
+    """
+    creds = None
+    if os.path.exists(TOKEN_FILE):
+        creds = Credentials.from_authorized_user_file(str(TOKEN_FILE), SCOPES)
+
+    if not creds or not creds.valid:
+        if creds and creds.expired and creds.refresh_token:
+            logger.info("Refreshing expired credentials...")
+            creds.refresh(Request())
+        else:
+            if not os.path.exists(CREDENTIALS_FILE):
+                raise FileNotFoundError(
+                    f"Credentials file not found at {CREDENTIALS_FILE}. "
+                    "Please download it from Google Cloud Console."
+                )
+            logger.info("Starting OAuth 2.0 flow...")
+            flow = InstalledAppFlow.from_client_secrets_file(
+                str(CREDENTIALS_FILE), SCOPES
+            )
+            creds = flow.run_local_server(port=0)
+
+        with open(TOKEN_FILE, 'w') as token:
+            token.write(creds.to_json())
+        logger.info(f"Credentials saved to {TOKEN_FILE}")
+    return creds
+
+
+def parse_message(raw_email: Dict) -> Dict[str, Any]:
+    """Convert a Gmail API message resource into the email dict used everywhere else"""
+    headers = {}
+    for header in raw_email['payload'].get('headers', []):
+        headers[header['name']] = header['value']
+
+    date_str = headers.get('Date', '')
+    try:
+        received_date = parsedate_to_datetime(date_str)
+    except Exception:
+        received_date = datetime.now()
+
+    is_read = 'UNREAD' not in raw_email.get('labelIds', [])
+    labels = raw_email.get('labelIds', [])
+
+    return {
+        'id': raw_email['id'],
+        'thread_id': raw_email.get('threadId'),
+        'from': headers.get('From', ''),
+        'to': headers.get('To', ''),
+        'subject': headers.get('Subject', ''),
+        'date': date_str,
+        'received_date': received_date,
+        'is_read': is_read,
+        'labels': labels
+    }
+
+
+def move_label_changes(label_id: str, current_labels: Iterable[str]):
+    """(add, remove) label ids that move an email to label_id, keeping its system labels"""
+    current_labels = set(current_labels)
+    add_labels = {label_id} - current_labels
+    remove_labels = {lbl for lbl in current_labels if lbl not in add_labels and lbl not in SYSTEM_LABELS}
+    return add_labels, remove_labels
+
 
 class GmailProvider(EmailProvider):
     """Gmail API implementation"""
 
-    def __init__(self):
+    system_labels = SYSTEM_LABELS
+
+    def __init__(self, batch_size: int = FETCH_BATCH_SIZE):
         self.service = None
         self.user_id = "me"
         self.creds = None
+        self.http = None
+        # Every API call goes through one executor so retries and throttling see all traffic
+        self.requests = RequestExecutor()
+        self.batch_size = max(1, min(batch_size, MAX_BATCH_SIZE))
+        self.fetch_format = 'full' if FETCH_FORMAT == 'full' else 'metadata'
+        self.labels = LabelRegistry(self._list_labels, ttl=LABEL_CACHE_TTL)
 
     def authenticate(self) -> bool:
         """
@@ -32,30 +124,10 @@ class GmailProvider(EmailProvider):
         Creates token.json on first run for subsequent authentications
         """
         try:
-            if os.path.exists(TOKEN_FILE):
-                self.creds = Credentials.from_authorized_user_file(str(TOKEN_FILE), SCOPES)
-
-            if not self.creds or not self.creds.valid:
-                if self.creds and self.creds.expired and self.creds.refresh_token:
-                    logger.info("Refreshing expired credentials...")
-                    self.creds.refresh(Request())
-                else:
-                    if not os.path.exists(CREDENTIALS_FILE):
-                        raise FileNotFoundError(
-                            f"Credentials file not found at {CREDENTIALS_FILE}. "
-                            "Please download it from Google Cloud Console."
-                        )
-                    logger.info("Starting OAuth 2.0 flow...")
-                    flow = InstalledAppFlow.from_client_secrets_file(
-                        str(CREDENTIALS_FILE), SCOPES
-                    )
-                    self.creds = flow.run_local_server(port=0)
-
-                with open(TOKEN_FILE, 'w') as token:
-                    token.write(self.creds.to_json())
-                logger.info(f"Credentials saved to {TOKEN_FILE}")
-
-            self.service = build('gmail', 'v1', credentials=self.creds)
+            self.creds = load_credentials()
+            # One pooled, thread-safe transport shared by every call of this provider
+            self.http = HttpPool(self.creds)
+            self.service = build('gmail', 'v1', http=self.http)
             logger.info("Successfully authenticated with Gmail API")
             return True
 
@@ -63,90 +135,222 @@ class GmailProvider(EmailProvider):
             logger.error(f"Authentication failed: {str(e)}")
             raise
 
+    def close(self):
+        """Close the pooled HTTP connections"""
+        if self.http is not None:
+            self.http.close()
+
     def fetch_emails(self,folder: Optional[str] = "None", limit: int = 100) -> List[Dict[str, Any]]:
         """
         Fetch emails from Gmail
         """
+        emails = []
+        for chunk in self.iter_emails(folder=folder, limit=limit):
+            emails.extend(chunk)
+
+        logger.info(f"Successfully fetched {len(emails)} emails")
+        return emails
+
+    def configure_fetch(self, fields: Iterable[str]) -> str:
+        """
+        Pick the cheapest message format that still provides every field
+        the rules reference: headers-only metadata unless a field needs the body
+        """
+        extra_fields = set(fields) - METADATA_FIELDS
+        if extra_fields:
+            logger.info(f"Rules reference {sorted(extra_fields)}, fetching full messages")
+            self.fetch_format = 'full'
+        else:
+            self.fetch_format = 'full' if FETCH_FORMAT == 'full' else 'metadata'
+        return self.fetch_format
+
+    def iter_emails(self, folder: Optional[str] = "None", limit: Optional[int] = None,
+                    page_size: int = FETCH_PAGE_SIZE) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Yield parsed emails one messages.list page at a time,
+        following nextPageToken until the mailbox or limit is exhausted
+        """
         if not self.service:
             raise RuntimeError("Not authenticated. Call authenticate() first.")
 
-        try:
-            logger.info(f"Fetching up to {limit} emails from {folder}...")
-            results = self.service.users().messages().list(
-                userId=self.user_id,
-                labelIds=[folder] if folder and folder != "None" else None,
-                maxResults=limit
-            ).execute()
-
-            messages = results.get('messages', [])
+        remaining = limit if limit and limit > 0 else None
+        page_token = None
+        fetched = 0
 
-            if not messages:
+        try:
+            logger.info(f"Fetching up to {remaining or 'all'} emails from {folder}...")
+            while True:
+                max_results = page_size if remaining is None else min(page_size, remaining)
+                results = self.requests.execute(self.service.users().messages().list(
+                    userId=self.user_id,
+                    labelIds=[folder] if folder and folder != "None" else None,
+                    maxResults=max_results,
+                    pageToken=page_token
+                ))
+
+                messages = results.get('messages', [])[:max_results]
+                if messages:
+                    logger.info(f"Found {len(messages)} messages. Fetching details...")
+                    emails = self._get_messages_batch([msg['id'] for msg in messages])
+                    fetched += len(emails)
+                    yield emails
+
+                if remaining is not None:
+                    remaining -= len(messages)
+                    if remaining <= 0:
+                        break
+
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+
+            if not fetched:
                 logger.info("No messages found.")
-                return []
-
-            logger.info(f"Found {len(messages)} messages. Fetching details...")
-
-            emails = []
-            for i, msg in enumerate(messages, 1):
-                try:
-                    email_data = self.service.users().messages().get(
-                        userId=self.user_id,
-                        id=msg['id'],
-                        format='full'
-                    ).execute()
-
-                    parsed_email = self._parse_email(email_data)
-                    emails.append(parsed_email)
-
-                    if i % 10 == 0:
-                        logger.info(f"Processed {i}/{len(messages)} emails...")
-
-                except HttpError as e:
-                    logger.error(f"Error fetching email {msg['id']}: {str(e)}")
-                    continue
-
-            logger.info(f"Successfully fetched {len(emails)} emails")
-            return emails
 
         except HttpError as e:
             logger.error(f"Gmail API error: {str(e)}")
             raise
 
-    def _parse_email(self, raw_email: Dict) -> Dict[str, Any]:
-        headers = {}
-        for header in raw_email['payload'].get('headers', []):
-            headers[header['name']] = header['value']
+    def get_sync_cursor(self) -> Optional[str]:
+        """Get the mailbox's current historyId"""
+        if not self.service:
+            raise RuntimeError("Not authenticated. Call authenticate() first.")
 
-        date_str = headers.get('Date', '')
-        try:
-            received_date = parsedate_to_datetime(date_str)
-        except Exception:
-            received_date = datetime.now()
+        profile = self.requests.execute(self.service.users().getProfile(userId=self.user_id))
+        return profile.get('historyId')
 
-        is_read = 'UNREAD' not in raw_email.get('labelIds', [])
-        labels = raw_email.get('labelIds', [])
+    def fetch_changes(self, cursor: str) -> Dict[str, Any]:
+        """
+        Fetch messages added, deleted or relabelled since the given historyId.
+        Raises SyncCursorExpiredError when Gmail no longer has that history.
+        """
+        if not self.service:
+            raise RuntimeError("Not authenticated. Call authenticate() first.")
 
+        # Insertion-ordered so changed messages are fetched oldest change first
+        changed_ids = {}
+        deleted_ids = set()
+        history_id = cursor
+        page_token = None
+
+        while True:
+            try:
+                results = self.requests.execute(self.service.users().history().list(
+                    userId=self.user_id,
+                    startHistoryId=cursor,
+                    historyTypes=HISTORY_TYPES,
+                    pageToken=page_token
+                ))
+            except HttpError as e:
+                if e.resp.status == 404:
+                    raise SyncCursorExpiredError(f"History {cursor} is no longer available") from e
+                logger.error(f"Gmail API error: {str(e)}")
+                raise
+
+            for record in results.get('history', []):
+                for key in ('messagesAdded', 'labelsAdded', 'labelsRemoved'):
+                    for item in record.get(key, []):
+                        msg_id = item['message']['id']
+                        deleted_ids.discard(msg_id)
+                        changed_ids[msg_id] = None
+                for item in record.get('messagesDeleted', []):
+                    msg_id = item['message']['id']
+                    changed_ids.pop(msg_id, None)
+                    deleted_ids.add(msg_id)
+
+            history_id = results.get('historyId', history_id)
+            page_token = results.get('nextPageToken')
+            if not page_token:
+                break
+
+        logger.info(f"History since {cursor}: {len(changed_ids)} changed, {len(deleted_ids)} deleted")
+        failures = {}
+        emails = self._get_messages_batch(list(changed_ids), failures)
+        failed_ids = []
+        for msg_id, error in failures.items():
+            # Deleted since the history was read
+            if isinstance(error, HttpError) and error.resp.status == 404:
+                deleted_ids.add(msg_id)
+            else:
+                failed_ids.append(msg_id)
         return {
-            'id': raw_email['id'],
-            'from': headers.get('From', ''),
-            'to': headers.get('To', ''),
-            'subject': headers.get('Subject', ''),
-            'date': date_str,
-            'received_date': received_date,
-            'is_read': is_read,
-            'labels': labels
+            'cursor': history_id,
+            'emails': emails,
+            'deleted_ids': sorted(deleted_ids),
+            'failed_ids': failed_ids
         }
 
+    def _get_messages_batch(self, message_ids: List[str],
+                            failures: Optional[Dict[str, Exception]] = None) -> List[Dict[str, Any]]:
+        """
+        Fetch and parse message details using Gmail HTTP batch requests.
+        Items rejected with rate limit or transient errors are retried in a
+        later batch after a backoff; other failures are logged and skipped,
+        and recorded in failures when given.
+        """
+        parsed = {}
+        pending = list(message_ids)
+
+        for attempt in range(self.requests.max_attempts):
+            retry_errors = {}
+            last_attempt = attempt + 1 == self.requests.max_attempts
+
+            def _on_response(request_id, response, exception):
+                if exception is None:
+                    parsed[request_id] = self._parse_email(response)
+                elif not last_attempt and classify(exception) is not ErrorKind.FATAL:
+                    retry_errors[request_id] = exception
+                else:
+                    logger.error(f"Error fetching email {request_id}: {str(exception)}")
+                    if failures is not None:
+                        failures[request_id] = exception
+
+            for start in range(0, len(pending), self.batch_size):
+                chunk = pending[start:start + self.batch_size]
+                batch = self.service.new_batch_http_request(callback=_on_response)
+                for msg_id in chunk:
+                    batch.add(self._get_message_request(msg_id), request_id=msg_id)
+                self.requests.execute(batch)
+                logger.info(f"Processed {start + len(chunk)}/{len(pending)} emails...")
+
+            if not retry_errors:
+                break
+            pending = [msg_id for msg_id in pending if msg_id in retry_errors]
+            delay = self.requests.wait(attempt, retry_errors.values())
+            logger.warning(f"Retrying {len(pending)} emails in {delay:.2f}s")
+
+        # Batch callbacks are not guaranteed to arrive in request order
+        return [parsed[msg_id] for msg_id in message_ids if msg_id in parsed]
+
+    def _get_message_request(self, msg_id: str):
+        """Build a messages.get request for the configured fetch format"""
+        if self.fetch_format == 'metadata':
+            return self.service.users().messages().get(
+                userId=self.user_id,
+                id=msg_id,
+                format='metadata',
+                metadataHeaders=METADATA_HEADERS,
+                fields=METADATA_PARTIAL_RESPONSE
+            )
+        return self.service.users().messages().get(
+            userId=self.user_id,
+            id=msg_id,
+            format='full'
+        )
+
+    def _parse_email(self, raw_email: Dict) -> Dict[str, Any]:
+        return parse_message(raw_email)
+
     def mark_as_read(self, email_id: str) -> bool:
         if not self.service:
             raise RuntimeError("Not authenticated. Call authenticate() first.")
 
         try:
-            self.service.users().messages().modify(
+            self.requests.execute(self.service.users().messages().modify(
                 userId=self.user_id,
                 id=email_id,
                 body={'removeLabelIds': ['UNREAD']}
-            ).execute()
+            ))
             logger.info(f"Marked email {email_id} as read")
             return True
         except HttpError as e:
@@ -158,86 +362,159 @@ class GmailProvider(EmailProvider):
             raise RuntimeError("Not authenticated. Call authenticate() first.")
 
         try:
-            self.service.users().messages().modify(
+            self.requests.execute(self.service.users().messages().modify(
                 userId=self.user_id,
                 id=email_id,
                 body={'addLabelIds': ['UNREAD']}
-            ).execute()
+            ))
             logger.info(f"Marked email {email_id} as unread")
             return True
         except HttpError as e:
             logger.error(f"Error marking email as unread: {str(e)}")
             return False
 
-    def move_email(self, email_id: str, destination: str) -> bool:
+    def move_email(self, email_id: str, destination: str,
+                   current_labels: Optional[List[str]] = None) -> bool:
         """
-        Move email to destination label safely
+        Move email to destination label safely.
+        Pass the stored current_labels to skip reading them from the API.
         """
         if not self.service:
             raise RuntimeError("Not authenticated. Call authenticate() first.")
 
-        SYSTEM_LABELS = {"INBOX", "SENT", "DRAFT", "SPAM", "TRASH", "UNREAD", "STARRED", "IMPORTANT"}
-
         try:
             label_id = self._get_label_id(destination)
             if not label_id:
                 logger.error(f"Label '{destination}' not found")
                 return False
 
-            message = self.service.users().messages().get(
-                userId=self.user_id,
-                id=email_id,
-                format="metadata"
-            ).execute()
-            current_labels = set(message.get('labelIds', []))
-
-            add_labels = {label_id} - current_labels
-            remove_labels = {lbl for lbl in current_labels if lbl not in add_labels and lbl not in SYSTEM_LABELS}
+            if current_labels is None:
+                message = self.requests.execute(self.service.users().messages().get(
+                    userId=self.user_id,
+                    id=email_id,
+                    format="metadata"
+                ))
+                current_labels = message.get('labelIds', [])
+            add_labels, remove_labels = move_label_changes(label_id, current_labels)
 
             if not add_labels and not remove_labels:
                 logger.info(f"No label changes needed for email {email_id}")
                 return True
 
-            self.service.users().messages().modify(
+            self.requests.execute(self.service.users().messages().modify(
                 userId=self.user_id,
                 id=email_id,
                 body={
                     'addLabelIds': list(add_labels),
                     'removeLabelIds': list(remove_labels)
                 }
-            ).execute()
+            ))
 
             logger.info(f"Moved email {email_id} to {destination}")
             return True
 
         except HttpError as e:
             logger.error(f"Error moving email: {str(e)}")
+            self._forget_labels_on_error(e)
+            return False
+
+    def modify_labels(self, email_id: str, add_labels: Iterable[str] = (),
+                      remove_labels: Iterable[str] = ()) -> bool:
+        if not self.service:
+            raise RuntimeError("Not authenticated. Call authenticate() first.")
+
+        try:
+            self.requests.execute(self.service.users().messages().modify(
+                userId=self.user_id,
+                id=email_id,
+                body={
+                    'addLabelIds': sorted(add_labels),
+                    'removeLabelIds': sorted(remove_labels)
+                }
+            ))
+            logger.info(f"Updated labels of email {email_id}")
+            return True
+        except HttpError as e:
+            logger.error(f"Error updating labels: {str(e)}")
+            self._forget_labels_on_error(e)
             return False
 
+    def bulk_modify(self, email_ids: List[str], add_labels: Iterable[str] = (),
+                    remove_labels: Iterable[str] = ()) -> List[str]:
+        if not self.service:
+            raise RuntimeError("Not authenticated. Call authenticate() first.")
+
+        body = {'addLabelIds': sorted(add_labels), 'removeLabelIds': sorted(remove_labels)}
+        modified = []
+        for start in range(0, len(email_ids), BATCH_MODIFY_LIMIT):
+            chunk = list(email_ids[start:start + BATCH_MODIFY_LIMIT])
+            try:
+                self.requests.execute(self.service.users().messages().batchModify(
+                    userId=self.user_id,
+                    body={'ids': chunk, **body}
+                ))
+                modified.extend(chunk)
+            except HttpError as e:
+                logger.error(f"Error updating labels of {len(chunk)} emails: {str(e)}")
+                self._forget_labels_on_error(e)
+        logger.info(f"Updated labels of {len(modified)} emails")
+        return modified
+
+    def _forget_labels_on_error(self, error: HttpError):
+        """A rejected change may name a label deleted since the labels were cached"""
+        if error.resp.status == 400:
+            self.labels.invalidate()
+
     def _get_label_id(self, label_name: str) -> Optional[str]:
-        if label_name in ['INBOX', 'SENT', 'DRAFT', 'SPAM', 'TRASH', 'UNREAD', 'STARRED', 'IMPORTANT']:
+        if label_name in SYSTEM_LABELS:
             return label_name
+        return self.labels.get_id(label_name)
 
-        try:
-            labels = self.get_labels()
-            for label in labels:
-                if label['name'].lower() == label_name.lower():
-                    return label['id']
-            return None
-        except Exception:
-            return None
+    def ensure_labels(self, label_names: Iterable[str]) -> Dict[str, str]:
+        if not self.service:
+            raise RuntimeError("Not authenticated. Call authenticate() first.")
+
+        # Names differing only in case refer to the same label
+        names = {}
+        for name in label_names:
+            names.setdefault(name.lower(), name)
+        system = [name for name in names.values() if name in SYSTEM_LABELS]
+        wanted = [name for name in names.values() if name not in SYSTEM_LABELS]
+
+        resolved = self.labels.resolve(wanted)
+        if resolved is None:
+            raise LabelUnavailableError("Could not list labels to check action destinations")
+
+        failed = []
+        for name in wanted:
+            if resolved[name] is None:
+                resolved[name] = self.create_label(name)
+                if resolved[name] is None:
+                    failed.append(name)
+        if failed:
+            raise LabelUnavailableError(f"Could not create labels: {', '.join(sorted(failed))}")
+
+        resolved.update((name, name) for name in system)
+        return resolved
+
+    def use_label_store(self, store: Any):
+        """Keep the label cache in the datastore between runs"""
+        self.labels.store = store
 
     def get_labels(self) -> List[Dict[str, str]]:
+        """All labels of the mailbox, listed once per session by the label registry"""
         if not self.service:
             raise RuntimeError("Not authenticated. Call authenticate() first.")
+        return self.labels.labels()
 
-        try:
-            results = self.service.users().labels().list(userId=self.user_id).execute()
-            labels = results.get('labels', [])
-            return [{'id': label['id'], 'name': label['name']} for label in labels]
-        except HttpError as e:
-            logger.error(f"Error fetching labels: {str(e)}")
-            return []
+    def _list_labels(self) -> List[Dict[str, str]]:
+        if not self.service:
+            raise RuntimeError("Not authenticated. Call authenticate() first.")
+
+        results = self.requests.execute(self.service.users().labels().list(userId=self.user_id))
+        labels = results.get('labels', [])
+        logger.info(f"Listed {len(labels)} labels")
+        return [{'id': label['id'], 'name': label['name']} for label in labels]
 
     def create_label(self, label_name: str) -> Optional[str]:
         if not self.service:
@@ -250,11 +527,12 @@ class GmailProvider(EmailProvider):
                 'messageListVisibility': 'show'
             }
 
-            created_label = self.service.users().labels().create(
+            created_label = self.requests.execute(self.service.users().labels().create(
                 userId=self.user_id,
                 body=label_object
-            ).execute()
+            ))
 
+            self.labels.add(created_label['id'], created_label.get('name', label_name))
             logger.info(f"Created label: {label_name}")
             return created_label['id']
         except HttpError as e:
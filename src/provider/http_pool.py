@@ -0,0 +1,86 @@
+import queue
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional
+
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
+
+from config.settings import HTTP_POOL_SIZE, HTTP_POOL_TIMEOUT, HTTP_TIMEOUT
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class HttpPoolExhaustedError(Exception):
+    """Raised when no pooled connection becomes free within the pool timeout"""
+    pass
+
+
+class HttpPool:
+    """
+    Thread-safe stand-in for the httplib2.Http object googleapiclient uses.
+    httplib2.Http is not thread-safe, so each request checks out one of up to
+    `size` authorized Http objects and returns it afterwards. Each one keeps
+    its connection to the API alive, so requests reuse warm TLS connections
+    instead of paying a handshake each time.
+    """
+
+    def __init__(self, credentials: Any, size: int = HTTP_POOL_SIZE, timeout: float = HTTP_TIMEOUT,
+                 pool_timeout: float = HTTP_POOL_TIMEOUT,
+                 http_factory: Optional[Callable[[], Any]] = None):
+        # googleapiclient reads the credentials from the http object to refresh batch requests
+        self.credentials = credentials
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.pool_timeout = pool_timeout
+        self._http_factory = http_factory or self._new_http
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _new_http(self) -> AuthorizedHttp:
+        return AuthorizedHttp(self.credentials, http=httplib2.Http(timeout=self.timeout))
+
+    def _checkout(self) -> Any:
+        """Take an idle Http, create one while below the pool size, or wait for one"""
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.size:
+                self._created += 1
+                return self._http_factory()
+        try:
+            return self._idle.get(timeout=self.pool_timeout)
+        except queue.Empty:
+            raise HttpPoolExhaustedError(
+                f"No HTTP connection became free within {self.pool_timeout}s (pool size {self.size})"
+            )
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        """Borrow one Http for the duration of a request"""
+        http = self._checkout()
+        try:
+            yield http
+        finally:
+            # Most recently used first, so warm connections are reused before idle ones
+            self._idle.put(http)
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        """httplib2.Http.request on a pooled connection"""
+        with self.connection() as http:
+            return http.request(uri, method=method, body=body, headers=headers, **kwargs)
+
+    def close(self):
+        """Close the idle connections"""
+        while True:
+            try:
+                http = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            http.close()
+            with self._lock:
+                self._created -= 1
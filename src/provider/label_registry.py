@@ -0,0 +1,144 @@
+import threading
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterable, List, Optional
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class LabelRegistry:
+    """
+    Case-insensitive label name -> id cache for a provider session.
+    Labels are listed once and reused until the TTL runs out or invalidate()
+    is called; labels created through the provider are added in place.
+    With a store (the email repository) the list is kept between runs and
+    reused while it is younger than the TTL. Without a loader the owner
+    lists labels itself and passes them to load().
+    """
+    
+    def __init__(self, loader: Optional[Callable[[], List[Dict[str, str]]]], ttl: Optional[float] = None,
+                 store: Any = None, provider_type: str = 'gmail', account: str = 'me',
+                 clock: Callable[[], float] = time.monotonic):
+        self._loader = loader
+        self.ttl = ttl or None
+        self.store = store
+        self.provider_type = provider_type
+        self.account = account
+        self._clock = clock
+        self._ids: Optional[Dict[str, str]] = None
+        self._labels: List[Dict[str, str]] = []
+        self._loaded_at = 0.0
+        # The stored list is only a starting point; reloads always list labels again
+        self._store_checked = False
+        self._lock = threading.Lock()
+    
+    def _expired(self) -> bool:
+        return self.ttl is not None and self._clock() - self._loaded_at >= self.ttl
+    
+    def _set(self, labels: List[Dict[str, str]], age: float = 0.0):
+        self._labels = [{'id': label['id'], 'name': label['name']} for label in labels]
+        self._ids = {label['name'].lower(): label['id'] for label in self._labels}
+        self._loaded_at = self._clock() - age
+    
+    def _load_stored(self) -> bool:
+        """Use the stored label list if it is still fresh"""
+        try:
+            stored = self.store.get_cached_labels(self.provider_type, self.account)
+        except Exception as e:
+            logger.warning(f"Could not read stored labels: {str(e)}")
+            return False
+        if not stored:
+            return False
+        labels, saved_at = stored
+        age = max(0.0, (datetime.utcnow() - saved_at).total_seconds())
+        if self.ttl is not None and age >= self.ttl:
+            return False
+        self._set(labels, age)
+        logger.info(f"Loaded {len(labels)} labels from the datastore")
+        return True
+    
+    def _save(self):
+        try:
+            self.store.save_cached_labels(self._labels, self.provider_type, self.account)
+        except Exception as e:
+            logger.warning(f"Could not store labels: {str(e)}")
+    
+    def _ensure_loaded(self) -> bool:
+        """Load labels if there are none or they expired; False if they could not be listed"""
+        if self._ids is not None and not self._expired():
+            return True
+        if not self._store_checked and self.store is not None:
+            self._store_checked = True
+            if self._load_stored():
+                return True
+        if self._loader is None:
+            return False
+        try:
+            labels = self._loader()
+        except Exception as e:
+            logger.error(f"Error loading labels: {str(e)}")
+            return False
+        self._set(labels)
+        if self.store is not None:
+            self._save()
+        return True
+    
+    def is_loaded(self) -> bool:
+        """
+        Whether lookups can be answered without listing labels, using a fresh stored
+        list if there is one; lets async providers list labels themselves first
+        """
+        with self._lock:
+            if self._ids is not None and not self._expired():
+                return True
+            if not self._store_checked and self.store is not None:
+                self._store_checked = True
+                return self._load_stored()
+            return False
+    
+    def load(self, labels: List[Dict[str, str]]):
+        """Replace the cached labels with a listing fetched by the caller"""
+        with self._lock:
+            self._store_checked = True
+            self._set(labels)
+            if self.store is not None:
+                self._save()
+    
+    def get_id(self, name: str) -> Optional[str]:
+        """Id of the label with this name, ignoring case; None if there is no such label"""
+        with self._lock:
+            if not self._ensure_loaded():
+                return None
+            return self._ids.get(name.lower())
+    
+    def resolve(self, names: Iterable[str]) -> Optional[Dict[str, Optional[str]]]:
+        """Ids for several names from one listing (None for unknown names); None if labels could not be listed"""
+        with self._lock:
+            if not self._ensure_loaded():
+                return None
+            return {name: self._ids.get(name.lower()) for name in names}
+    
+    def labels(self) -> List[Dict[str, str]]:
+        """All known labels as {'id', 'name'} dicts"""
+        with self._lock:
+            if not self._ensure_loaded():
+                return []
+            return list(self._labels)
+    
+    def add(self, label_id: str, name: str):
+        """Record a label created during the session without listing labels again"""
+        with self._lock:
+            if self._ids is None:
+                return
+            self._labels = [label for label in self._labels if label['name'].lower() != name.lower()]
+            self._labels.append({'id': label_id, 'name': name})
+            self._ids[name.lower()] = label_id
+            if self.store is not None:
+                self._save()
+    
+    def invalidate(self):
+        """Forget the cached labels so the next lookup lists them again"""
+        with self._lock:
+            self._ids = None
+            self._labels = []
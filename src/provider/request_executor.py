@@ -0,0 +1,261 @@
+import asyncio
+import json
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from enum import Enum
+from typing import Any, AsyncIterator, Awaitable, Callable, Iterable, Iterator, Optional, TypeVar
+
+import httpx
+from googleapiclient.errors import HttpError
+
+from config.settings import API_MAX_ATTEMPTS, API_BACKOFF_BASE, API_BACKOFF_MAX, HTTP_POOL_SIZE
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+T = TypeVar('T')
+
+# 403 reasons Gmail uses for per-user rate limits, as opposed to permanent refusals
+RATE_LIMIT_REASONS = frozenset({'rateLimitExceeded', 'userRateLimitExceeded'})
+TRANSIENT_STATUSES = frozenset({500, 502, 503, 504})
+
+
+class ErrorKind(Enum):
+    RATE_LIMITED = "rate_limited"
+    TRANSIENT = "transient"
+    FATAL = "fatal"
+
+
+def error_reasons(error: Exception) -> Iterator[str]:
+    """The machine-readable `reason` values in a Gmail error response"""
+    try:
+        content = error.response.content if isinstance(error, httpx.HTTPStatusError) else error.content
+        data = json.loads(content.decode('utf-8'))
+        for item in data['error'].get('errors', []):
+            yield item.get('reason', '')
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return
+
+
+def classify(error: Exception) -> ErrorKind:
+    """Whether an API error is a rate limit signal, worth retrying, or final"""
+    if isinstance(error, (HttpError, httpx.HTTPStatusError)):
+        status = error.resp.status if isinstance(error, HttpError) else error.response.status_code
+        if status == 429 or (status == 403 and any(r in RATE_LIMIT_REASONS for r in error_reasons(error))):
+            return ErrorKind.RATE_LIMITED
+        if status in TRANSIENT_STATUSES:
+            return ErrorKind.TRANSIENT
+        return ErrorKind.FATAL
+    # Dropped or timed out connections
+    if isinstance(error, (ConnectionError, TimeoutError, httpx.TransportError)):
+        return ErrorKind.TRANSIENT
+    return ErrorKind.FATAL
+
+
+def retry_after(error: Exception) -> Optional[float]:
+    """Seconds the server asked us to wait via Retry-After, if it did"""
+    if isinstance(error, httpx.HTTPStatusError):
+        value = error.response.headers.get('retry-after')
+    else:
+        resp = getattr(error, 'resp', None)
+        value = resp.get('retry-after') if resp is not None else None
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+class AimdLimiter:
+    """
+    Concurrency limit adjusted by additive increase / multiplicative decrease:
+    each success raises the limit by about one slot per limit's worth of requests,
+    and a rate limit signal halves it. Decreases are spaced by `cooldown` so one
+    burst of 429s counts as a single signal.
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1, decrease_factor: float = 0.5,
+                 cooldown: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.limit = float(self.maximum)
+        self.decrease_factor = decrease_factor
+        self.cooldown = cooldown
+        self.in_flight = 0
+        self._clock = clock
+        self._last_decrease = None
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        """Wait until a request fits under the current limit"""
+        with self._condition:
+            while self.in_flight >= int(self.limit):
+                self._condition.wait()
+            self.in_flight += 1
+
+    def release(self, succeeded: bool, rate_limited: bool = False):
+        with self._condition:
+            self._record(succeeded, rate_limited)
+            self._condition.notify_all()
+
+    def throttle(self):
+        """Record a rate limit signal seen outside acquire/release, e.g. inside a batch"""
+        with self._condition:
+            self._decrease()
+
+    def _record(self, succeeded: bool, rate_limited: bool):
+        """Free a slot and adjust the limit by the request's outcome"""
+        self.in_flight -= 1
+        if rate_limited:
+            self._decrease()
+        elif succeeded:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+    def _decrease(self):
+        now = self._clock()
+        if self._last_decrease is not None and now - self._last_decrease < self.cooldown:
+            return
+        self._last_decrease = now
+        self.limit = max(self.minimum, self.limit * self.decrease_factor)
+        logger.warning(f"Rate limited, lowering concurrency limit to {int(self.limit)}")
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Hold one request slot; the outcome adjusts the limit"""
+        self.acquire()
+        try:
+            yield
+        except Exception as e:
+            self.release(False, classify(e) is ErrorKind.RATE_LIMITED)
+            raise
+        else:
+            self.release(True)
+
+
+class AsyncAimdLimiter(AimdLimiter):
+    """
+    AimdLimiter for coroutines on one event loop: a semaphore whose size
+    follows the AIMD limit
+    """
+
+    def __init__(self, maximum: int, minimum: int = 1, decrease_factor: float = 0.5,
+                 cooldown: float = 1.0, clock: Callable[[], float] = time.monotonic):
+        super().__init__(maximum, minimum, decrease_factor, cooldown, clock)
+        # asyncio primitives bind to the loop that first waits on them
+        self._condition = asyncio.Condition()
+
+    async def acquire(self):
+        """Wait until a request fits under the current limit"""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+
+    async def release(self, succeeded: bool, rate_limited: bool = False):
+        async with self._condition:
+            self._record(succeeded, rate_limited)
+            self._condition.notify_all()
+
+    def throttle(self):
+        """Record a rate limit signal seen outside acquire/release"""
+        self._decrease()
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        """Hold one request slot; the outcome adjusts the limit"""
+        await self.acquire()
+        try:
+            yield
+        except Exception as e:
+            await self.release(False, classify(e) is ErrorKind.RATE_LIMITED)
+            raise
+        else:
+            await self.release(True)
+
+
+class RequestExecutor:
+    """
+    Runs provider API calls with retries. Rate limit and transient errors are
+    retried with full-jitter exponential backoff, waiting at least as long as
+    any Retry-After header asks; other errors are raised at once. An AIMD
+    limiter caps how many calls run concurrently across threads.
+    """
+
+    def __init__(self, max_attempts: int = API_MAX_ATTEMPTS, base_delay: float = API_BACKOFF_BASE,
+                 max_delay: float = API_BACKOFF_MAX, limiter: Optional[AimdLimiter] = None,
+                 sleep: Callable[[float], None] = time.sleep, jitter: Callable[[], float] = random.random):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.limiter = limiter or AimdLimiter(HTTP_POOL_SIZE)
+        self._sleep = sleep
+        self._jitter = jitter
+
+    def backoff(self, attempt: int, errors: Iterable[Exception] = ()) -> float:
+        """Delay before retry number attempt + 1, honoring the longest Retry-After"""
+        delay = self._jitter() * min(self.max_delay, self.base_delay * 2 ** attempt)
+        waits = [wait for wait in map(retry_after, errors) if wait is not None]
+        return max([delay] + waits)
+
+    def wait(self, attempt: int, errors: Iterable[Exception] = ()) -> float:
+        """Sleep before the next attempt; returns the seconds slept"""
+        errors = list(errors)
+        if any(classify(error) is ErrorKind.RATE_LIMITED for error in errors):
+            self.limiter.throttle()
+        delay = self.backoff(attempt, errors)
+        self._sleep(delay)
+        return delay
+
+    def call(self, func: Callable[[], T], description: str = 'request') -> T:
+        """Call func, retrying retryable errors; the last error is raised when attempts run out"""
+        for attempt in range(self.max_attempts):
+            try:
+                with self.limiter.slot():
+                    return func()
+            except Exception as e:
+                if classify(e) is ErrorKind.FATAL or attempt + 1 == self.max_attempts:
+                    raise
+                delay = self.backoff(attempt, [e])
+                logger.warning(f"Retrying {description} in {delay:.2f}s after error: {str(e)}")
+                self._sleep(delay)
+
+    def execute(self, request: Any) -> Any:
+        """Execute a googleapiclient request (or batch) with retries"""
+        description = getattr(request, 'methodId', None) or type(request).__name__
+        return self.call(request.execute, description)
+
+
+class AsyncRequestExecutor(RequestExecutor):
+    """
+    RequestExecutor for coroutines: the same classification and backoff,
+    sleeping on the event loop, with an AsyncAimdLimiter capping the
+    requests in flight
+    """
+
+    def __init__(self, max_attempts: int = API_MAX_ATTEMPTS, base_delay: float = API_BACKOFF_BASE,
+                 max_delay: float = API_BACKOFF_MAX, limiter: Optional[AsyncAimdLimiter] = None,
+                 sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+                 jitter: Callable[[], float] = random.random):
+        super().__init__(max_attempts, base_delay, max_delay, limiter or AsyncAimdLimiter(HTTP_POOL_SIZE),
+                         sleep, jitter)
+
+    async def call(self, func: Callable[[], Awaitable[T]], description: str = 'request') -> T:
+        """Await func(), retrying retryable errors; the last error is raised when attempts run out"""
+        for attempt in range(self.max_attempts):
+            try:
+                async with self.limiter.slot():
+                    return await func()
+            except Exception as e:
+                if classify(e) is ErrorKind.FATAL or attempt + 1 == self.max_attempts:
+                    raise
+                delay = self.backoff(attempt, [e])
+                logger.warning(f"Retrying {description} in {delay:.2f}s after error: {str(e)}")
+                await self._sleep(delay)
@@ -1,9 +1,12 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Set
 
 class Action(ABC):
     """Abstract base class for all actions"""
     
+    # Provider quota units one execution consumes, used for rate limiting
+    quota_units = 1
+    
     def __init__(self, parameters: Dict[str, Any] = None):
         self.parameters = parameters or {}
     
@@ -12,5 +15,16 @@ class Action(ABC):
         """Execute action on email"""
         pass
     
+    def required_labels(self) -> Set[str]:
+        """Label names that must exist before this action can run"""
+        return set()
+    
+    def apply_to_labels(self, email_provider: Any, email: Dict, labels: Set[str]) -> Optional[Set[str]]:
+        """
+        Label ids the email would carry after this action, so label changes from
+        several actions can be committed together; None if the action has to be executed
+        """
+        return None
+    
     def __repr__(self):
         return f"{self.__class__.__name__}(parameters={self.parameters})"
\ No newline at end of file
@@ -1,4 +1,4 @@
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Set
 from .action import Action
 from utils.logger import setup_logger
 
@@ -7,6 +7,9 @@ logger = setup_logger(__name__)
 class MarkAsReadAction(Action):
     """Mark email as read"""
     
+    # Gmail messages.modify
+    quota_units = 5
+    
     def execute(self, email_provider: Any, email: Dict) -> bool:
         try:
             result = email_provider.mark_as_read(email['id'])
@@ -17,11 +20,17 @@ class MarkAsReadAction(Action):
         except Exception as e:
             logger.error(f"Failed to mark as read: {str(e)}")
             return False
+    
+    def apply_to_labels(self, email_provider: Any, email: Dict, labels: Set[str]) -> Optional[Set[str]]:
+        return labels - {'UNREAD'}
 
 
 class MarkAsUnreadAction(Action):
     """Mark email as unread"""
     
+    # Gmail messages.modify
+    quota_units = 5
+    
     def execute(self, email_provider: Any, email: Dict) -> bool:
         try:
             result = email_provider.mark_as_unread(email['id'])
@@ -30,4 +39,7 @@ class MarkAsUnreadAction(Action):
             return result
         except Exception as e:
             logger.error(f"Failed to mark as unread: {str(e)}")
-            return False
\ No newline at end of file
+            return False
+    
+    def apply_to_labels(self, email_provider: Any, email: Dict, labels: Set[str]) -> Optional[Set[str]]:
+        return labels | {'UNREAD'}
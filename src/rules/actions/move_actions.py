@@ -1,4 +1,4 @@
-from typing import Any, Dict
+from typing import Any, Dict, Optional, Set
 from .action import Action
 from utils.logger import setup_logger
 
@@ -7,6 +7,9 @@ logger = setup_logger(__name__)
 class MoveMessageAction(Action):
     """Move email to specified folder/label"""
 
+    # Gmail messages.modify; the destination resolves from the provider's cached labels
+    quota_units = 5
+
     def execute(self, email_provider: Any, email: Dict) -> bool:
         try:
             destination = self.parameters.get('destination')
@@ -15,14 +18,16 @@ class MoveMessageAction(Action):
                 return False
 
             # Skip if already in the destination
-            current_labels = set(email.get('labels', []))
+            current_labels = set(email.get('labels') or [])
             dest_label_id = email_provider._get_label_id(destination)
             if dest_label_id in current_labels:
                 logger.info(f"Email '{email['subject'][:50]}' is already in '{destination}', skipping move.")
                 return True
 
             # Move email
-            result = email_provider.move_email(email['id'], destination)
+            result = email_provider.move_email(
+                email['id'], destination, current_labels=email.get('labels')
+            )
             if result:
                 logger.info(f"✓ Moved to {destination}: {email['subject'][:50]}")
             return result
@@ -30,3 +35,19 @@ class MoveMessageAction(Action):
         except Exception as e:
             logger.error(f"Failed to move email: {str(e)}")
             return False
+
+    def required_labels(self) -> Set[str]:
+        destination = self.parameters.get('destination')
+        return {destination} if destination else set()
+
+    def apply_to_labels(self, email_provider: Any, email: Dict, labels: Set[str]) -> Optional[Set[str]]:
+        destination = self.parameters.get('destination')
+        if not destination:
+            return None
+        dest_label_id = email_provider._get_label_id(destination)
+        if not dest_label_id:
+            return None
+        if dest_label_id in labels:
+            return labels
+        # Moving replaces the email's folders with the destination and keeps state labels
+        return {label for label in labels if label in email_provider.system_labels} | {dest_label_id}
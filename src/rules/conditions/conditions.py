@@ -1,9 +1,15 @@
 from abc import ABC, abstractmethod
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Optional
+from datetime import datetime
+from rules.context import EvaluationContext
 
 class Condition(ABC):
     """Abstract base class for all conditions"""
     
+    # Relative evaluation cost and estimated chance of being true, used to order conditions
+    cost = 1.0
+    selectivity = 0.5
+    
     def __init__(self, field: str, value: Any):
         self.field = field
         self.value = value
@@ -13,5 +19,20 @@ class Condition(ABC):
         """Evaluate condition against email"""
         pass
     
+    def compile(self, now: Optional[datetime] = None) -> Callable[[EvaluationContext], bool]:
+        """
+        Build a predicate over an EvaluationContext shared by all rules.
+        Time-dependent conditions evaluate relative to now, fixed per evaluation run.
+        """
+        evaluate = self.evaluate
+        return lambda context: evaluate(context.email)
+    
+    def becomes_true_at(self, email: Dict[str, Any]) -> Optional[datetime]:
+        """
+        Time from which the condition starts to hold for this email,
+        for conditions that can turn true purely as time passes
+        """
+        return None
+    
     def __repr__(self):
         return f"{self.__class__.__name__}(field={self.field}, value={self.value})"
\ No newline at end of file
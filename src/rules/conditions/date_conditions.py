@@ -1,73 +1,90 @@
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Optional
 from datetime import datetime, timedelta
 from .conditions import Condition
+from rules.context import EvaluationContext
 from utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
-class LessThanDaysCondition(Condition):
-    """Check if email received less than N days ago"""
+SECONDS_PER_DAY = 86400
+
+def _received_date(email: Dict[str, Any]) -> Optional[datetime]:
+    """Get the email's received date as a datetime"""
+    email_date = email.get('received_date')
+    if isinstance(email_date, str):
+        email_date = datetime.fromisoformat(email_date)
+    return email_date
+
+
+class DateCondition(Condition):
+    """
+    Base class for conditions comparing a date field against a cutoff N units ago.
+    Compiled predicates compare epoch timestamps against a cutoff fixed at compile time.
+    """
+    
+    cost = 3.0
+    days_per_unit = 1
+    # True: match emails received after the cutoff; False: before it
+    after_cutoff = True
+    
+    @property
+    def days(self) -> int:
+        """Condition value converted to days"""
+        return int(self.value) * self.days_per_unit
     
     def evaluate(self, email: Dict[str, Any]) -> bool:
+        return self.compile()(EvaluationContext(email))
+    
+    def compile(self, now: Optional[datetime] = None) -> Callable[[EvaluationContext], bool]:
+        name = type(self).__name__
         try:
-            email_date = email.get('received_date')
-            if isinstance(email_date, str):
-                email_date = datetime.fromisoformat(email_date)
-            
-            days_ago = datetime.now(email_date.tzinfo) - timedelta(days=int(self.value))
-            result = email_date > days_ago
-            return result
+            now = now or datetime.now()
+            cutoff = now.timestamp() - self.days * SECONDS_PER_DAY
         except Exception as e:
-            logger.error(f"Error evaluating LessThanDaysCondition: {str(e)}")
-            return False
+            logger.error(f"Error evaluating {name}: {str(e)}")
+            return lambda context: False
+        
+        field, after_cutoff = self.field, self.after_cutoff
+        
+        def predicate(context: EvaluationContext) -> bool:
+            timestamp = context.timestamp(field)
+            if timestamp is None:
+                logger.error(f"Error evaluating {name}: invalid date {context.email.get(field)!r}")
+                return False
+            return timestamp > cutoff if after_cutoff else timestamp < cutoff
+        return predicate
+
+
+class LessThanDaysCondition(DateCondition):
+    """Check if email received less than N days ago"""
 
 
-class GreaterThanDaysCondition(Condition):
+class GreaterThanDaysCondition(DateCondition):
     """Check if email received more than N days ago"""
     
-    def evaluate(self, email: Dict[str, Any]) -> bool:
+    after_cutoff = False
+    
+    def becomes_true_at(self, email: Dict[str, Any]) -> Optional[datetime]:
         try:
-            email_date = email.get('received_date')
-            if isinstance(email_date, str):
-                email_date = datetime.fromisoformat(email_date)
-            
-            days_ago = datetime.now(email_date.tzinfo) - timedelta(days=int(self.value))
-            result = email_date < days_ago
-            return result
-        except Exception as e:
-            logger.error(f"Error evaluating GreaterThanDaysCondition: {str(e)}")
-            return False
+            return _received_date(email) + timedelta(days=self.days)
+        except Exception:
+            return None
 
 
-class LessThanMonthsCondition(Condition):
+class LessThanMonthsCondition(DateCondition):
     """Check if email received less than N months ago"""
     
-    def evaluate(self, email: Dict[str, Any]) -> bool:
-        try:
-            email_date = email.get('received_date')
-            if isinstance(email_date, str):
-                email_date = datetime.fromisoformat(email_date)
-            
-            months_ago = datetime.now(email_date.tzinfo) - timedelta(days=int(self.value) * 30)
-            result = email_date > months_ago
-            return result
-        except Exception as e:
-            logger.error(f"Error evaluating LessThanMonthsCondition: {str(e)}")
-            return False
+    days_per_unit = 30
 
 
-class GreaterThanMonthsCondition(Condition):
+class GreaterThanMonthsCondition(DateCondition):
     """Check if email received more than N months ago"""
     
-    def evaluate(self, email: Dict[str, Any]) -> bool:
+    days_per_unit = 30
+    after_cutoff = False
+    
+    def becomes_true_at(self, email: Dict[str, Any]) -> Optional[datetime]:
         try:
-            email_date = email.get('received_date')
-            if isinstance(email_date, str):
-                email_date = datetime.fromisoformat(email_date)
-            
-            months_ago = datetime.now(email_date.tzinfo) - timedelta(days=int(self.value) * 30)
-            result = email_date < months_ago
-            return result
-        except Exception as e:
-            logger.error(f"Error evaluating GreaterThanMonthsCondition: {str(e)}")
-            return False
\ No newline at end of file
+            return _received_date(email) + timedelta(days=self.days)
+        except Exception:
+            return None
@@ -1,37 +1,77 @@
-from typing import Any, Dict
+from typing import Any, Callable, Dict, Optional
+from datetime import datetime
 from .conditions import Condition
+from rules.context import EvaluationContext
 
 class ContainsCondition(Condition):
     """Check if field contains value (case-insensitive)"""
     
+    selectivity = 0.1
+    
+    def __init__(self, field: str, value: Any):
+        super().__init__(field, value)
+        self.search_value = str(value).lower()
+    
     def evaluate(self, email: Dict[str, Any]) -> bool:
         field_value = str(email.get(self.field, '')).lower()
-        search_value = str(self.value).lower()
-        return search_value in field_value
+        return self.search_value in field_value
+    
+    def compile(self, now: Optional[datetime] = None) -> Callable[[EvaluationContext], bool]:
+        field, search_value = self.field, self.search_value
+        return lambda context: context.contains(field, search_value)
 
 
 class DoesNotContainCondition(Condition):
     """Check if field does not contain value (case-insensitive)"""
     
+    selectivity = 0.9
+    
+    def __init__(self, field: str, value: Any):
+        super().__init__(field, value)
+        self.search_value = str(value).lower()
+    
     def evaluate(self, email: Dict[str, Any]) -> bool:
         field_value = str(email.get(self.field, '')).lower()
-        search_value = str(self.value).lower()
-        return search_value not in field_value
+        return self.search_value not in field_value
+    
+    def compile(self, now: Optional[datetime] = None) -> Callable[[EvaluationContext], bool]:
+        field, search_value = self.field, self.search_value
+        return lambda context: not context.contains(field, search_value)
 
 
 class EqualsCondition(Condition):
     """Check if field equals value (case-insensitive)"""
     
+    cost = 0.8
+    selectivity = 0.01
+    
+    def __init__(self, field: str, value: Any):
+        super().__init__(field, value)
+        self.search_value = str(value).lower().strip()
+    
     def evaluate(self, email: Dict[str, Any]) -> bool:
         field_value = str(email.get(self.field, '')).lower().strip()
-        search_value = str(self.value).lower().strip()
-        return field_value == search_value
+        return field_value == self.search_value
+    
+    def compile(self, now: Optional[datetime] = None) -> Callable[[EvaluationContext], bool]:
+        field, search_value = self.field, self.search_value
+        return lambda context: context.stripped(field) == search_value
 
 
 class DoesNotEqualCondition(Condition):
     """Check if field does not equal value (case-insensitive)"""
     
+    cost = 0.8
+    selectivity = 0.99
+    
+    def __init__(self, field: str, value: Any):
+        super().__init__(field, value)
+        self.search_value = str(value).lower().strip()
+    
     def evaluate(self, email: Dict[str, Any]) -> bool:
         field_value = str(email.get(self.field, '')).lower().strip()
-        search_value = str(self.value).lower().strip()
-        return field_value != search_value
\ No newline at end of file
+        return field_value != self.search_value
+    
+    def compile(self, now: Optional[datetime] = None) -> Callable[[EvaluationContext], bool]:
+        field, search_value = self.field, self.search_value
+        return lambda context: context.stripped(field) != search_value
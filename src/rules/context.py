@@ -0,0 +1,72 @@
+from typing import Any, Dict, Optional
+from datetime import datetime
+
+
+def to_timestamp(value: Any) -> Optional[float]:
+    """
+    Convert a datetime or ISO date string to an epoch timestamp, or None if it is not a date.
+    Naive datetimes are taken as local time, like datetime.now().
+    """
+    try:
+        if isinstance(value, str):
+            value = datetime.fromisoformat(value)
+        return value.timestamp()
+    except Exception:
+        return None
+
+
+class EvaluationContext:
+    """
+    Per-email state shared by every rule during one evaluation.
+    Field values are normalized once and reused by all conditions.
+    """
+    
+    __slots__ = ('email', 'substring_indexes', '_lowered', '_stripped', '_substrings', '_timestamps')
+    
+    def __init__(self, email: Dict[str, Any], substring_indexes: Optional[Dict[str, Any]] = None):
+        self.email = email
+        self.substring_indexes = substring_indexes or {}
+        self._lowered = {}
+        self._stripped = {}
+        self._substrings = {}
+        self._timestamps = {}
+    
+    def lower(self, field: str) -> str:
+        """Field value as a lowercase string"""
+        try:
+            return self._lowered[field]
+        except KeyError:
+            value = self._lowered[field] = str(self.email.get(field, '')).lower()
+            return value
+    
+    def stripped(self, field: str) -> str:
+        """Field value as a lowercase string without surrounding whitespace"""
+        try:
+            return self._stripped[field]
+        except KeyError:
+            value = self._stripped[field] = self.lower(field).strip()
+            return value
+    
+    def timestamp(self, field: str) -> Optional[float]:
+        """Field value as an epoch timestamp, or None if it is not a date"""
+        try:
+            return self._timestamps[field]
+        except KeyError:
+            pass
+        
+        timestamp = self._timestamps[field] = to_timestamp(self.email.get(field))
+        return timestamp
+    
+    def contains(self, field: str, needle: str) -> bool:
+        """
+        Check whether the lowercased field contains needle. Fields with a
+        SubstringIndex are scanned once for all needles, then answered by lookup.
+        """
+        index = self.substring_indexes.get(field)
+        if index is None:
+            return needle in self.lower(field)
+        try:
+            found = self._substrings[field]
+        except KeyError:
+            found = self._substrings[field] = index.search(self.lower(field))
+        return needle in found
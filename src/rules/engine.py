@@ -1,9 +1,32 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Set, Optional, Callable, Tuple
 from enum import Enum
+from datetime import datetime
+from .context import EvaluationContext
+from .index import SubstringIndex, EqualityIndex, group_by_field
+from .vectorized import match_matrix, matched_positions
+from .executor import ActionExecutor
+from .conditions.string_conditions import (
+    ContainsCondition,
+    DoesNotContainCondition,
+    EqualsCondition,
+    DoesNotEqualCondition
+)
+from utils.rate_limit import TokenBucket
 from utils.logger import setup_logger
 
 logger = setup_logger(__name__)
 
+# Floor for selectivity estimates so certain-outcome conditions still sort sensibly
+MIN_SELECTIVITY = 0.001
+
+# Fields with fewer contains needles than this skip the Aho-Corasick automaton:
+# below it, one `in` scan per needle beats building and walking the automaton
+MIN_INDEXED_NEEDLES = 64
+
+# Batches at least this large are matched column-wise instead of email by email
+VECTORIZE_MIN_BATCH = 64
+
+
 class RulePredicate(Enum):
     """Rule predicate types"""
     ALL = "all"
@@ -20,24 +43,101 @@ class Rule:
         self.predicate = RulePredicate(predicate.lower())
         self.conditions = conditions
         self.actions = actions
+        self._predicate = None
     
-    def matches(self, email: Dict[str, Any]) -> bool:
-        """Check if email matches rule conditions"""
+    def compile(self, now: Optional[datetime] = None) -> Callable[[EvaluationContext], bool]:
+        """
+        Compile the conditions into one short-circuiting predicate,
+        with date cutoffs taken relative to now.
+        Conditions most likely to decide the outcome per unit of cost run first:
+        likely-false ones for ALL rules, likely-true ones for ANY rules.
+        """
         if not self.conditions:
-            return False
+            self._predicate = lambda context: False
+            return self._predicate
         
-        results = [condition.evaluate(email) for condition in self.conditions]
+        # Same-field equality lists collapse into a single set lookup, which runs first:
+        # equals in ANY rules (allow-lists), does_not_equal in ALL rules (block-lists)
+        if self.predicate == RulePredicate.ALL:
+            grouped, remaining = group_by_field(self.conditions, DoesNotEqualCondition)
+            set_predicates = [self._not_in_set(field, values) for field, values in grouped.items()]
+            ordered = sorted(remaining, key=lambda c: c.cost / max(1.0 - c.selectivity, MIN_SELECTIVITY))
+        else:
+            grouped, remaining = group_by_field(self.conditions, EqualsCondition)
+            set_predicates = [self._in_set(field, values) for field, values in grouped.items()]
+            ordered = sorted(remaining, key=lambda c: c.cost / max(c.selectivity, MIN_SELECTIVITY))
+        predicates = tuple(set_predicates + [condition.compile(now) for condition in ordered])
         
+        if len(predicates) == 1:
+            self._predicate = predicates[0]
+        elif self.predicate == RulePredicate.ALL:
+            def match_all(context: EvaluationContext) -> bool:
+                for predicate in predicates:
+                    if not predicate(context):
+                        return False
+                return True
+            self._predicate = match_all
+        else:
+            def match_any(context: EvaluationContext) -> bool:
+                for predicate in predicates:
+                    if predicate(context):
+                        return True
+                return False
+            self._predicate = match_any
+        return self._predicate
+    
+    @staticmethod
+    def _in_set(field: str, values: frozenset) -> Callable[[EvaluationContext], bool]:
+        return lambda context: context.stripped(field) in values
+    
+    @staticmethod
+    def _not_in_set(field: str, values: frozenset) -> Callable[[EvaluationContext], bool]:
+        return lambda context: context.stripped(field) not in values
+    
+    def equality_keys(self) -> Optional[List[Tuple[str, str]]]:
+        """
+        (field, normalized value) pairs of which the email must satisfy at least one
+        for this rule to match, or None when the rule has no such requirement
+        """
+        if not self.conditions:
+            return []
         if self.predicate == RulePredicate.ALL:
-            return all(results)
-        else:  # ANY
-            return any(results)
+            for condition in self.conditions:
+                if type(condition) is EqualsCondition:
+                    return [(condition.field, condition.search_value)]
+            return None
+        if all(type(condition) is EqualsCondition for condition in self.conditions):
+            return [(condition.field, condition.search_value) for condition in self.conditions]
+        return None
     
-    def apply(self, email_provider: Any, email: Dict) -> List[bool]:
-        """Apply all actions to the email"""
+    def __getstate__(self) -> Dict[str, Any]:
+        # Compiled predicates are closures and cannot be pickled; they are rebuilt on first use
+        state = self.__dict__.copy()
+        state['_predicate'] = None
+        return state
+    
+    def matches(self, email: Dict[str, Any]) -> bool:
+        """Check if email matches rule conditions"""
+        return self.matches_context(EvaluationContext(email))
+    
+    def matches_context(self, context: EvaluationContext) -> bool:
+        """Check a shared EvaluationContext against the compiled conditions"""
+        if self._predicate is None:
+            self.compile()
+        return self._predicate(context)
+    
+    @property
+    def fields(self) -> Set[str]:
+        """Email fields referenced by this rule's conditions"""
+        return {condition.field for condition in self.conditions}
+    
+    def apply(self, email_provider: Any, email: Dict, rate_limiter: Optional[TokenBucket] = None) -> List[bool]:
+        """Apply all actions to the email, waiting on the rate limiter before each one"""
         results = []
         for action in self.actions:
             try:
+                if rate_limiter is not None:
+                    rate_limiter.acquire(action.quota_units)
                 result = action.execute(email_provider, email)
                 results.append(result)
             except Exception as e:
@@ -52,47 +152,146 @@ class Rule:
 class RulesEngine:
     """Main engine for processing rules"""
     
-    def __init__(self, rules: List[Rule]):
+    def __init__(self, rules: List[Rule], now: Optional[datetime] = None,
+                 action_executor: Optional[ActionExecutor] = None):
         self.rules = rules
+        self.action_executor = action_executor or ActionExecutor()
+        self.start_run(now)
+        self.substring_indexes = self._build_substring_indexes(rules)
+        self.equality_index = EqualityIndex()
+        for position, rule in enumerate(rules):
+            self.equality_index.add(position, rule.equality_keys())
         logger.info(f"Initialized RulesEngine with {len(rules)} rules")
     
-    def process_email(self, email_provider: Any, email: Dict[str, Any]) -> Dict[str, Any]:
-        """Process a single email against all rules"""
-        results = {
-            'email_id': email['id'],
-            'email_subject': email.get('subject', '')[:50],
-            'rules_matched': [],
-            'actions_executed': [],
-            'actions_failed': []
-        }
-        
+    def start_run(self, now: Optional[datetime] = None):
+        """
+        Fix the evaluation time for a run and recompile the rules against it,
+        so date cutoffs are computed once and stay consistent for the whole run
+        """
+        self.now = now or datetime.now()
         for rule in self.rules:
+            rule.compile(self.now)
+    
+    @staticmethod
+    def _build_substring_indexes(rules: List[Rule]) -> Dict[str, SubstringIndex]:
+        """Group contains/does_not_contain needles per field into one automaton each"""
+        needles_by_field = {}
+        for rule in rules:
+            for condition in rule.conditions:
+                if isinstance(condition, (ContainsCondition, DoesNotContainCondition)):
+                    needles_by_field.setdefault(condition.field, set()).add(condition.search_value)
+        
+        indexes = {}
+        for field, needles in needles_by_field.items():
+            if len(needles) >= MIN_INDEXED_NEEDLES:
+                indexes[field] = SubstringIndex(sorted(needles))
+                logger.info(f"Indexed {len(needles)} substring needles for '{field}'")
+        return indexes
+    
+    def match_positions(self, email: Dict[str, Any]) -> List[int]:
+        """Positions of the rules matching a single email, in rule order"""
+        # One context per email so every rule shares the normalized field values
+        context = EvaluationContext(email, self.substring_indexes)
+        return self._matching(context, self.equality_index.candidates(context))
+    
+    def _matching(self, context: EvaluationContext, positions: List[int]) -> List[int]:
+        """The candidate rule positions whose rule matches the email in context"""
+        matched = []
+        for position in positions:
+            rule = self.rules[position]
             try:
-                if rule.matches(email):
-                    logger.info(f"  ✓ Rule matched: '{rule.name}'")
-                    results['rules_matched'].append(rule.name)
-                    
-                    action_results = rule.apply(email_provider, email)
-                    
-                    for action, success in zip(rule.actions, action_results):
-                        action_name = type(action).__name__
-                        if success:
-                            results['actions_executed'].append(action_name)
-                        else:
-                            results['actions_failed'].append(action_name)
+                if rule.matches_context(context):
+                    matched.append(position)
             except Exception as e:
                 logger.error(f"Error processing rule '{rule.name}': {str(e)}")
+        return matched
+    
+    def match_batch_positions(self, emails: List[Dict[str, Any]]) -> List[List[int]]:
+        """
+        Matched rule positions for each email. In large batches the rules the equality
+        index cannot dispatch are evaluated column-wise in one pass, while equality-keyed
+        rules are still found per email by hash lookup, so neither index is bypassed.
+        """
+        if len(emails) < VECTORIZE_MIN_BATCH:
+            return [self.match_positions(email) for email in emails]
         
-        return results
+        always = self.equality_index.always
+        columns_by_email = [[] for _ in emails]
+        if always:
+            matrix = match_matrix([self.rules[position] for position in always], emails,
+                                  self.now, self.substring_indexes)
+            if len(always) == len(self.rules):
+                return matched_positions(matrix)
+            columns_by_email = matched_positions(matrix)
+        
+        batch_positions = []
+        for email, columns in zip(emails, columns_by_email):
+            matched = [always[column] for column in columns]
+            context = EvaluationContext(email, self.substring_indexes)
+            keyed = self._matching(context, self.equality_index.keyed_candidates(context))
+            batch_positions.append(sorted(matched + keyed) if keyed else matched)
+        return batch_positions
+    
+    def match_email(self, email: Dict[str, Any]) -> List[Rule]:
+        """Rules matching a single email, in rule order"""
+        return [self.rules[position] for position in self.match_positions(email)]
+    
+    def match_emails(self, emails: List[Dict[str, Any]]) -> List[List[Rule]]:
+        """Rules matching each email"""
+        return [
+            [self.rules[position] for position in positions]
+            for positions in self.match_batch_positions(emails)
+        ]
+    
+    def apply_rules(self, email_provider: Any, email: Dict[str, Any], rules: List[Rule]) -> Dict[str, Any]:
+        """Run the actions of the matched rules on an email"""
+        return self.action_executor.apply(email_provider, email, rules)
+    
+    def process_email(self, email_provider: Any, email: Dict[str, Any]) -> Dict[str, Any]:
+        """Process a single email against all rules"""
+        return self.apply_rules(email_provider, email, self.match_email(email))
     
     def process_emails(self, email_provider: Any, emails: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Process multiple emails"""
         logger.info(f"Processing {len(emails)} emails against {len(self.rules)} rules...")
-        results = []
-        
-        for i, email in enumerate(emails, 1):
-            logger.info(f"\n[{i}/{len(emails)}] Processing: {email.get('subject', 'No Subject')[:60]}")
-            result = self.process_email(email_provider, email)
-            results.append(result)
-        
-        return results
\ No newline at end of file
+        return self.action_executor.apply_all(email_provider, emails, self.match_emails(emails))
+    
+    def required_labels(self) -> Set[str]:
+        """Label names needed by the actions of all rules"""
+        return {label for rule in self.rules for action in rule.actions for label in action.required_labels()}
+    
+    def prepare(self, email_provider: Any) -> Dict[str, str]:
+        """
+        Pre-flight check run before any email is processed: resolve every label the
+        actions need in one lookup and create the missing ones, so a missing label fails
+        the run once instead of failing every email that reaches it
+        """
+        labels = self.required_labels()
+        if not labels:
+            return {}
+        resolved = email_provider.ensure_labels(labels)
+        logger.info(f"Checked {len(labels)} action labels")
+        return resolved
+    
+    def close(self):
+        """Release resources held by the engine"""
+        pass
+    
+    def next_evaluation_at(self, email: Dict[str, Any], now: Optional[datetime] = None) -> Optional[datetime]:
+        """
+        Earliest future time at which a time-dependent condition could start
+        matching this email, as naive local time; None if no rule can change.
+        Defaults to the run's evaluation time, which the date conditions were compiled against.
+        """
+        now = now or self.now
+        upcoming = []
+        for rule in self.rules:
+            for condition in rule.conditions:
+                when = condition.becomes_true_at(email)
+                if when is None:
+                    continue
+                if when.tzinfo is not None:
+                    when = when.astimezone().replace(tzinfo=None)
+                if when > now:
+                    upcoming.append(when)
+        return min(upcoming, default=None)
@@ -0,0 +1,189 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Any, Dict, List, Optional, Set, Tuple
+from utils.rate_limit import TokenBucket
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Gmail quota units for the single messages.modify a coalesced label change costs
+LABEL_CHANGE_QUOTA_UNITS = 5
+
+# Gmail messages.batchModify: up to 1000 ids per call, 50 quota units each
+BULK_MODIFY_SIZE = 1000
+BULK_MODIFY_QUOTA_UNITS = 50
+# Groups smaller than this are cheaper in quota as single changes
+BULK_MODIFY_MIN_EMAILS = BULK_MODIFY_QUOTA_UNITS // LABEL_CHANGE_QUOTA_UNITS
+
+
+class ActionExecutor:
+    """
+    Runs the actions of matched rules against the email provider.
+    Emails are dispatched to a bounded thread pool; the actions of one email
+    always run in order on a single worker. An optional token bucket caps
+    the provider quota units spent per second across all workers.
+    
+    With coalescing, actions that only change labels are folded over the email's
+    label set in rule order, so later rules win, and committed as one change;
+    emails with identical changes are committed together in bulk.
+    """
+    
+    def __init__(self, workers: int = 1, rate_limiter: Optional[TokenBucket] = None,
+                 coalesce: bool = True):
+        self.workers = max(1, workers)
+        self.rate_limiter = rate_limiter
+        self.coalesce = coalesce
+    
+    def plan_labels(self, email_provider: Any, email: Dict[str, Any],
+                    rules: List[Any]) -> Optional[Tuple[Set[str], Set[str]]]:
+        """
+        Combined (add, remove) label delta of all matched actions, or None when
+        the email's labels are unknown or stale, or an action has to be executed directly
+        """
+        if not self.coalesce or email.get('labels') is None:
+            return None
+        
+        current = set(email['labels'])
+        # Labels that disagree with the read state are stale, so a delta planned on them cannot be trusted
+        is_read = email.get('is_read')
+        if is_read is not None and is_read == ('UNREAD' in current):
+            return None
+        labels = set(current)
+        for rule in rules:
+            for action in rule.actions:
+                try:
+                    labels = action.apply_to_labels(email_provider, email, labels)
+                except Exception as e:
+                    logger.error(f"Error planning action {action}: {str(e)}")
+                    return None
+                if labels is None:
+                    return None
+        return labels - current, current - labels
+    
+    def commit_labels(self, email_provider: Any, email: Dict[str, Any],
+                      add_labels: Set[str], remove_labels: Set[str]) -> bool:
+        """Apply a label delta with a single provider call; nothing to change is a success"""
+        if not add_labels and not remove_labels:
+            return True
+        if self.rate_limiter is not None:
+            self.rate_limiter.acquire(LABEL_CHANGE_QUOTA_UNITS)
+        try:
+            return bool(email_provider.modify_labels(email['id'], add_labels, remove_labels))
+        except Exception as e:
+            logger.error(f"Error updating labels of email {email['id']}: {str(e)}")
+            return False
+    
+    def commit_bulk(self, email_provider: Any, email_ids: List[str],
+                    add_labels: Set[str], remove_labels: Set[str]) -> Set[str]:
+        """Apply one label delta to many emails in bulk calls; returns the ids changed"""
+        modified = set()
+        for start in range(0, len(email_ids), BULK_MODIFY_SIZE):
+            chunk = email_ids[start:start + BULK_MODIFY_SIZE]
+            if self.rate_limiter is not None:
+                self.rate_limiter.acquire(BULK_MODIFY_QUOTA_UNITS)
+            try:
+                modified.update(email_provider.bulk_modify(chunk, add_labels, remove_labels))
+            except Exception as e:
+                logger.error(f"Error updating labels of {len(chunk)} emails: {str(e)}")
+        return modified
+    
+    @staticmethod
+    def _new_result(email: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            'email_id': email['id'],
+            'email_subject': email.get('subject', '')[:50],
+            'rules_matched': [],
+            'actions_executed': [],
+            'actions_failed': []
+        }
+    
+    def _execute_actions(self, email_provider: Any, email: Dict[str, Any], rules: List[Any],
+                         results: Dict[str, Any]) -> Dict[str, Any]:
+        """Execute each action of the matched rules in order"""
+        for rule in rules:
+            try:
+                logger.info(f"  ✓ Rule matched: '{rule.name}'")
+                results['rules_matched'].append(rule.name)
+                
+                action_results = rule.apply(email_provider, email, self.rate_limiter)
+                
+                for action, success in zip(rule.actions, action_results):
+                    action_name = type(action).__name__
+                    if success:
+                        results['actions_executed'].append(action_name)
+                    else:
+                        results['actions_failed'].append(action_name)
+            except Exception as e:
+                logger.error(f"Error processing rule '{rule.name}': {str(e)}")
+        
+        return results
+    
+    @staticmethod
+    def _record_coalesced(results: Dict[str, Any], rules: List[Any], success: bool) -> Dict[str, Any]:
+        """Record the matched rules, whose actions all share the outcome of one label change"""
+        for rule in rules:
+            logger.info(f"  ✓ Rule matched: '{rule.name}'")
+            results['rules_matched'].append(rule.name)
+        outcome = 'actions_executed' if success else 'actions_failed'
+        results[outcome].extend(type(action).__name__ for rule in rules for action in rule.actions)
+        return results
+    
+    def _commit_and_record(self, email_provider: Any, email: Dict[str, Any], rules: List[Any],
+                           results: Dict[str, Any], add_labels: Set[str], remove_labels: Set[str]):
+        """Commit one email's label delta and record the outcome"""
+        success = self.commit_labels(email_provider, email, add_labels, remove_labels)
+        return self._record_coalesced(results, rules, success)
+    
+    def apply(self, email_provider: Any, email: Dict[str, Any], rules: List[Any]) -> Dict[str, Any]:
+        """Run the actions of the matched rules on an email"""
+        results = self._new_result(email)
+        delta = self.plan_labels(email_provider, email, rules)
+        if delta is None:
+            return self._execute_actions(email_provider, email, rules, results)
+        return self._commit_and_record(email_provider, email, rules, results, *delta)
+    
+    def apply_all(self, email_provider: Any, emails: List[Dict[str, Any]],
+                  matched_rules: List[List[Any]]) -> List[Dict[str, Any]]:
+        """
+        Run the actions for each email and its matched rules; results keep the email order.
+        Emails sharing the same coalesced label delta are changed with bulk calls.
+        """
+        total = len(emails)
+        results = []
+        # Each task touches a single email, so tasks can run concurrently
+        tasks = []
+        groups = {}
+        
+        for i, (email, rules) in enumerate(zip(emails, matched_rules), 1):
+            logger.info(f"\n[{i}/{total}] Processing: {email.get('subject', 'No Subject')[:60]}")
+            result = self._new_result(email)
+            results.append(result)
+            
+            delta = self.plan_labels(email_provider, email, rules)
+            if delta is None:
+                tasks.append(partial(self._execute_actions, email_provider, email, rules, result))
+            else:
+                key = (frozenset(delta[0]), frozenset(delta[1]))
+                groups.setdefault(key, []).append((email, rules, result))
+        
+        for (add_labels, remove_labels), members in groups.items():
+            # A bulk call costs as much quota as several single changes, so small groups stay single
+            if (add_labels or remove_labels) and len(members) >= BULK_MODIFY_MIN_EMAILS:
+                email_ids = [email['id'] for email, _, _ in members]
+                modified = self.commit_bulk(email_provider, email_ids, add_labels, remove_labels)
+                for email, rules, result in members:
+                    self._record_coalesced(result, rules, email['id'] in modified)
+            else:
+                tasks.extend(
+                    partial(self._commit_and_record, email_provider, email, rules, result, add_labels, remove_labels)
+                    for email, rules, result in members
+                )
+        
+        if self.workers == 1 or len(tasks) <= 1:
+            for task in tasks:
+                task()
+        else:
+            with ThreadPoolExecutor(max_workers=self.workers) as pool:
+                list(pool.map(lambda task: task(), tasks))
+        
+        return results
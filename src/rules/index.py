@@ -0,0 +1,133 @@
+from collections import deque
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+
+class SubstringIndex:
+    """
+    Aho-Corasick automaton over a set of needles.
+    search() finds every needle occurring in a text in a single pass,
+    so the cost grows with the text length rather than the number of needles.
+    """
+    
+    def __init__(self, needles: Iterable[str] = ()):
+        self.needles: List[str] = []
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[FrozenSet[str]] = [frozenset()]
+        self._built = True
+        for needle in needles:
+            self.add(needle)
+    
+    def add(self, needle: str):
+        """Register a needle; the automaton is rebuilt lazily on the next search"""
+        if needle in self.needles:
+            return
+        self.needles.append(needle)
+        self._built = False
+    
+    def build(self):
+        """Build the trie and failure links for the registered needles"""
+        goto = [{}]
+        output = [set()]
+        for needle in self.needles:
+            state = 0
+            for char in needle:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    output.append(set())
+                state = next_state
+            output[state].add(needle)
+        
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in goto[state].items():
+                queue.append(next_state)
+                fallback = fail[state]
+                while fallback and char not in goto[fallback]:
+                    fallback = fail[fallback]
+                fail[next_state] = goto[fallback].get(char, 0)
+                output[next_state] |= output[fail[next_state]]
+        
+        self._goto = goto
+        self._fail = fail
+        self._output = [frozenset(needles) for needles in output]
+        self._built = True
+    
+    def search(self, text: str) -> FrozenSet[str]:
+        """Return every registered needle that occurs in text"""
+        if not self._built:
+            self.build()
+        
+        goto, fail, output = self._goto, self._fail, self._output
+        # The root's output holds the empty needle, which occurs in every text
+        found = set(output[0])
+        state = 0
+        for char in text:
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            if output[state]:
+                found |= output[state]
+        return frozenset(found)
+    
+    def __len__(self):
+        return len(self.needles)
+
+
+class EqualityIndex:
+    """
+    Hash index from (field, normalized value) to the rules that can only match
+    emails with that value, so equality-keyed rules are found by dict lookup
+    instead of being evaluated one by one.
+    """
+    
+    def __init__(self):
+        self._by_field: Dict[str, Dict[str, List[int]]] = {}
+        self._always: List[int] = []
+    
+    def add(self, position: int, keys: Optional[Iterable[Tuple[str, str]]]):
+        """Register a rule position; keys=None means the rule is always a candidate"""
+        if keys is None:
+            self._always.append(position)
+            return
+        for field, value in keys:
+            positions = self._by_field.setdefault(field, {}).setdefault(value, [])
+            if not positions or positions[-1] != position:
+                positions.append(position)
+    
+    @property
+    def always(self) -> List[int]:
+        """Positions of the rules without equality keys, candidates for every email"""
+        return self._always
+    
+    def candidates(self, context: Any) -> List[int]:
+        """Rule positions, in rule order, that may match the email in context"""
+        if not self._by_field:
+            return list(self._always)
+        return sorted(set(self._always).union(self.keyed_candidates(context)))
+    
+    def keyed_candidates(self, context: Any) -> List[int]:
+        """Positions, in rule order, of the equality-keyed rules the email in context has a key of"""
+        positions = set()
+        for field, rules_by_value in self._by_field.items():
+            positions.update(rules_by_value.get(context.stripped(field), ()))
+        return sorted(positions)
+
+
+def group_by_field(conditions: List[Any], condition_class: type) -> Tuple[Dict[str, FrozenSet[str]], List[Any]]:
+    """
+    Split out fields tested by two or more conditions of exactly condition_class,
+    returning {field: normalized values} and the conditions left over
+    """
+    values_by_field = {}
+    for condition in conditions:
+        if type(condition) is condition_class:
+            values_by_field.setdefault(condition.field, []).append(condition.search_value)
+    grouped = {field: frozenset(values) for field, values in values_by_field.items() if len(values) > 1}
+    remaining = [c for c in conditions if not (type(c) is condition_class and c.field in grouped)]
+    return grouped, remaining
@@ -0,0 +1,90 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+from datetime import datetime
+from .engine import Rule, RulesEngine, VECTORIZE_MIN_BATCH
+from .executor import ActionExecutor
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+# Smallest shard sent to a worker, so every shard is still matched column-wise. Batches are
+# split evenly across all workers down to this size; batches of one shard are matched locally
+MIN_SHARD_SIZE = VECTORIZE_MIN_BATCH
+
+# Engine built once per worker process by the pool initializer
+_worker_engine: Optional[RulesEngine] = None
+
+
+def batch_size_for_workers(batch_size: int, workers: int) -> int:
+    """Grow a processing batch size until every worker gets at least one full shard"""
+    if workers <= 1:
+        return batch_size
+    return max(batch_size, workers * MIN_SHARD_SIZE)
+
+
+def _init_worker(rules: List[Rule], now: datetime):
+    """Build the worker's engine from the rule set sent once at pool startup"""
+    global _worker_engine
+    _worker_engine = RulesEngine(rules, now)
+
+
+def _match_shard(emails: List[Dict[str, Any]]) -> List[Tuple[str, List[int]]]:
+    """Match a shard in a worker, returning (email id, matched rule positions) pairs"""
+    positions = _worker_engine.match_batch_positions(emails)
+    return [(email['id'], matched) for email, matched in zip(emails, positions)]
+
+
+class ParallelRulesEngine(RulesEngine):
+    """
+    Rules engine that shards rule matching across a pool of worker processes.
+    Workers only match; actions still run in this process.
+    """
+    
+    def __init__(self, rules: List[Rule], now: Optional[datetime] = None, workers: int = 2,
+                 action_executor: Optional[ActionExecutor] = None):
+        self.workers = max(1, workers)
+        self._executor = None
+        super().__init__(rules, now, action_executor)
+    
+    def start_run(self, now: Optional[datetime] = None):
+        super().start_run(now)
+        # Workers hold rules compiled against the previous run time
+        self.close()
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Start the worker pool on first use, sending it the rules and run time"""
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=_init_worker,
+                initargs=(self.rules, self.now)
+            )
+            logger.info(f"Started {self.workers} rule matching workers")
+        return self._executor
+    
+    def match_batch_positions(self, emails: List[Dict[str, Any]]) -> List[List[int]]:
+        shard_size = max(MIN_SHARD_SIZE, -(-len(emails) // self.workers))
+        if self.workers == 1 or len(emails) <= shard_size:
+            return super().match_batch_positions(emails)
+        
+        shards = [emails[start:start + shard_size] for start in range(0, len(emails), shard_size)]
+        try:
+            # map() keeps shard order, so results line up with the emails
+            results = [pair for shard in self._get_executor().map(_match_shard, shards) for pair in shard]
+        except Exception as e:
+            logger.error(f"Parallel rule matching failed, matching locally: {str(e)}")
+            self.close()
+            return super().match_batch_positions(emails)
+        return [positions for _, positions in results]
+    
+    def close(self):
+        """Shut down the worker pool"""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
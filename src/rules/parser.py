@@ -1,3 +1,4 @@
+import hashlib
 import json
 from typing import List, Dict
 from pathlib import Path
@@ -15,6 +16,7 @@ class RuleParser:
     def __init__(self):
         self.condition_factory = ConditionFactory()
         self.action_factory = ActionFactory()
+        self.rules_version = None
     
     def parse_file(self, filepath: str) -> List[Rule]:
         """Parse rules from JSON file"""
@@ -27,9 +29,16 @@ class RuleParser:
             data = json.load(f)
         
         rules = self.parse_rules(data.get('rules', []))
+        self.rules_version = self.fingerprint(data)
         logger.info(f"Loaded {len(rules)} rules from {filepath}")
         return rules
     
+    @staticmethod
+    def fingerprint(data: Dict) -> str:
+        """Stable hash of a rules definition, used to detect rule changes between runs"""
+        canonical = json.dumps(data, sort_keys=True, separators=(',', ':'))
+        return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+    
     def parse_rules(self, rules_data: List[Dict]) -> List[Rule]:
         """Parse list of rule definitions"""
         rules = []
@@ -0,0 +1,180 @@
+from typing import Any, Dict, List, Optional, Set, Tuple
+from datetime import datetime
+import numpy as np
+from .context import EvaluationContext, to_timestamp
+from .index import group_by_field
+from .conditions.string_conditions import (
+    ContainsCondition,
+    DoesNotContainCondition,
+    EqualsCondition,
+    DoesNotEqualCondition
+)
+from .conditions.date_conditions import DateCondition, SECONDS_PER_DAY
+from utils.logger import setup_logger
+
+logger = setup_logger(__name__)
+
+
+class ColumnarBatch:
+    """
+    Column-oriented view of a batch of emails.
+    Each field is normalized once into a numpy array shared by every rule in the batch.
+    Fields with a SubstringIndex answer contains lookups from one automaton pass per
+    email instead of one column scan per needle.
+    """
+    
+    def __init__(self, emails: List[Dict[str, Any]], substring_indexes: Optional[Dict[str, Any]] = None):
+        self.emails = emails
+        self.size = len(emails)
+        self.substring_indexes = substring_indexes or {}
+        self._lowered: Dict[str, np.ndarray] = {}
+        self._stripped: Dict[str, np.ndarray] = {}
+        self._timestamps: Dict[str, np.ndarray] = {}
+        self._substrings: Dict[Tuple[str, str], np.ndarray] = {}
+        self._searched: Set[str] = set()
+    
+    def lower(self, field: str) -> np.ndarray:
+        """Field values as lowercase strings"""
+        if field not in self._lowered:
+            self._lowered[field] = np.array(
+                [str(email.get(field, '')).lower() for email in self.emails], dtype=str
+            )
+        return self._lowered[field]
+    
+    def stripped(self, field: str) -> np.ndarray:
+        """Field values as lowercase strings without surrounding whitespace"""
+        if field not in self._stripped:
+            self._stripped[field] = np.char.strip(self.lower(field))
+        return self._stripped[field]
+    
+    def timestamps(self, field: str) -> np.ndarray:
+        """Field values as epoch timestamps, NaN where the value is not a date"""
+        if field not in self._timestamps:
+            values = (to_timestamp(email.get(field)) for email in self.emails)
+            self._timestamps[field] = np.fromiter(
+                (np.nan if value is None else value for value in values), dtype=float, count=self.size
+            )
+        return self._timestamps[field]
+    
+    def contains(self, field: str, needle: str) -> np.ndarray:
+        """Whether each lowercased field value contains needle"""
+        key = (field, needle)
+        if key not in self._substrings:
+            index = self.substring_indexes.get(field)
+            if index is not None and field not in self._searched:
+                self._search(field, index)
+            if key not in self._substrings:
+                if index is not None and needle in index.needles:
+                    # Searched, and no email contains it
+                    self._substrings[key] = np.zeros(self.size, dtype=bool)
+                else:
+                    self._substrings[key] = np.char.find(self.lower(field), needle) >= 0
+        return self._substrings[key]
+    
+    def _search(self, field: str, index: Any):
+        """Find every indexed needle in each value of the field with one automaton pass per email"""
+        rows_by_needle: Dict[str, List[int]] = {}
+        for row, value in enumerate(self.lower(field)):
+            for needle in index.search(str(value)):
+                rows_by_needle.setdefault(needle, []).append(row)
+        for needle, rows in rows_by_needle.items():
+            vector = np.zeros(self.size, dtype=bool)
+            vector[rows] = True
+            self._substrings[(field, needle)] = vector
+        self._searched.add(field)
+
+
+def _date_vector(condition: DateCondition, batch: ColumnarBatch, now: datetime) -> np.ndarray:
+    """Compare a date column against the condition's cutoff; invalid dates never match"""
+    name = type(condition).__name__
+    try:
+        cutoff = now.timestamp() - condition.days * SECONDS_PER_DAY
+    except Exception as e:
+        logger.error(f"Error evaluating {name}: {str(e)}")
+        return np.zeros(batch.size, dtype=bool)
+    
+    timestamps = batch.timestamps(condition.field)
+    invalid = int(np.isnan(timestamps).sum())
+    if invalid:
+        logger.error(f"Error evaluating {name}: {invalid} emails have an invalid date")
+    # Comparisons against NaN are False, so invalid dates drop out on their own
+    return timestamps > cutoff if condition.after_cutoff else timestamps < cutoff
+
+
+def _condition_vector(condition: Any, batch: ColumnarBatch, now: datetime) -> np.ndarray:
+    """Evaluate one condition over the whole batch"""
+    kind = type(condition)
+    if kind is ContainsCondition:
+        return batch.contains(condition.field, condition.search_value)
+    if kind is DoesNotContainCondition:
+        return ~batch.contains(condition.field, condition.search_value)
+    if kind is EqualsCondition:
+        return batch.stripped(condition.field) == condition.search_value
+    if kind is DoesNotEqualCondition:
+        return batch.stripped(condition.field) != condition.search_value
+    if isinstance(condition, DateCondition):
+        return _date_vector(condition, batch, now)
+    
+    # Custom conditions fall back to their compiled predicate, row by row
+    predicate = condition.compile(now)
+    return np.fromiter(
+        (predicate(EvaluationContext(email)) for email in batch.emails), dtype=bool, count=batch.size
+    )
+
+
+def rule_vector(rule: Any, batch: ColumnarBatch, now: datetime) -> np.ndarray:
+    """Evaluate a rule over the whole batch, returning one bool per email"""
+    if not rule.conditions:
+        return np.zeros(batch.size, dtype=bool)
+    
+    match_all = rule.predicate.value == 'all'
+    # Same grouping as Rule.compile: several equals on one field become one set lookup
+    grouped_class = DoesNotEqualCondition if match_all else EqualsCondition
+    grouped, remaining = group_by_field(rule.conditions, grouped_class)
+    
+    vectors = []
+    for field, values in grouped.items():
+        in_set = np.isin(batch.stripped(field), list(values))
+        vectors.append(~in_set if match_all else in_set)
+    vectors.extend(_condition_vector(condition, batch, now) for condition in remaining)
+    
+    if match_all:
+        return np.logical_and.reduce(vectors)
+    return np.logical_or.reduce(vectors)
+
+
+def match_matrix(rules: List[Any], emails: List[Dict[str, Any]],
+                 now: Optional[datetime] = None,
+                 substring_indexes: Optional[Dict[str, Any]] = None) -> np.ndarray:
+    """
+    Evaluate every rule against every email.
+    Returns a bool matrix of shape (len(emails), len(rules)).
+    """
+    now = now or datetime.now()
+    batch = ColumnarBatch(emails, substring_indexes)
+    matrix = np.zeros((batch.size, len(rules)), dtype=bool)
+    
+    for position, rule in enumerate(rules):
+        try:
+            matrix[:, position] = rule_vector(rule, batch, now)
+        except Exception as e:
+            logger.error(f"Error evaluating rule '{rule.name}' over batch: {str(e)}")
+            matrix[:, position] = _scalar_vector(rule, batch)
+    
+    return matrix
+
+
+def _scalar_vector(rule: Any, batch: ColumnarBatch) -> np.ndarray:
+    """Evaluate a rule one email at a time, treating errors as no match"""
+    vector = np.zeros(batch.size, dtype=bool)
+    for row, email in enumerate(batch.emails):
+        try:
+            vector[row] = rule.matches(email)
+        except Exception as e:
+            logger.error(f"Error processing rule '{rule.name}': {str(e)}")
+    return vector
+
+
+def matched_positions(matrix: np.ndarray) -> List[List[int]]:
+    """Rule positions matched by each email, in rule order"""
+    return [np.flatnonzero(row).tolist() for row in matrix]
@@ -0,0 +1,57 @@
+import threading
+import time
+from typing import Callable, Optional
+
+# Slack for floating-point refill arithmetic, so a bucket that is full up to
+# rounding does not spin on sub-nanosecond sleeps
+EPSILON = 1e-9
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket rate limiter.
+    Tokens refill continuously at `rate` per second up to `capacity`;
+    acquire() blocks until enough tokens are available.
+    """
+    
+    def __init__(self, rate: float, capacity: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic,
+                 sleep: Callable[[float], None] = time.sleep):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._lock = threading.Lock()
+    
+    def _refill(self):
+        now = self._clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def try_acquire(self, tokens: float = 1) -> bool:
+        """Take tokens if they are available right now"""
+        with self._lock:
+            self._refill()
+            if self.tokens + EPSILON >= tokens:
+                self.tokens = max(0.0, self.tokens - tokens)
+                return True
+            return False
+    
+    def acquire(self, tokens: float = 1) -> float:
+        """Take tokens, waiting for them to refill if needed; returns the seconds waited"""
+        # A request larger than the bucket could never be served, so cap it at a full bucket
+        tokens = min(tokens, self.capacity)
+        waited = 0.0
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens + EPSILON >= tokens:
+                    self.tokens = max(0.0, self.tokens - tokens)
+                    return waited
+                delay = (tokens - self.tokens) / self.rate
+            self._sleep(delay)
+            waited += delay
@@ -1,4 +1,6 @@
 import pytest
+import asyncio
+import httpx
 from datetime import datetime, timedelta
 from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
@@ -11,6 +13,7 @@ sys.path.insert(0, str(Path(__file__).parent.parent / 'src'))
 
 from datastore.email_info import Base as EmailBase, Email
 from datastore.rule_execution import Base as RuleBase, RuleExecution
+from datastore.sync_state import Base as SyncBase
 from datastore.email_datastore import EmailRepository
 from rules.conditions.factory import ConditionFactory
 from rules.actions.factory import ActionFactory
@@ -24,6 +27,7 @@ def test_db():
     engine = create_engine('sqlite:///:memory:')
     EmailBase.metadata.create_all(engine)
     RuleBase.metadata.create_all(engine)
+    SyncBase.metadata.create_all(engine)
     SessionLocal = sessionmaker(bind=engine)
     session = SessionLocal()
     yield session
@@ -126,4 +130,365 @@ def sample_rules_json(tmp_path):
     with open(rules_file, 'w') as f:
         json.dump(rules_data, f)
     
-    return str(rules_file)
\ No newline at end of file
+    return str(rules_file)
+
+def make_raw_message(msg_id, sender='sender@example.com', subject='Hello',
+                     date='Mon, 01 Jan 2024 10:00:00 +0000', labels=None,
+                     thread_id=None):
+    """Build a Gmail API message resource as returned by messages.get"""
+    return {
+        'id': msg_id,
+        'threadId': thread_id or f'thread_{msg_id}',
+        'labelIds': list(labels if labels is not None else ['INBOX', 'UNREAD']),
+        'payload': {
+            'headers': [
+                {'name': 'From', 'value': sender},
+                {'name': 'To', 'value': 'me@example.com'},
+                {'name': 'Subject', 'value': subject},
+                {'name': 'Date', 'value': date},
+            ]
+        }
+    }
+
+
+def make_http_error(status, reason='error', headers=None):
+    """Build a googleapiclient HttpError with the given status code, Gmail error reason and headers"""
+    import httplib2
+    from googleapiclient.errors import HttpError
+    content = json.dumps({'error': {'code': status, 'message': reason, 'errors': [{'reason': reason}]}})
+    return HttpError(httplib2.Response({'status': status, **(headers or {})}), content.encode())
+
+
+class FakeRequest:
+    """Stand-in for googleapiclient.http.HttpRequest"""
+
+    def __init__(self, service, method, handler):
+        self.service = service
+        self.method = method
+        self.handler = handler
+
+    def execute(self):
+        self.service.calls.append(self.method)
+        error = self.service.next_error(self.method)
+        if error is not None:
+            raise error
+        return self.handler()
+
+
+class FakeBatch:
+    """Stand-in for googleapiclient.http.BatchHttpRequest"""
+
+    def __init__(self, service, callback):
+        self.service = service
+        self.callback = callback
+        self.requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self.requests.append((request_id, request))
+
+    def execute(self):
+        self.service.calls.append('batch')
+        self.service.batch_sizes.append(len(self.requests))
+        for request_id, request in self.requests:
+            try:
+                error = self.service.next_error(request.method)
+                if error is not None:
+                    raise error
+                response = request.handler()
+            except Exception as e:
+                self.callback(request_id, None, e)
+            else:
+                self.callback(request_id, response, None)
+
+
+class FakeMessagesResource:
+    """Fake users().messages() resource"""
+
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId, labelIds=None, maxResults=100, pageToken=None, **kwargs):
+        service = self.service
+
+        def handler():
+            ids = [msg_id for msg_id, msg in service.messages_store.items()
+                   if not labelIds or set(labelIds) <= set(msg['labelIds'])]
+            start = int(pageToken or 0)
+            end = start + min(maxResults, service.max_page_size)
+            response = {'messages': [{'id': msg_id} for msg_id in ids[start:end]]}
+            if end < len(ids):
+                response['nextPageToken'] = str(end)
+            return response
+        return FakeRequest(service, 'messages.list', handler)
+
+    def get(self, userId, id, format='full', metadataHeaders=None, **kwargs):
+        service = self.service
+        service.formats.append(format)
+
+        def handler():
+            if id in service.failing_ids:
+                raise make_http_error(service.failing_ids[id])
+            if id not in service.messages_store:
+                raise make_http_error(404, 'not found')
+            message = service.messages_store[id]
+            if format == 'metadata':
+                headers = [h for h in message['payload']['headers']
+                           if metadataHeaders is None or h['name'] in metadataHeaders]
+                return {**message, 'payload': {'headers': headers}}
+            return message
+        return FakeRequest(service, 'messages.get', handler)
+
+
+    def modify(self, userId, id, body, **kwargs):
+        service = self.service
+
+        def handler():
+            if id in service.failing_ids:
+                raise make_http_error(service.failing_ids[id])
+            message = service.messages_store[id]
+            remove = set(body.get('removeLabelIds', []))
+            labels = [l for l in message['labelIds'] if l not in remove]
+            labels += [l for l in body.get('addLabelIds', []) if l not in labels]
+            message['labelIds'] = labels
+            return {'id': id, 'labelIds': labels}
+        return FakeRequest(service, 'messages.modify', handler)
+
+    def batchModify(self, userId, body, **kwargs):
+        service = self.service
+
+        def handler():
+            ids = body['ids']
+            if len(ids) > 1000 or any(msg_id in service.failing_ids for msg_id in ids):
+                raise make_http_error(400)
+            remove = set(body.get('removeLabelIds', []))
+            for msg_id in ids:
+                message = service.messages_store[msg_id]
+                labels = [l for l in message['labelIds'] if l not in remove]
+                labels += [l for l in body.get('addLabelIds', []) if l not in labels]
+                message['labelIds'] = labels
+            return {}
+        return FakeRequest(service, 'messages.batchModify', handler)
+
+
+class FakeLabelsResource:
+    """Fake users().labels() resource"""
+
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId, **kwargs):
+        service = self.service
+        return FakeRequest(service, 'labels.list', lambda: {'labels': list(service.labels_store)})
+
+    def create(self, userId, body, **kwargs):
+        service = self.service
+
+        def handler():
+            label = {'id': f"Label_{len(service.labels_store) + 1}", 'name': body['name']}
+            service.labels_store.append(label)
+            return label
+        return FakeRequest(service, 'labels.create', handler)
+
+
+class FakeHistoryResource:
+    """Fake users().history() resource"""
+
+    def __init__(self, service):
+        self.service = service
+
+    def list(self, userId, startHistoryId, historyTypes=None, pageToken=None, **kwargs):
+        service = self.service
+
+        def handler():
+            if int(startHistoryId) < service.oldest_history_id:
+                raise make_http_error(404, 'startHistoryId too old')
+            records = [r for r in service.history_records if int(r['id']) > int(startHistoryId)]
+            start = int(pageToken or 0)
+            end = start + service.max_page_size
+            response = {'history': records[start:end], 'historyId': str(service.history_id)}
+            if end < len(records):
+                response['nextPageToken'] = str(end)
+            return response
+        return FakeRequest(service, 'history.list', handler)
+
+
+class FakeGmailService:
+    """In-memory fake of the Gmail discovery client used by GmailProvider"""
+
+    def __init__(self, messages=None):
+        self.messages_store = {msg['id']: msg for msg in (messages or [])}
+        self.failing_ids = {}
+        self.max_page_size = 500
+        self.history_id = 1000
+        self.oldest_history_id = 0
+        self.history_records = []
+        self.labels_store = [
+            {'id': 'INBOX', 'name': 'INBOX'},
+            {'id': 'UNREAD', 'name': 'UNREAD'},
+            {'id': 'Label_1', 'name': 'Archive'},
+        ]
+        self.calls = []
+        self.batch_sizes = []
+        self.formats = []
+        self.queued_errors = {}
+
+    def fail_next(self, method, *errors):
+        """Make the next calls of a method (e.g. 'messages.modify') raise these errors, in order"""
+        self.queued_errors.setdefault(method, []).extend(errors)
+
+    def next_error(self, method):
+        errors = self.queued_errors.get(method)
+        return errors.pop(0) if errors else None
+
+    def users(self):
+        return self
+
+    def messages(self):
+        return FakeMessagesResource(self)
+
+    def labels(self):
+        return FakeLabelsResource(self)
+
+    def history(self):
+        return FakeHistoryResource(self)
+
+    def getProfile(self, userId):
+        return FakeRequest(self, 'getProfile', lambda: {
+            'emailAddress': 'me@example.com',
+            'historyId': str(self.history_id),
+        })
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    def _record(self, change_type, msg_id):
+        self.history_id += 1
+        message = self.messages_store.get(msg_id, {'id': msg_id})
+        self.history_records.append({
+            'id': str(self.history_id),
+            change_type: [{'message': {'id': msg_id, 'labelIds': message.get('labelIds', [])}}],
+        })
+
+    def add_message(self, message):
+        """Add a message and record a messageAdded history entry"""
+        self.messages_store = {message['id']: message, **self.messages_store}
+        self._record('messagesAdded', message['id'])
+
+    def delete_message(self, msg_id):
+        """Delete a message and record a messageDeleted history entry"""
+        self.messages_store.pop(msg_id, None)
+        self._record('messagesDeleted', msg_id)
+
+    def change_labels(self, msg_id, add=(), remove=()):
+        """Change labels on a message and record the history entry"""
+        message = self.messages_store[msg_id]
+        message['labelIds'] = [l for l in message['labelIds'] if l not in remove] + list(add)
+        self._record('labelsAdded' if add else 'labelsRemoved', msg_id)
+
+
+class FakeGmailTransport:
+    """
+    httpx transport serving the Gmail REST API from a FakeGmailService,
+    so the async provider sees the same mailbox as the sync one
+    """
+
+    def __init__(self, service, latency=0.0):
+        self.service = service
+        self.latency = latency
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.transport = httpx.MockTransport(self.handle)
+
+    def _route(self, request):
+        service = self.service
+        path = request.url.path.split('/users/me/', 1)[1]
+        params = request.url.params
+        body = json.loads(request.content) if request.content else {}
+        method = request.method
+
+        if method == 'GET' and path == 'messages':
+            return service.messages().list(
+                userId='me', labelIds=params.get_list('labelIds') or None,
+                maxResults=int(params.get('maxResults', 100)), pageToken=params.get('pageToken')
+            )
+        if method == 'POST' and path == 'messages/batchModify':
+            return service.messages().batchModify(userId='me', body=body)
+        if method == 'POST' and path.endswith('/modify'):
+            return service.messages().modify(userId='me', id=path.split('/')[1], body=body)
+        if method == 'GET' and path.startswith('messages/'):
+            return service.messages().get(
+                userId='me', id=path.split('/')[1], format=params.get('format', 'full'),
+                metadataHeaders=params.get_list('metadataHeaders') or None
+            )
+        if path == 'labels':
+            if method == 'POST':
+                return service.labels().create(userId='me', body=body)
+            return service.labels().list(userId='me')
+        if path == 'profile':
+            return service.getProfile(userId='me')
+        if path == 'history':
+            return service.history().list(
+                userId='me', startHistoryId=params['startHistoryId'],
+                historyTypes=params.get_list('historyTypes'), pageToken=params.get('pageToken')
+            )
+        return None
+
+    async def handle(self, request):
+        from googleapiclient.errors import HttpError
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            api_request = self._route(request)
+            if api_request is None:
+                return httpx.Response(404, json={'error': {'code': 404}})
+            try:
+                return httpx.Response(200, json=api_request.execute())
+            except HttpError as e:
+                return httpx.Response(e.resp.status, json={'error': {'code': e.resp.status}})
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.fixture
+def fake_gmail_service():
+    """Fake Gmail service seeded with 250 messages"""
+    return FakeGmailService([
+        make_raw_message(f'msg_{i:03d}', subject=f'Message {i}')
+        for i in range(250)
+    ])
+
+
+@pytest.fixture
+def gmail_provider(fake_gmail_service):
+    """GmailProvider wired to the fake Gmail service"""
+    from provider.gmail_provider import GmailProvider
+    from provider.request_executor import RequestExecutor
+    provider = GmailProvider()
+    provider.service = fake_gmail_service
+    # Retries back off without sleeping
+    provider.requests = RequestExecutor(sleep=lambda seconds: None)
+    return provider
+
+
+
+async def no_sleep(seconds):
+    """Async sleep that returns at once"""
+
+
+@pytest.fixture
+def fake_gmail_transport(fake_gmail_service):
+    """REST transport over the fake Gmail service"""
+    return FakeGmailTransport(fake_gmail_service)
+
+
+@pytest.fixture
+def async_gmail_provider(fake_gmail_transport):
+    """AsyncGmailProvider wired to the fake Gmail REST transport"""
+    from provider.async_gmail_provider import AsyncGmailProvider
+    from provider.request_executor import AsyncAimdLimiter, AsyncRequestExecutor
+    provider = AsyncGmailProvider(transport=fake_gmail_transport.transport)
+    provider.open()
+    # Retries back off without sleeping
+    provider.requests = AsyncRequestExecutor(limiter=AsyncAimdLimiter(provider.max_in_flight), sleep=no_sleep)
+    return provider
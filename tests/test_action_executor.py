@@ -0,0 +1,249 @@
+import pytest
+import threading
+import time
+from unittest.mock import MagicMock
+from rules.engine import Rule, RulesEngine
+from rules.executor import ActionExecutor
+from rules.actions.action import Action
+from rules.actions.mark_actions import MarkAsReadAction
+from rules.conditions.string_conditions import ContainsCondition
+
+
+class RecordingAction(Action):
+    """Action recording the order it ran in, per email"""
+    
+    quota_units = 5
+    
+    def __init__(self, name, log, delay=0.0, result=True):
+        super().__init__({'name': name})
+        self.log = log
+        self.delay = delay
+        self.result = result
+    
+    def execute(self, email_provider, email):
+        time.sleep(self.delay)
+        self.log.append((email['id'], self.parameters['name'], threading.get_ident()))
+        return self.result
+
+
+def make_emails(count):
+    return [{'id': f'msg_{i}', 'subject': f'Subject {i}', 'from': 'boss@company.com'} for i in range(count)]
+
+
+class TestActionExecutor:
+    """Test concurrent, rate-limited action execution"""
+    
+    def test_results_structure(self, sample_email):
+        """Test results match what process_email reports"""
+        log = []
+        rule = Rule('R', 'all', [], [RecordingAction('a', log), RecordingAction('b', log, result=False)])
+        
+        result = ActionExecutor().apply(MagicMock(), sample_email, [rule])
+        
+        assert result == {
+            'email_id': 'test_email_123',
+            'email_subject': 'Urgent: Project Update',
+            'rules_matched': ['R'],
+            'actions_executed': ['RecordingAction'],
+            'actions_failed': ['RecordingAction'],
+        }
+    
+    def test_concurrent_execution_preserves_per_email_order(self):
+        """Test each email's actions run in order on one worker while emails overlap"""
+        log = []
+        first = Rule('First', 'all', [], [RecordingAction('move', log, delay=0.01)])
+        second = Rule('Second', 'all', [], [RecordingAction('read', log), RecordingAction('star', log)])
+        emails = make_emails(8)
+        
+        results = ActionExecutor(workers=4).apply_all(MagicMock(), emails, [[first, second]] * len(emails))
+        
+        assert [r['email_id'] for r in results] == [email['id'] for email in emails]
+        for email in emails:
+            entries = [(name, thread) for email_id, name, thread in log if email_id == email['id']]
+            assert [name for name, _ in entries] == ['move', 'read', 'star']
+            assert len({thread for _, thread in entries}) == 1
+        assert len({thread for _, _, thread in log}) > 1
+    
+    def test_rate_limiter_charged_per_action(self):
+        """Test each action takes its quota units from the limiter"""
+        limiter = MagicMock()
+        rule = Rule('R', 'all', [], [RecordingAction('a', []), MarkAsReadAction()])
+        
+        ActionExecutor(rate_limiter=limiter).apply_all(MagicMock(), make_emails(2), [[rule], []])
+        
+        assert [c.args for c in limiter.acquire.call_args_list] == [(5,), (5,)]
+    
+    def test_engine_uses_executor(self, mock_gmail_provider):
+        """Test process_emails dispatches through the engine's executor"""
+        rule = Rule('Boss', 'all', [ContainsCondition('from', 'boss')], [MarkAsReadAction()])
+        engine = RulesEngine([rule], action_executor=ActionExecutor(workers=3))
+        
+        results = engine.process_emails(mock_gmail_provider, make_emails(5))
+        
+        assert all(r['actions_executed'] == ['MarkAsReadAction'] for r in results)
+        assert mock_gmail_provider.mark_as_read.call_count == 5
+
+
+class TestActionCoalescing:
+    """Test merging label changes into one provider call per email"""
+    
+    @pytest.fixture
+    def provider(self, mock_gmail_provider):
+        mock_gmail_provider.system_labels = frozenset({'INBOX', 'UNREAD', 'IMPORTANT'})
+        mock_gmail_provider._get_label_id.side_effect = lambda name: {'Archive': 'Label_1'}.get(name)
+        mock_gmail_provider.modify_labels.return_value = True
+        return mock_gmail_provider
+    
+    @pytest.fixture
+    def email(self):
+        return {'id': 'msg_1', 'subject': 'Hi', 'labels': ['INBOX', 'UNREAD', 'Label_9']}
+    
+    def test_read_and_move_become_one_modify(self, provider, email):
+        """Test mark-as-read plus move commit as a single label change"""
+        from rules.actions.move_actions import MoveMessageAction
+        rules = [Rule('Read', 'all', [], [MarkAsReadAction()]),
+                 Rule('Archive', 'all', [], [MoveMessageAction({'destination': 'Archive'})])]
+        
+        result = ActionExecutor().apply(provider, email, rules)
+        
+        provider.modify_labels.assert_called_once_with('msg_1', {'Label_1'}, {'UNREAD', 'Label_9'})
+        provider.mark_as_read.assert_not_called()
+        provider.move_email.assert_not_called()
+        assert result['rules_matched'] == ['Read', 'Archive']
+        assert result['actions_executed'] == ['MarkAsReadAction', 'MoveMessageAction']
+    
+    def test_later_rules_win(self, provider, email):
+        """Test conflicting actions resolve in rule order"""
+        from rules.actions.mark_actions import MarkAsUnreadAction
+        rules = [Rule('Read', 'all', [], [MarkAsReadAction()]),
+                 Rule('Unread', 'all', [], [MarkAsUnreadAction()])]
+        
+        result = ActionExecutor().apply(provider, email, rules)
+        
+        provider.modify_labels.assert_not_called()
+        assert result['actions_executed'] == ['MarkAsReadAction', 'MarkAsUnreadAction']
+    
+    def test_failed_change_fails_all_coalesced_actions(self, provider, email):
+        """Test every merged action is reported failed when the change fails"""
+        provider.modify_labels.return_value = False
+        
+        result = ActionExecutor().apply(provider, email, [Rule('Read', 'all', [], [MarkAsReadAction()])])
+        
+        assert result['actions_failed'] == ['MarkAsReadAction']
+        assert result['actions_executed'] == []
+    
+    def test_unknown_labels_execute_each_action(self, provider, email):
+        """Test emails without stored labels fall back to per-action calls"""
+        del email['labels']
+        
+        ActionExecutor().apply(provider, email, [Rule('Read', 'all', [], [MarkAsReadAction()])])
+        
+        provider.mark_as_read.assert_called_once_with('msg_1')
+        provider.modify_labels.assert_not_called()
+    
+    def test_labels_disagreeing_with_read_state_execute_each_action(self, provider, email):
+        """Test an unread email stored without UNREAD is not treated as a no-op"""
+        email.update(labels=['INBOX'], is_read=False)
+        
+        result = ActionExecutor().apply(provider, email, [Rule('Read', 'all', [], [MarkAsReadAction()])])
+        
+        provider.mark_as_read.assert_called_once_with('msg_1')
+        assert result['actions_executed'] == ['MarkAsReadAction']
+    
+    def test_non_label_action_executes_each_action(self, provider, email):
+        """Test a custom action disables coalescing for that email, keeping action order"""
+        log = []
+        rules = [Rule('Mixed', 'all', [], [MarkAsReadAction(), RecordingAction('notify', log)])]
+        
+        result = ActionExecutor().apply(provider, email, rules)
+        
+        provider.mark_as_read.assert_called_once_with('msg_1')
+        assert log and result['actions_executed'] == ['MarkAsReadAction', 'RecordingAction']
+    
+    def test_coalescing_can_be_disabled(self, provider, email):
+        """Test coalesce=False keeps the per-action calls"""
+        ActionExecutor(coalesce=False).apply(provider, email, [Rule('Read', 'all', [], [MarkAsReadAction()])])
+        provider.mark_as_read.assert_called_once_with('msg_1')
+    
+    def test_coalesced_change_charges_rate_limiter_once(self, provider, email):
+        """Test one label change costs one modify worth of quota"""
+        from rules.executor import LABEL_CHANGE_QUOTA_UNITS
+        from rules.actions.move_actions import MoveMessageAction
+        limiter = MagicMock()
+        rules = [Rule('Both', 'all', [], [MarkAsReadAction(), MoveMessageAction({'destination': 'Archive'})])]
+        
+        ActionExecutor(rate_limiter=limiter).apply(provider, email, rules)
+        
+        limiter.acquire.assert_called_once_with(LABEL_CHANGE_QUOTA_UNITS)
+
+
+class TestBulkLabelChanges:
+    """Test grouping identical label deltas into bulk provider calls"""
+    
+    @pytest.fixture
+    def provider(self, mock_gmail_provider):
+        mock_gmail_provider.system_labels = frozenset({'INBOX', 'UNREAD'})
+        mock_gmail_provider.modify_labels.return_value = True
+        mock_gmail_provider.bulk_modify.side_effect = lambda ids, add, remove: list(ids)
+        return mock_gmail_provider
+    
+    @staticmethod
+    def unread_emails(count, prefix='msg'):
+        return [{'id': f'{prefix}_{i}', 'subject': 'S', 'labels': ['INBOX', 'UNREAD']} for i in range(count)]
+    
+    def test_identical_deltas_share_one_bulk_call(self, provider):
+        """Test emails with the same change are committed together"""
+        from rules.executor import BULK_MODIFY_MIN_EMAILS
+        emails = self.unread_emails(BULK_MODIFY_MIN_EMAILS + 5)
+        rule = Rule('Read', 'all', [], [MarkAsReadAction()])
+        
+        results = ActionExecutor().apply_all(provider, emails, [[rule]] * len(emails))
+        
+        provider.bulk_modify.assert_called_once_with([e['id'] for e in emails], frozenset(), frozenset({'UNREAD'}))
+        provider.modify_labels.assert_not_called()
+        assert all(r['actions_executed'] == ['MarkAsReadAction'] for r in results)
+    
+    def test_small_groups_use_single_changes(self, provider):
+        """Test groups too small to pay for a bulk call are changed one by one"""
+        emails = self.unread_emails(3)
+        rule = Rule('Read', 'all', [], [MarkAsReadAction()])
+        
+        ActionExecutor().apply_all(provider, emails, [[rule]] * 3)
+        
+        provider.bulk_modify.assert_not_called()
+        assert provider.modify_labels.call_count == 3
+    
+    def test_groups_by_delta(self, provider):
+        """Test different deltas go to different bulk calls and results keep email order"""
+        from rules.actions.mark_actions import MarkAsUnreadAction
+        read = Rule('Read', 'all', [], [MarkAsReadAction()])
+        unread = Rule('Unread', 'all', [], [MarkAsUnreadAction()])
+        emails = self.unread_emails(12, 'a') + [dict(e, labels=['INBOX']) for e in self.unread_emails(12, 'b')]
+        
+        results = ActionExecutor().apply_all(provider, emails, [[read]] * 12 + [[unread]] * 12)
+        
+        assert provider.bulk_modify.call_count == 2
+        assert [r['email_id'] for r in results] == [e['id'] for e in emails]
+        assert [r['rules_matched'] for r in results] == [['Read']] * 12 + [['Unread']] * 12
+    
+    def test_large_groups_are_chunked_and_rate_limited(self, provider):
+        """Test each bulk call covers at most 1000 emails and is charged its quota"""
+        from rules.executor import BULK_MODIFY_QUOTA_UNITS
+        emails = self.unread_emails(2500)
+        limiter = MagicMock()
+        rule = Rule('Read', 'all', [], [MarkAsReadAction()])
+        
+        ActionExecutor(rate_limiter=limiter).apply_all(provider, emails, [[rule]] * len(emails))
+        
+        assert [len(c.args[0]) for c in provider.bulk_modify.call_args_list] == [1000, 1000, 500]
+        assert [c.args for c in limiter.acquire.call_args_list] == [(BULK_MODIFY_QUOTA_UNITS,)] * 3
+    
+    def test_emails_not_changed_by_bulk_call_fail(self, provider):
+        """Test only the ids the provider reports changed count as executed"""
+        provider.bulk_modify.side_effect = lambda ids, add, remove: list(ids)[:5]
+        emails = self.unread_emails(12)
+        rule = Rule('Read', 'all', [], [MarkAsReadAction()])
+        
+        results = ActionExecutor().apply_all(provider, emails, [[rule]] * 12)
+        
+        assert sum(1 for r in results if r['actions_failed']) == 7
@@ -31,7 +31,16 @@ class TestActions:
         result = action.execute(mock_gmail_provider, sample_email)
         
         assert result is True
-        mock_gmail_provider.move_email.assert_called_once_with('test_email_123', 'Archive')
+        mock_gmail_provider.move_email.assert_called_once_with(
+            'test_email_123', 'Archive', current_labels=['INBOX', 'IMPORTANT']
+        )
+    
+    def test_move_message_action_unknown_labels(self, mock_gmail_provider, sample_email):
+        """Test a move of an email without stored labels lets the provider read them"""
+        email = dict(sample_email, labels=None)
+        
+        assert MoveMessageAction({'destination': 'Archive'}).execute(mock_gmail_provider, email) is True
+        mock_gmail_provider.move_email.assert_called_once_with('test_email_123', 'Archive', current_labels=None)
     
     def test_move_message_action_no_destination(self, mock_gmail_provider, sample_email):
         """Test MoveMessageAction without destination parameter"""
@@ -46,4 +55,21 @@ class TestActions:
         action = MarkAsReadAction()
         result = action.execute(mock_gmail_provider, sample_email)
         
-        assert result is False
\ No newline at end of file
+        assert result is False
+    
+    def test_actions_as_label_changes(self, mock_gmail_provider, sample_email):
+        """Test label-only actions describe their effect on the label set"""
+        mock_gmail_provider.system_labels = frozenset({'INBOX', 'UNREAD'})
+        mock_gmail_provider._get_label_id.return_value = 'Label_1'
+        labels = {'INBOX', 'UNREAD', 'Label_9'}
+        
+        assert MarkAsReadAction().apply_to_labels(mock_gmail_provider, sample_email, labels) == {'INBOX', 'Label_9'}
+        assert MarkAsUnreadAction().apply_to_labels(mock_gmail_provider, sample_email, set()) == {'UNREAD'}
+        moved = MoveMessageAction({'destination': 'Archive'}).apply_to_labels(mock_gmail_provider, sample_email, labels)
+        assert moved == {'INBOX', 'UNREAD', 'Label_1'}
+    
+    def test_move_to_unknown_label_is_not_coalesced(self, mock_gmail_provider, sample_email):
+        """Test a move whose destination cannot be resolved must be executed instead"""
+        mock_gmail_provider._get_label_id.return_value = None
+        action = MoveMessageAction({'destination': 'Missing'})
+        assert action.apply_to_labels(mock_gmail_provider, sample_email, {'INBOX'}) is None
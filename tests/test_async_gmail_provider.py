@@ -0,0 +1,218 @@
+import pytest
+import asyncio
+from provider.async_email_provider import SyncProviderAdapter
+from provider.async_gmail_provider import AsyncGmailProvider
+from provider.email_provider import SyncCursorExpiredError, LabelUnavailableError
+from tests.conftest import make_raw_message
+
+
+class TestAsyncGmailProviderFetch:
+    """Test fetching through the async provider over the fake REST transport"""
+
+    def test_fetch_returns_parsed_emails_in_order(self, async_gmail_provider, fake_gmail_service):
+        """Test messages are parsed and keep the list order"""
+        emails = asyncio.run(async_gmail_provider.fetch_emails(limit=20))
+
+        assert [email['id'] for email in emails] == [f'msg_{i:03d}' for i in range(20)]
+        assert emails[3]['subject'] == 'Message 3'
+        assert emails[0]['is_read'] is False
+        assert set(fake_gmail_service.formats) == {'metadata'}
+
+    def test_requests_run_concurrently_up_to_limit(self, fake_gmail_service):
+        """Test message fetches overlap but never exceed max_in_flight"""
+        from tests.conftest import FakeGmailTransport
+        transport = FakeGmailTransport(fake_gmail_service, latency=0.01)
+        provider = AsyncGmailProvider(max_in_flight=8, transport=transport.transport)
+        provider.open()
+
+        emails = asyncio.run(provider.fetch_emails(limit=40))
+
+        assert len(emails) == 40
+        assert transport.max_in_flight == 8
+
+    def test_iter_emails_follows_pages(self, async_gmail_provider, fake_gmail_service):
+        """Test paging continues until the limit is reached"""
+        fake_gmail_service.max_page_size = 100
+
+        async def collect():
+            return [chunk async for chunk in async_gmail_provider.iter_emails(limit=250)]
+
+        chunks = asyncio.run(collect())
+
+        assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+        assert fake_gmail_service.calls.count('messages.list') == 3
+
+    def test_failed_messages_are_skipped(self, async_gmail_provider, fake_gmail_service):
+        """Test a failing message does not fail the page"""
+        fake_gmail_service.failing_ids['msg_001'] = 500
+
+        emails = asyncio.run(async_gmail_provider.fetch_emails(limit=3))
+
+        assert [email['id'] for email in emails] == ['msg_000', 'msg_002']
+
+    def test_transient_errors_are_retried(self, fake_gmail_transport):
+        """Test 503s and 429s are retried instead of dropping the message, and 429s lower the limit"""
+        import httpx
+        from provider.request_executor import AsyncRequestExecutor, AsyncAimdLimiter
+        from tests.conftest import no_sleep
+        responses = [httpx.Response(503), httpx.Response(429, headers={'retry-after': '0'})]
+
+        async def flaky(request):
+            if request.url.path.endswith('msg_001') and responses:
+                return responses.pop(0)
+            return await fake_gmail_transport.handle(request)
+
+        provider = AsyncGmailProvider(max_in_flight=8, transport=httpx.MockTransport(flaky))
+        provider.requests = AsyncRequestExecutor(limiter=AsyncAimdLimiter(8), sleep=no_sleep)
+        provider.open()
+
+        emails = asyncio.run(provider.fetch_emails(limit=3))
+
+        assert [email['id'] for email in emails] == ['msg_000', 'msg_001', 'msg_002']
+        assert responses == []
+        assert provider.requests.limiter.limit < 8
+
+    def test_fetch_requires_authentication(self):
+        """Test calls before authenticate() fail clearly"""
+        with pytest.raises(RuntimeError):
+            asyncio.run(AsyncGmailProvider().fetch_emails())
+
+    def test_fetch_changes(self, async_gmail_provider, fake_gmail_service):
+        """Test history changes are fetched and the cursor advances"""
+        cursor = asyncio.run(async_gmail_provider.get_sync_cursor())
+        fake_gmail_service.add_message(make_raw_message('msg_new'))
+        fake_gmail_service.delete_message('msg_010')
+
+        changes = asyncio.run(async_gmail_provider.fetch_changes(cursor))
+
+        assert [email['id'] for email in changes['emails']] == ['msg_new']
+        assert changes['deleted_ids'] == ['msg_010']
+        assert int(changes['cursor']) > int(cursor)
+
+    def test_fetch_changes_reports_unfetched_messages(self, async_gmail_provider, fake_gmail_service):
+        """Test messages that failed to fetch are reported so the cursor is not advanced"""
+        cursor = asyncio.run(async_gmail_provider.get_sync_cursor())
+        fake_gmail_service.add_message(make_raw_message('msg_new'))
+        fake_gmail_service.failing_ids['msg_new'] = 500
+
+        changes = asyncio.run(async_gmail_provider.fetch_changes(cursor))
+
+        assert changes['emails'] == []
+        assert changes['failed_ids'] == ['msg_new']
+
+    def test_fetch_changes_expired_cursor(self, async_gmail_provider, fake_gmail_service):
+        """Test a 404 from history is reported as an expired cursor"""
+        fake_gmail_service.oldest_history_id = 500
+
+        with pytest.raises(SyncCursorExpiredError):
+            asyncio.run(async_gmail_provider.fetch_changes('100'))
+
+
+class TestAsyncGmailProviderLabels:
+    """Test label changes through the async provider"""
+
+    def test_concurrent_moves_list_labels_once(self, async_gmail_provider, fake_gmail_service):
+        """Test moves running together share one labels listing"""
+        async def move_all():
+            return await asyncio.gather(*(
+                async_gmail_provider.move_email(f'msg_{i:03d}', 'archive', current_labels=['INBOX', 'UNREAD'])
+                for i in range(10)
+            ))
+
+        assert all(asyncio.run(move_all()))
+        assert fake_gmail_service.calls.count('labels.list') == 1
+        assert fake_gmail_service.messages_store['msg_000']['labelIds'] == ['INBOX', 'UNREAD', 'Label_1']
+
+    def test_move_reads_current_labels(self, async_gmail_provider, fake_gmail_service):
+        """Test a move without known labels reads them first"""
+        assert asyncio.run(async_gmail_provider.move_email('msg_000', 'Archive')) is True
+        assert 'messages.get' in fake_gmail_service.calls
+
+    def test_modify_failure(self, async_gmail_provider, fake_gmail_service):
+        """Test API errors are reported as a failed change"""
+        fake_gmail_service.failing_ids['msg_000'] = 500
+        assert asyncio.run(async_gmail_provider.modify_labels('msg_000', {'Label_1'})) is False
+
+    def test_bulk_modify_reports_failed_chunks(self, async_gmail_provider, fake_gmail_service):
+        """Test bulk changes use batchModify and leave out failed chunks"""
+        for i in range(250, 1200):
+            fake_gmail_service.add_message(make_raw_message(f'msg_{i:04d}'))
+        fake_gmail_service.failing_ids['msg_0300'] = 400
+        ids = list(fake_gmail_service.messages_store)
+
+        modified = asyncio.run(async_gmail_provider.bulk_modify(ids, set(), {'UNREAD'}))
+
+        assert modified == ids[1000:]
+        assert fake_gmail_service.calls.count('messages.batchModify') == 2
+
+    def test_ensure_labels_creates_missing(self, async_gmail_provider, fake_gmail_service):
+        """Test missing labels are created and resolved in one pass"""
+        resolved = asyncio.run(async_gmail_provider.ensure_labels(['Archive', 'Receipts', 'INBOX']))
+
+        assert resolved['Archive'] == 'Label_1'
+        assert resolved['INBOX'] == 'INBOX'
+        assert resolved['Receipts'] == fake_gmail_service.labels_store[-1]['id']
+        assert fake_gmail_service.calls == ['labels.list', 'labels.create']
+
+    def test_ensure_labels_fails_when_labels_cannot_be_listed(self):
+        """Test a failed labels listing fails the pre-flight pass"""
+        import httpx
+        from provider.request_executor import AsyncRequestExecutor
+        from tests.conftest import no_sleep
+        transport = httpx.MockTransport(lambda request: httpx.Response(503))
+        provider = AsyncGmailProvider(transport=transport)
+        provider.requests = AsyncRequestExecutor(sleep=no_sleep)
+        provider.open()
+
+        with pytest.raises(LabelUnavailableError):
+            asyncio.run(provider.ensure_labels(['Receipts']))
+
+
+class TestSyncProviderAdapter:
+    """Test the blocking adapter used by the fetch and process scripts"""
+
+    @pytest.fixture
+    def adapter(self, async_gmail_provider):
+        adapter = SyncProviderAdapter(async_gmail_provider)
+        yield adapter
+        adapter.close()
+
+    def test_fetch_emails(self, adapter):
+        """Test blocking fetches return the async provider's results"""
+        assert len(adapter.fetch_emails(limit=5)) == 5
+
+    def test_iter_emails(self, adapter, fake_gmail_service):
+        """Test the async generator is consumed chunk by chunk"""
+        fake_gmail_service.max_page_size = 100
+        assert [len(chunk) for chunk in adapter.iter_emails(limit=150)] == [100, 50]
+
+    def test_move_action_through_adapter(self, adapter, fake_gmail_service):
+        """Test actions resolve labels through the adapter"""
+        from rules.actions.move_actions import MoveMessageAction
+        email = {'id': 'msg_000', 'subject': 'Message 0', 'labels': ['INBOX', 'UNREAD']}
+
+        assert MoveMessageAction({'destination': 'Archive'}).execute(adapter, email) is True
+        assert 'Label_1' in fake_gmail_service.messages_store['msg_000']['labelIds']
+
+    def test_worker_threads_share_the_loop(self, adapter, fake_gmail_service):
+        """Test action worker threads can call the adapter concurrently"""
+        from rules.engine import Rule
+        from rules.executor import ActionExecutor
+        from rules.actions.mark_actions import MarkAsReadAction
+        rule = Rule('Read all', 'all', [], [MarkAsReadAction()])
+        emails = adapter.fetch_emails(limit=30)
+
+        results = ActionExecutor(workers=4, coalesce=False).apply_all(adapter, emails, [[rule]] * len(emails))
+
+        assert all(result['actions_executed'] == ['MarkAsReadAction'] for result in results)
+        assert not any('UNREAD' in fake_gmail_service.messages_store[email['id']]['labelIds'] for email in emails)
+
+    def test_factory_creates_adapter(self):
+        """Test the factory wraps the async provider when asked"""
+        from provider.factory import EmailProviderFactory
+        adapter = EmailProviderFactory.create('gmail', use_async=True)
+        try:
+            assert isinstance(adapter, SyncProviderAdapter)
+            assert isinstance(adapter.provider, AsyncGmailProvider)
+        finally:
+            adapter.close()
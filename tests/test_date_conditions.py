@@ -76,3 +76,46 @@ class TestDateConditions:
         result = condition.evaluate(email)
         assert isinstance(result, bool)
 
+    
+    def test_compiled_condition_uses_fixed_now(self):
+        """Test compiled cutoffs are relative to the run's evaluation time"""
+        from rules.context import EvaluationContext
+        email = {'received_date': datetime(2024, 1, 10)}
+        condition = LessThanDaysCondition('received_date', 7)
+        
+        assert condition.compile(datetime(2024, 1, 15))(EvaluationContext(email)) is True
+        assert condition.compile(datetime(2024, 1, 20))(EvaluationContext(email)) is False
+    
+    def test_timezone_aware_dates(self):
+        """Test aware and naive dates are compared on the same clock"""
+        from datetime import timezone
+        from rules.context import EvaluationContext
+        now = datetime(2024, 1, 15, tzinfo=timezone.utc)
+        email = {'received_date': datetime(2024, 1, 14, 23, tzinfo=timezone.utc)}
+        
+        assert LessThanDaysCondition('received_date', 1).compile(now)(EvaluationContext(email)) is True
+        assert GreaterThanDaysCondition('received_date', 1).compile(now)(EvaluationContext(email)) is False
+    
+    def test_invalid_condition_value(self):
+        """Test a non-numeric value never matches instead of raising"""
+        condition = GreaterThanDaysCondition('received_date', 'soon')
+        assert condition.evaluate({'received_date': datetime(2020, 1, 1)}) is False
+    
+    def test_missing_date(self):
+        """Test an email without a date never matches"""
+        assert LessThanDaysCondition('received_date', 7).evaluate({}) is False
+        assert GreaterThanDaysCondition('received_date', 7).evaluate({'received_date': 'not a date'}) is False
+    
+    def test_engine_fixes_now_per_run(self):
+        """Test every email in a run is evaluated against the same cutoff"""
+        from rules.engine import Rule, RulesEngine
+        from rules.actions.mark_actions import MarkAsReadAction
+        from unittest.mock import MagicMock
+        rule = Rule('Recent', 'all', [LessThanDaysCondition('received_date', 7)], [MarkAsReadAction()])
+        engine = RulesEngine([rule], now=datetime(2024, 1, 15))
+        email = {'id': '1', 'subject': 'x', 'received_date': datetime(2024, 1, 10)}
+        
+        assert engine.process_email(MagicMock(), email)['rules_matched'] == ['Recent']
+        
+        engine.start_run(datetime(2024, 3, 1))
+        assert engine.process_email(MagicMock(), email)['rules_matched'] == []
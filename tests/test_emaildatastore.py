@@ -16,6 +16,39 @@ class TestEmailRepository:
         new_count = email_repository.save_emails([sample_email])
         assert new_count == 0  # No new emails
     
+    def test_save_emails_in_bulk(self, email_repository, sample_email):
+        """Test a large save is split into chunked bulk statements"""
+        from sqlalchemy import event
+        emails = [dict(sample_email, id=f'bulk_{i}') for i in range(1200)]
+        statements = []
+        event.listen(email_repository.engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args: statements.append(statement))
+        
+        new_count = email_repository.save_emails(emails)
+        
+        assert new_count == 1200
+        selects = [s for s in statements if s.lstrip().upper().startswith('SELECT')]
+        assert len(selects) == 3
+    
+    def test_save_emails_updates_existing(self, email_repository, sample_email, old_email):
+        """Test a mixed save reports new rows and updates read state"""
+        email_repository.save_emails([sample_email])
+        
+        new_count = email_repository.save_emails([dict(sample_email, is_read=True), old_email])
+        
+        assert new_count == 1
+        emails = {e.provider_id: e for e in email_repository.get_all_emails()}
+        assert emails[sample_email['id']].is_read is True
+    
+    def test_save_emails_with_duplicates_in_batch(self, email_repository, sample_email):
+        """Test the same message twice in one save is stored once"""
+        new_count = email_repository.save_emails([sample_email, dict(sample_email, is_read=True)])
+        
+        assert new_count == 1
+        emails = email_repository.get_all_emails()
+        assert len(emails) == 1
+        assert emails[0].is_read is True
+    
     def test_get_all_emails(self, email_repository, sample_email, old_email):
         """Test retrieving all emails"""
         email_repository.save_emails([sample_email, old_email])
@@ -28,6 +61,80 @@ class TestEmailRepository:
         emails = email_repository.get_emails_for_processing()
         assert len(emails) >= 1
     
+    def test_iter_emails_for_processing(self, email_repository, sample_email):
+        """Test keyset batches cover every email once, newest first"""
+        from datetime import timedelta
+        emails = [
+            dict(sample_email, id=f'email_{i}',
+                 received_date=sample_email['received_date'] - timedelta(days=i // 3))
+            for i in range(10)
+        ]
+        email_repository.save_emails(emails)
+        
+        batches = list(email_repository.iter_emails_for_processing(batch_size=4))
+        
+        assert [len(batch) for batch in batches] == [4, 4, 2]
+        flattened = [email for batch in batches for email in batch]
+        assert sorted(e['id'] for e in flattened) == sorted(e['id'] for e in emails)
+        dates = [e['received_date'] for e in flattened]
+        assert dates == sorted(dates, reverse=True)
+    
+    def test_iter_emails_for_processing_yields_dicts(self, email_repository, sample_email):
+        """Test batches contain the same dicts as Email.to_dict()"""
+        email_repository.save_emails([sample_email])
+        
+        batch = next(email_repository.iter_emails_for_processing())
+        
+        assert batch == [email_repository.get_all_emails()[0].to_dict()]
+    
+    def test_iter_emails_for_processing_empty(self, email_repository):
+        """Test an empty store yields no batches"""
+        assert list(email_repository.iter_emails_for_processing()) == []
+    
+    def test_processed_emails_are_not_pending(self, email_repository, sample_email, old_email):
+        """Test only unevaluated emails are returned for a rules version"""
+        email_repository.save_emails([sample_email, old_email])
+        email_repository.mark_processed([sample_email['id']], 'v1')
+        
+        pending = email_repository.get_emails_for_processing(rules_version='v1')
+        
+        assert [e.provider_id for e in pending] == [old_email['id']]
+    
+    def test_changed_email_is_pending_again(self, email_repository, sample_email):
+        """Test an email updated after evaluation is re-evaluated"""
+        email_repository.save_emails([sample_email])
+        email_repository.mark_processed([sample_email['id']], 'v1')
+        
+        email_repository.save_emails([sample_email])
+        assert email_repository.get_emails_for_processing(rules_version='v1') == []
+        
+        email_repository.save_emails([dict(sample_email, is_read=True)])
+        assert len(email_repository.get_emails_for_processing(rules_version='v1')) == 1
+    
+    def test_rules_change_makes_emails_pending(self, email_repository, sample_email):
+        """Test a new rules version re-evaluates every email"""
+        email_repository.save_emails([sample_email])
+        email_repository.mark_processed([sample_email['id']], 'v1')
+        
+        assert list(email_repository.iter_emails_for_processing(rules_version='v1')) == []
+        assert len(next(email_repository.iter_emails_for_processing(rules_version='v2'))) == 1
+    
+    def test_due_reevaluation_makes_email_pending(self, email_repository, sample_email):
+        """Test emails become pending when their next evaluation time passes"""
+        from datetime import datetime, timedelta
+        email_repository.save_emails([sample_email])
+        email_repository.mark_processed(
+            [sample_email['id']], 'v1',
+            next_evaluation_at={sample_email['id']: datetime.now() + timedelta(days=1)}
+        )
+        assert email_repository.get_emails_for_processing(rules_version='v1') == []
+        
+        email_repository.mark_processed(
+            [sample_email['id']], 'v1',
+            next_evaluation_at={sample_email['id']: datetime.now() - timedelta(seconds=1)}
+        )
+        assert len(email_repository.get_emails_for_processing(rules_version='v1')) == 1
+    
     def test_log_rule_execution(self, email_repository, sample_email):
         """Test logging rule execution"""
         email_repository.save_emails([sample_email])
@@ -43,6 +150,23 @@ class TestEmailRepository:
         assert executions[0].rule_name == 'Test Rule'
         assert executions[0].matched is True
     
+    def test_log_rule_executions_bulk(self, email_repository, sample_email, old_email):
+        """Test logging many rule executions in one call"""
+        logged = email_repository.log_rule_executions_bulk([
+            {'email_id': sample_email['id'], 'rule_name': 'Rule A', 'matched': True, 'actions': ['MarkAsReadAction']},
+            {'email_id': sample_email['id'], 'rule_name': 'Rule B', 'matched': True, 'actions': []},
+            {'email_id': old_email['id'], 'rule_name': 'Rule A', 'matched': True, 'actions': ['MarkAsReadAction']},
+        ])
+        
+        assert logged == 3
+        executions = email_repository.get_rule_executions(sample_email['id'])
+        assert sorted(e.rule_name for e in executions) == ['Rule A', 'Rule B']
+        assert executions[0].executed_at is not None
+    
+    def test_log_rule_executions_bulk_empty(self, email_repository):
+        """Test an empty bulk log is a no-op"""
+        assert email_repository.log_rule_executions_bulk([]) == 0
+    
     def test_email_to_dict(self, email_repository, sample_email):
         """Test email model to_dict method"""
         email_repository.save_emails([sample_email])
@@ -51,4 +175,87 @@ class TestEmailRepository:
         
         assert email_dict['id'] == sample_email['id']
         assert email_dict['from'] == sample_email['from']
-        assert email_dict['subject'] == sample_email['subject']
\ No newline at end of file
+        assert email_dict['subject'] == sample_email['subject']
+        assert email_dict['thread_id'] == sample_email['thread_id']
+        assert email_dict['labels'] == sample_email['labels']
+    
+    def test_save_emails_updates_labels(self, email_repository, sample_email):
+        """Test label changes are stored and reindexed"""
+        email_repository.save_emails([sample_email])
+        email_repository.save_emails([dict(sample_email, labels=['INBOX', 'Label_7'])])
+        
+        assert email_repository.get_all_emails()[0].to_dict()['labels'] == ['INBOX', 'Label_7']
+        assert email_repository.get_emails_with_label('IMPORTANT') == []
+        assert len(email_repository.get_emails_with_label('Label_7')) == 1
+    
+    def test_save_emails_fills_legacy_rows(self, email_repository, sample_email):
+        """Test rows stored before thread ids and labels were kept get them on re-fetch"""
+        from sqlalchemy import text
+        email_repository.save_emails([sample_email])
+        with email_repository.engine.begin() as conn:
+            conn.execute(text("UPDATE email_info SET thread_id = NULL, labels = NULL"))
+        assert email_repository.get_all_emails()[0].to_dict()['labels'] is None
+        
+        email_repository.save_emails([sample_email])
+        
+        email_dict = email_repository.get_all_emails()[0].to_dict()
+        assert email_dict['thread_id'] == sample_email['thread_id']
+        assert email_dict['labels'] == sample_email['labels']
+    
+    def test_get_emails_with_label(self, email_repository, sample_email, old_email):
+        """Test label lookup through the association table"""
+        email_repository.save_emails([sample_email, old_email])
+        
+        inbox = email_repository.get_emails_with_label('INBOX')
+        newsletters = email_repository.get_emails_with_label('NEWSLETTER')
+        
+        assert len(inbox) == 2
+        assert [e.provider_id for e in newsletters] == [old_email['id']]
+    
+    def test_existing_database_gets_new_columns(self, tmp_path):
+        """Test columns added since a database was created are migrated"""
+        from sqlalchemy import create_engine, inspect, text
+        from datastore.email_datastore import EmailRepository
+        database_url = f"sqlite:///{tmp_path / 'old.db'}"
+        engine = create_engine(database_url)
+        with engine.begin() as conn:
+            conn.execute(text(
+                "CREATE TABLE email_info (id INTEGER PRIMARY KEY, provider_id VARCHAR(255), "
+                "provider_type INTEGER, from_address VARCHAR(500), to_address TEXT, subject TEXT, "
+                "received_date DATETIME, is_read BOOLEAN, created_at DATETIME, updated_at DATETIME)"
+            ))
+        
+        repo = EmailRepository(database_url)
+        
+        columns = {c['name'] for c in inspect(repo.engine).get_columns('email_info')}
+        assert {'thread_id', 'labels'} <= columns
+    
+    def test_sync_cursor_roundtrip(self, email_repository):
+        """Test storing and updating the sync cursor"""
+        assert email_repository.get_sync_cursor('gmail') is None
+        
+        email_repository.save_sync_cursor('100', provider_type='gmail')
+        email_repository.save_sync_cursor('250', provider_type='gmail')
+        
+        assert email_repository.get_sync_cursor('gmail') == '250'
+    
+    def test_delete_emails(self, email_repository, sample_email, old_email):
+        """Test deleting emails removed from the mailbox"""
+        email_repository.save_emails([sample_email, old_email])
+        
+        deleted = email_repository.delete_emails([sample_email['id'], 'unknown'])
+        
+        assert deleted == 1
+        assert len(email_repository.get_all_emails()) == 1
+    
+    def test_cached_labels_roundtrip(self, email_repository):
+        """Test saving a label list replaces the stored one"""
+        assert email_repository.get_cached_labels() is None
+        
+        email_repository.save_cached_labels([{'id': 'Label_1', 'name': 'Archive'}])
+        email_repository.save_cached_labels([{'id': 'Label_2', 'name': 'Receipts'}])
+        
+        labels, saved_at = email_repository.get_cached_labels()
+        assert labels == [{'id': 'Label_2', 'name': 'Receipts'}]
+        assert isinstance(saved_at, datetime)
+        assert email_repository.get_cached_labels('gmail', 'other@example.com') is None
@@ -0,0 +1,71 @@
+import pytest
+from fetch_emails_main import sync_mailbox
+from tests.conftest import make_raw_message
+
+
+class TestSyncMailbox:
+    """Test full and incremental mailbox sync"""
+    
+    def test_first_run_does_full_sync_and_stores_cursor(self, gmail_provider, email_repository):
+        """Test the first run lists the mailbox and records the history id"""
+        fetched, new_count = sync_mailbox(gmail_provider, email_repository)
+        
+        assert fetched == new_count > 0
+        assert email_repository.get_sync_cursor('gmail') == '1000'
+    
+    def test_second_run_is_incremental(self, gmail_provider, fake_gmail_service, email_repository):
+        """Test later runs only pull history since the stored cursor"""
+        sync_mailbox(gmail_provider, email_repository)
+        fake_gmail_service.add_message(make_raw_message('new_1'))
+        fake_gmail_service.delete_message('msg_000')
+        fake_gmail_service.calls.clear()
+        
+        fetched, new_count = sync_mailbox(gmail_provider, email_repository)
+        
+        assert (fetched, new_count) == (1, 1)
+        assert 'messages.list' not in fake_gmail_service.calls
+        assert email_repository.get_sync_cursor('gmail') == '1002'
+        ids = {email.provider_id for email in email_repository.get_all_emails()}
+        assert 'new_1' in ids
+        assert 'msg_000' not in ids
+    
+    def test_cursor_kept_when_changes_cannot_be_fetched(self, gmail_provider, fake_gmail_service,
+                                                        email_repository):
+        """Test a failed message fetch leaves the cursor so the change is fetched again"""
+        sync_mailbox(gmail_provider, email_repository)
+        fake_gmail_service.add_message(make_raw_message('new_1'))
+        fake_gmail_service.add_message(make_raw_message('new_2'))
+        fake_gmail_service.failing_ids['new_2'] = 500
+        
+        sync_mailbox(gmail_provider, email_repository)
+        
+        assert email_repository.get_sync_cursor('gmail') == '1000'
+        del fake_gmail_service.failing_ids['new_2']
+        
+        fetched, new_count = sync_mailbox(gmail_provider, email_repository)
+        
+        assert (fetched, new_count) == (2, 1)
+        assert email_repository.get_sync_cursor('gmail') == '1002'
+    
+    def test_expired_cursor_falls_back_to_full_sync(self, gmail_provider, fake_gmail_service, email_repository):
+        """Test an expired cursor triggers a full re-list"""
+        email_repository.save_sync_cursor('10', provider_type='gmail')
+        fake_gmail_service.oldest_history_id = 500
+        
+        fetched, _ = sync_mailbox(gmail_provider, email_repository)
+        
+        assert fetched > 0
+        assert 'messages.list' in fake_gmail_service.calls
+        assert email_repository.get_sync_cursor('gmail') == '1000'
+    
+    def test_main_closes_provider_on_failure(self, mocker):
+        """Test the provider's connections are released even when the run fails"""
+        import fetch_emails_main
+        provider = mocker.MagicMock()
+        provider.authenticate.side_effect = RuntimeError('no token')
+        mocker.patch.object(fetch_emails_main.EmailProviderFactory, 'create', return_value=provider)
+        
+        with pytest.raises(SystemExit):
+            fetch_emails_main.main()
+        
+        provider.close.assert_called_once_with()
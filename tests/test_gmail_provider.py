@@ -0,0 +1,330 @@
+import pytest
+from provider.gmail_provider import GmailProvider
+
+
+class TestGmailProviderFetch:
+    """Test GmailProvider fetching against a fake Gmail service"""
+
+    def test_fetch_uses_batch_requests(self, gmail_provider, fake_gmail_service):
+        """Test message details are fetched in batches of at most 100"""
+        emails = gmail_provider.fetch_emails(limit=250)
+
+        assert len(emails) == 250
+        assert fake_gmail_service.batch_sizes == [100, 100, 50]
+        assert fake_gmail_service.calls.count('batch') == 3
+
+    def test_fetch_preserves_list_order(self, gmail_provider):
+        """Test parsed emails come back in messages.list order"""
+        emails = gmail_provider.fetch_emails(limit=5)
+        assert [e['id'] for e in emails] == ['msg_000', 'msg_001', 'msg_002', 'msg_003', 'msg_004']
+
+    def test_fetch_returns_parsed_emails(self, gmail_provider):
+        """Test batched results match _parse_email output"""
+        email = gmail_provider.fetch_emails(limit=1)[0]
+
+        assert email['id'] == 'msg_000'
+        assert email['from'] == 'sender@example.com'
+        assert email['subject'] == 'Message 0'
+        assert email['is_read'] is False
+        assert email['labels'] == ['INBOX', 'UNREAD']
+
+    def test_fetch_skips_failed_items_in_batch(self, gmail_provider, fake_gmail_service):
+        """Test per-item errors inside a batch do not drop the whole batch"""
+        fake_gmail_service.failing_ids['msg_001'] = 500
+        emails = gmail_provider.fetch_emails(limit=3)
+        assert [e['id'] for e in emails] == ['msg_000', 'msg_002']
+
+    def test_batch_size_is_capped(self):
+        """Test batch size never exceeds Gmail's per-batch limit"""
+        assert GmailProvider(batch_size=500).batch_size == 100
+        assert GmailProvider(batch_size=0).batch_size == 1
+
+    def test_fetch_requires_authentication(self):
+        """Test fetching without authenticating raises"""
+        with pytest.raises(RuntimeError, match="Not authenticated"):
+            GmailProvider().fetch_emails()
+
+
+class TestGmailProviderPaging:
+    """Test paginated, streaming fetch"""
+
+    def test_iter_emails_follows_page_tokens(self, gmail_provider, fake_gmail_service):
+        """Test iter_emails yields one chunk per messages.list page"""
+        chunks = list(gmail_provider.iter_emails(page_size=100))
+
+        assert [len(chunk) for chunk in chunks] == [100, 100, 50]
+        assert fake_gmail_service.calls.count('messages.list') == 3
+
+    def test_iter_emails_respects_limit_across_pages(self, gmail_provider):
+        """Test the limit can span several pages"""
+        chunks = list(gmail_provider.iter_emails(limit=120, page_size=50))
+        assert [len(chunk) for chunk in chunks] == [50, 50, 20]
+
+    def test_iter_emails_without_limit_fetches_everything(self, gmail_provider, fake_gmail_service):
+        """Test a missing limit walks the whole mailbox"""
+        fake_gmail_service.max_page_size = 80
+        emails = [e for chunk in gmail_provider.iter_emails() for e in chunk]
+        assert len(emails) == 250
+
+    def test_iter_emails_is_lazy(self, gmail_provider, fake_gmail_service):
+        """Test pages are only requested as chunks are consumed"""
+        chunks = gmail_provider.iter_emails(page_size=100)
+        next(chunks)
+        assert fake_gmail_service.calls.count('messages.list') == 1
+
+    def test_fetch_emails_beyond_one_page(self, gmail_provider, fake_gmail_service):
+        """Test fetch_emails is no longer capped at a single page"""
+        fake_gmail_service.max_page_size = 100
+        assert len(gmail_provider.fetch_emails(limit=250)) == 250
+
+
+class TestGmailProviderHistory:
+    """Test incremental sync against a fake history endpoint"""
+
+    def test_get_sync_cursor(self, gmail_provider):
+        """Test the cursor comes from the mailbox profile"""
+        assert gmail_provider.get_sync_cursor() == '1000'
+
+    def test_fetch_changes_returns_added_and_deleted(self, gmail_provider, fake_gmail_service):
+        """Test added messages are fetched and deleted ids reported"""
+        from tests.conftest import make_raw_message
+        fake_gmail_service.add_message(make_raw_message('new_1', subject='Fresh'))
+        fake_gmail_service.delete_message('msg_005')
+
+        changes = gmail_provider.fetch_changes('1000')
+
+        assert [e['id'] for e in changes['emails']] == ['new_1']
+        assert changes['deleted_ids'] == ['msg_005']
+        assert changes['cursor'] == '1002'
+
+    def test_fetch_changes_refetches_relabelled_messages(self, gmail_provider, fake_gmail_service):
+        """Test label changes refresh the message state"""
+        fake_gmail_service.change_labels('msg_010', remove=['UNREAD'])
+
+        changes = gmail_provider.fetch_changes('1000')
+
+        assert changes['emails'][0]['id'] == 'msg_010'
+        assert changes['emails'][0]['is_read'] is True
+
+    def test_fetch_changes_drops_added_then_deleted(self, gmail_provider, fake_gmail_service):
+        """Test a message added and deleted in the same window is only deleted"""
+        from tests.conftest import make_raw_message
+        fake_gmail_service.add_message(make_raw_message('short_lived'))
+        fake_gmail_service.delete_message('short_lived')
+
+        changes = gmail_provider.fetch_changes('1000')
+
+        assert changes['emails'] == []
+        assert changes['deleted_ids'] == ['short_lived']
+
+    def test_fetch_changes_reports_unfetched_messages(self, gmail_provider, fake_gmail_service):
+        """Test messages that failed to fetch are reported, and vanished ones count as deleted"""
+        fake_gmail_service.change_labels('msg_010', remove=['UNREAD'])
+        fake_gmail_service.change_labels('msg_011', remove=['UNREAD'])
+        fake_gmail_service.failing_ids['msg_010'] = 400
+        del fake_gmail_service.messages_store['msg_011']
+
+        changes = gmail_provider.fetch_changes('1000')
+
+        assert changes['emails'] == []
+        assert changes['failed_ids'] == ['msg_010']
+        assert changes['deleted_ids'] == ['msg_011']
+
+    def test_fetch_changes_with_nothing_new_is_cheap(self, gmail_provider, fake_gmail_service):
+        """Test an idle mailbox costs a single history call"""
+        changes = gmail_provider.fetch_changes('1000')
+
+        assert changes['emails'] == []
+        assert fake_gmail_service.calls == ['history.list']
+
+    def test_fetch_changes_expired_cursor(self, gmail_provider, fake_gmail_service):
+        """Test an expired cursor raises SyncCursorExpiredError"""
+        from provider.email_provider import SyncCursorExpiredError
+        fake_gmail_service.oldest_history_id = 900
+
+        with pytest.raises(SyncCursorExpiredError):
+            gmail_provider.fetch_changes('500')
+
+
+class TestGmailProviderFetchFormat:
+    """Test fetch profile selection"""
+
+    def test_default_fetch_uses_metadata(self, gmail_provider, fake_gmail_service):
+        """Test headers-only metadata is requested by default"""
+        email = gmail_provider.fetch_emails(limit=1)[0]
+
+        assert set(fake_gmail_service.formats) == {'metadata'}
+        assert email['from'] == 'sender@example.com'
+        assert email['received_date'].year == 2024
+
+    def test_configure_fetch_for_header_fields(self, gmail_provider):
+        """Test header-only rule fields keep the metadata format"""
+        assert gmail_provider.configure_fetch({'from', 'subject', 'received_date'}) == 'metadata'
+
+    def test_configure_fetch_for_body_fields(self, gmail_provider, fake_gmail_service):
+        """Test a rule on a body field switches to full messages"""
+        assert gmail_provider.configure_fetch({'subject', 'body'}) == 'full'
+
+        gmail_provider.fetch_emails(limit=1)
+        assert fake_gmail_service.formats == ['full']
+
+
+class TestGmailProviderLabels:
+    """Test label-changing calls against the fake Gmail service"""
+
+    def test_parse_email_includes_thread_id(self, gmail_provider):
+        """Test thread ids are carried through fetches"""
+        email = gmail_provider.fetch_emails(limit=1)[0]
+        assert email['thread_id'] == 'thread_msg_000'
+
+    def test_move_email_reads_current_labels(self, gmail_provider, fake_gmail_service):
+        """Test move without known labels reads them from the API"""
+        assert gmail_provider.move_email('msg_000', 'Archive') is True
+        assert 'messages.get' in fake_gmail_service.calls
+        assert 'Label_1' in fake_gmail_service.messages_store['msg_000']['labelIds']
+
+    def test_move_email_with_stored_labels_skips_lookup(self, gmail_provider, fake_gmail_service):
+        """Test move with stored labels needs no messages.get"""
+        assert gmail_provider.move_email('msg_000', 'Archive', current_labels=['INBOX', 'UNREAD']) is True
+        assert 'messages.get' not in fake_gmail_service.calls
+        assert fake_gmail_service.calls.count('messages.modify') == 1
+
+    def test_modify_labels_in_one_call(self, gmail_provider, fake_gmail_service):
+        """Test adds and removes are sent as a single messages.modify"""
+        assert gmail_provider.modify_labels('msg_000', {'Label_1'}, {'UNREAD', 'INBOX'}) is True
+        assert fake_gmail_service.calls == ['messages.modify']
+        assert fake_gmail_service.messages_store['msg_000']['labelIds'] == ['Label_1']
+
+    def test_modify_labels_failure(self, gmail_provider, fake_gmail_service):
+        """Test API errors are reported as a failed change"""
+        fake_gmail_service.failing_ids['msg_000'] = 500
+        assert gmail_provider.modify_labels('msg_000', {'Label_1'}, set()) is False
+
+    def test_bulk_modify_chunks_ids(self, gmail_provider, fake_gmail_service):
+        """Test bulk changes use batchModify with at most 1000 ids per call"""
+        from tests.conftest import make_raw_message
+        for i in range(250, 1200):
+            fake_gmail_service.add_message(make_raw_message(f'msg_{i:04d}'))
+        ids = list(fake_gmail_service.messages_store)
+
+        modified = gmail_provider.bulk_modify(ids, {'Label_1'}, {'UNREAD'})
+
+        assert modified == ids
+        assert fake_gmail_service.calls == ['messages.batchModify', 'messages.batchModify']
+        assert all(m['labelIds'][-1] == 'Label_1' and 'UNREAD' not in m['labelIds']
+                   for m in fake_gmail_service.messages_store.values())
+
+    def test_bulk_modify_reports_failed_chunks(self, gmail_provider, fake_gmail_service):
+        """Test ids in a failed call are left out of the result"""
+        fake_gmail_service.failing_ids['msg_000'] = 400
+        ids = list(fake_gmail_service.messages_store)
+
+        assert gmail_provider.bulk_modify(ids, set(), {'UNREAD'}) == []
+
+
+class TestGmailProviderLabelCache:
+    """Test label lookups go through the provider's label registry"""
+
+    def test_moves_list_labels_once(self, gmail_provider, fake_gmail_service):
+        """Test many moves resolve the destination from one labels.list"""
+        for i in range(5):
+            assert gmail_provider.move_email(f'msg_{i:03d}', 'archive', current_labels=['INBOX']) is True
+        assert fake_gmail_service.calls.count('labels.list') == 1
+        assert fake_gmail_service.calls.count('messages.modify') == 5
+
+    def test_move_action_lists_labels_once(self, gmail_provider, fake_gmail_service):
+        """Test the action's skip check and the move share the cached lookup"""
+        from rules.actions.move_actions import MoveMessageAction
+        action = MoveMessageAction({'destination': 'Archive'})
+        email = {'id': 'msg_000', 'subject': 'Message 0', 'labels': ['INBOX', 'UNREAD']}
+
+        assert action.execute(gmail_provider, email) is True
+        assert fake_gmail_service.calls == ['labels.list', 'messages.modify']
+
+    def test_create_label_updates_cache(self, gmail_provider, fake_gmail_service):
+        """Test a created label resolves without listing labels again"""
+        gmail_provider.get_labels()
+
+        label_id = gmail_provider.create_label('Receipts')
+
+        assert gmail_provider._get_label_id('receipts') == label_id
+        assert fake_gmail_service.calls.count('labels.list') == 1
+
+    def test_rejected_change_invalidates_cache(self, gmail_provider, fake_gmail_service):
+        """Test a 400 from a label change makes the next lookup list labels again"""
+        gmail_provider._get_label_id('Archive')
+        fake_gmail_service.failing_ids['msg_000'] = 400
+
+        assert gmail_provider.modify_labels('msg_000', {'Label_1'}, set()) is False
+        gmail_provider._get_label_id('Archive')
+
+        assert fake_gmail_service.calls.count('labels.list') == 2
+
+    def test_use_label_store_persists_labels(self, gmail_provider, email_repository, fake_gmail_service):
+        """Test labels listed in one run are reused by the next"""
+        gmail_provider.use_label_store(email_repository)
+        gmail_provider._get_label_id('Archive')
+
+        from provider.gmail_provider import GmailProvider
+        next_run = GmailProvider()
+        next_run.service = fake_gmail_service
+        next_run.use_label_store(email_repository)
+
+        assert next_run._get_label_id('Archive') == 'Label_1'
+        assert fake_gmail_service.calls.count('labels.list') == 1
+
+    def test_ensure_labels_creates_missing_labels(self, gmail_provider, fake_gmail_service):
+        """Test known labels resolve from one listing and missing ones are created"""
+        resolved = gmail_provider.ensure_labels(['archive', 'Receipts', 'receipts', 'INBOX'])
+
+        assert resolved['archive'] == 'Label_1'
+        assert resolved['INBOX'] == 'INBOX'
+        assert gmail_provider._get_label_id('Receipts') == resolved['Receipts']
+        assert fake_gmail_service.calls == ['labels.list', 'labels.create']
+
+    def test_ensure_labels_reports_every_failure(self, gmail_provider, mocker):
+        """Test labels that cannot be created fail with a single error naming them all"""
+        from provider.email_provider import LabelUnavailableError
+        mocker.patch.object(gmail_provider, 'create_label', return_value=None)
+
+        with pytest.raises(LabelUnavailableError, match='Receipts, Travel'):
+            gmail_provider.ensure_labels(['Travel', 'Archive', 'Receipts'])
+
+
+class TestGmailProviderRetries:
+    """Test API calls go through the retrying request executor"""
+
+    def test_modify_retried_after_transient_error(self, gmail_provider, fake_gmail_service):
+        """Test a 503 is retried instead of failing the change"""
+        from tests.conftest import make_http_error
+        fake_gmail_service.fail_next('messages.modify', make_http_error(503, 'backendError'))
+
+        assert gmail_provider.modify_labels('msg_000', {'Label_1'}, set()) is True
+        assert fake_gmail_service.calls == ['messages.modify', 'messages.modify']
+
+    def test_persistent_errors_give_up(self, gmail_provider, fake_gmail_service):
+        """Test a change still fails once every attempt has failed"""
+        fake_gmail_service.failing_ids['msg_000'] = 500
+
+        assert gmail_provider.modify_labels('msg_000', {'Label_1'}, set()) is False
+        assert fake_gmail_service.calls.count('messages.modify') == gmail_provider.requests.max_attempts
+
+    def test_rate_limited_batch_items_are_retried(self, gmail_provider, fake_gmail_service):
+        """Test items rejected inside a batch are fetched again in a smaller batch"""
+        from tests.conftest import make_http_error
+        fake_gmail_service.fail_next('messages.get', make_http_error(429, 'rateLimitExceeded'))
+
+        emails = gmail_provider.fetch_emails(limit=3)
+
+        assert [email['id'] for email in emails] == ['msg_000', 'msg_001', 'msg_002']
+        assert fake_gmail_service.batch_sizes == [3, 1]
+        assert gmail_provider.requests.limiter.limit < gmail_provider.requests.limiter.maximum
+
+    def test_not_found_is_not_retried(self, gmail_provider, fake_gmail_service):
+        """Test an expired history cursor fails on the first attempt"""
+        from provider.email_provider import SyncCursorExpiredError
+        fake_gmail_service.oldest_history_id = 500
+
+        with pytest.raises(SyncCursorExpiredError):
+            gmail_provider.fetch_changes('100')
+        assert fake_gmail_service.calls == ['history.list']
@@ -0,0 +1,124 @@
+import pytest
+import json
+import threading
+import time
+import httplib2
+from provider.http_pool import HttpPool, HttpPoolExhaustedError
+
+
+class FakeHttp:
+    """httplib2.Http stand-in that fails if two threads use it at once"""
+
+    instances = []
+
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.in_use = False
+        self.requests = 0
+        self.closed = False
+        FakeHttp.instances.append(self)
+
+    def request(self, uri, method="GET", body=None, headers=None, **kwargs):
+        assert not self.in_use, "Http shared between threads"
+        self.in_use = True
+        try:
+            time.sleep(self.delay)
+            self.requests += 1
+            return httplib2.Response({'status': 200}), json.dumps({'labels': []}).encode()
+        finally:
+            self.in_use = False
+
+    def close(self):
+        self.closed = True
+
+
+class TestHttpPool:
+    """Test the pooled, thread-safe Gmail transport"""
+
+    @pytest.fixture(autouse=True)
+    def reset_instances(self):
+        FakeHttp.instances = []
+
+    def test_sequential_requests_reuse_one_connection(self):
+        """Test a single caller keeps using the same warm connection"""
+        pool = HttpPool(credentials=None, size=4, http_factory=FakeHttp)
+
+        for _ in range(5):
+            response, _ = pool.request('https://example.com/')
+            assert response.status == 200
+
+        assert len(FakeHttp.instances) == 1
+        assert FakeHttp.instances[0].requests == 5
+
+    def test_concurrent_requests_never_share_a_connection(self):
+        """Test threads each get their own Http, up to the pool size"""
+        pool = HttpPool(credentials=None, size=3, http_factory=lambda: FakeHttp(delay=0.01))
+        errors = []
+
+        def worker():
+            try:
+                for _ in range(5):
+                    pool.request('https://example.com/')
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=worker) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert errors == []
+        assert len(FakeHttp.instances) == 3
+        assert sum(http.requests for http in FakeHttp.instances) == 30
+
+    def test_exhausted_pool_times_out(self):
+        """Test a request fails clearly when every connection stays busy"""
+        pool = HttpPool(credentials=None, size=1, pool_timeout=0.01, http_factory=FakeHttp)
+
+        with pool.connection():
+            with pytest.raises(HttpPoolExhaustedError):
+                pool.request('https://example.com/')
+
+    def test_close_closes_idle_connections(self):
+        """Test closing the pool closes its connections"""
+        pool = HttpPool(credentials=None, size=2, http_factory=FakeHttp)
+        pool.request('https://example.com/')
+
+        pool.close()
+
+        assert FakeHttp.instances[0].closed is True
+
+    def test_gmail_service_uses_pool(self):
+        """Test the discovery client sends its requests through the pool"""
+        from googleapiclient.discovery import build
+        pool = HttpPool(credentials=None, size=2, http_factory=FakeHttp)
+        service = build('gmail', 'v1', http=pool)
+
+        assert service.users().labels().list(userId='me').execute() == {'labels': []}
+        assert FakeHttp.instances[0].requests == 1
+
+    def test_authenticate_builds_service_on_pool(self, mocker):
+        """Test GmailProvider owns one pool shared by its service"""
+        from google.oauth2.credentials import Credentials
+        from provider.gmail_provider import GmailProvider
+        creds = Credentials(token='token')
+        mocker.patch('provider.gmail_provider.load_credentials', return_value=creds)
+        provider = GmailProvider()
+
+        provider.authenticate()
+
+        assert isinstance(provider.http, HttpPool)
+        assert provider.http.credentials is creds
+        assert provider.service._http is provider.http
+
+    def test_provider_close_closes_pool(self):
+        """Test closing GmailProvider closes its pooled connections"""
+        from provider.gmail_provider import GmailProvider
+        provider = GmailProvider()
+        provider.http = HttpPool(credentials=None, size=2, http_factory=FakeHttp)
+        provider.http.request('https://example.com/')
+
+        provider.close()
+
+        assert FakeHttp.instances[0].closed is True
@@ -0,0 +1,143 @@
+import pytest
+from datetime import datetime, timedelta
+from provider.label_registry import LabelRegistry
+
+
+class FakeClock:
+    """Manually advanced clock"""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+class FakeLoader:
+    """Label list callable that counts how often it is called"""
+    
+    def __init__(self, labels):
+        self.labels = labels
+        self.calls = 0
+    
+    def __call__(self):
+        self.calls += 1
+        return list(self.labels)
+
+
+class TestLabelRegistry:
+    """Test the label name to id cache"""
+    
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+    
+    @pytest.fixture
+    def loader(self):
+        return FakeLoader([{'id': 'INBOX', 'name': 'INBOX'}, {'id': 'Label_1', 'name': 'Archive'}])
+    
+    def test_lists_labels_once(self, loader):
+        """Test repeated lookups reuse the first listing"""
+        registry = LabelRegistry(loader)
+        
+        assert registry.get_id('Archive') == 'Label_1'
+        assert registry.get_id('Archive') == 'Label_1'
+        assert registry.get_id('Missing') is None
+        assert loader.calls == 1
+    
+    def test_lookup_ignores_case(self, loader):
+        """Test names match regardless of case"""
+        registry = LabelRegistry(loader)
+        assert registry.get_id('ARCHIVE') == 'Label_1'
+        assert registry.get_id('archive') == 'Label_1'
+    
+    def test_ttl_expiry_reloads(self, loader, clock):
+        """Test labels are listed again once the TTL has passed"""
+        registry = LabelRegistry(loader, ttl=60, clock=clock)
+        registry.get_id('Archive')
+        
+        clock.now = 59
+        registry.get_id('Archive')
+        assert loader.calls == 1
+        
+        clock.now = 60
+        registry.get_id('Archive')
+        assert loader.calls == 2
+    
+    def test_invalidate_reloads(self, loader):
+        """Test invalidate forces the next lookup to list labels"""
+        registry = LabelRegistry(loader)
+        registry.get_id('Archive')
+        loader.labels = [{'id': 'Label_9', 'name': 'Archive'}]
+        
+        registry.invalidate()
+        
+        assert registry.get_id('Archive') == 'Label_9'
+        assert loader.calls == 2
+    
+    def test_add_updates_in_place(self, loader):
+        """Test a created label is known without listing again"""
+        registry = LabelRegistry(loader)
+        registry.get_id('Archive')
+        
+        registry.add('Label_2', 'Receipts')
+        
+        assert registry.get_id('receipts') == 'Label_2'
+        assert {'id': 'Label_2', 'name': 'Receipts'} in registry.labels()
+        assert loader.calls == 1
+    
+    def test_failed_listing_is_not_cached(self, loader):
+        """Test an error while listing is retried on the next lookup"""
+        def failing():
+            raise RuntimeError('unavailable')
+        registry = LabelRegistry(failing)
+        
+        assert registry.get_id('Archive') is None
+        registry._loader = loader
+        assert registry.get_id('Archive') == 'Label_1'
+    
+    def test_stored_labels_skip_listing(self, loader, email_repository):
+        """Test a fresh stored list is used instead of the API"""
+        email_repository.save_cached_labels([{'id': 'Label_5', 'name': 'Receipts'}])
+        registry = LabelRegistry(loader, ttl=3600, store=email_repository)
+        
+        assert registry.get_id('Receipts') == 'Label_5'
+        assert loader.calls == 0
+    
+    def test_stale_stored_labels_are_replaced(self, loader, email_repository):
+        """Test a stored list older than the TTL is listed again and saved"""
+        from datastore.sync_state import LabelCache
+        email_repository.save_cached_labels([{'id': 'Label_5', 'name': 'Receipts'}])
+        session = email_repository.get_session()
+        session.query(LabelCache).update({'updated_at': datetime.utcnow() - timedelta(hours=2)})
+        session.commit()
+        session.close()
+        registry = LabelRegistry(loader, ttl=3600, store=email_repository)
+        
+        assert registry.get_id('Receipts') is None
+        assert loader.calls == 1
+        assert email_repository.get_cached_labels()[0] == loader.labels
+    
+    def test_invalidate_skips_stored_labels(self, loader, email_repository):
+        """Test a reload after invalidation lists labels instead of reading the stale store"""
+        email_repository.save_cached_labels([{'id': 'Label_5', 'name': 'Receipts'}])
+        registry = LabelRegistry(loader, store=email_repository)
+        registry.get_id('Receipts')
+        
+        registry.invalidate()
+        
+        assert registry.get_id('Receipts') is None
+        assert loader.calls == 1
+    
+    def test_caller_loaded_labels(self, clock):
+        """Test a registry without a loader serves labels passed to load()"""
+        registry = LabelRegistry(None, ttl=60, clock=clock)
+        assert registry.is_loaded() is False
+        assert registry.get_id('Archive') is None
+        
+        registry.load([{'id': 'Label_1', 'name': 'Archive'}])
+        
+        assert registry.is_loaded() is True
+        assert registry.get_id('archive') == 'Label_1'
+        clock.now = 60
+        assert registry.is_loaded() is False
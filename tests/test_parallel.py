@@ -0,0 +1,134 @@
+import pytest
+import pickle
+import random
+from datetime import datetime, timedelta
+from rules.engine import Rule, RulesEngine
+from rules.conditions.factory import ConditionFactory
+from rules.actions.mark_actions import MarkAsReadAction
+from rules.parallel import ParallelRulesEngine, MIN_SHARD_SIZE
+
+
+NOW = datetime(2024, 6, 1, 12, 0, 0)
+
+
+@pytest.fixture
+def rules():
+    """A few rules covering string and date conditions"""
+    specs = [
+        ('all', [('contains', 'subject', 'urgent'), ('less_than_days', 'received_date', 60)]),
+        ('any', [('equals', 'from', 'boss@company.com'), ('equals', 'from', 'news@example.com')]),
+        ('all', [('does_not_contain', 'subject', 'weekly'), ('greater_than_months', 'received_date', 3)]),
+    ]
+    return [
+        Rule(f'Rule {i}', predicate,
+             [ConditionFactory.create(kind, field, value) for kind, field, value in conditions],
+             [MarkAsReadAction()])
+        for i, (predicate, conditions) in enumerate(specs)
+    ]
+
+
+def make_emails(count):
+    """Generate emails with a mix of senders, subjects and dates"""
+    rng = random.Random(5)
+    return [
+        {
+            'id': f'msg_{i}',
+            'from': rng.choice(['boss@company.com', 'news@example.com', 'someone@else.org']),
+            'subject': rng.choice(['Urgent fix', 'Weekly digest', 'Lunch?', '']),
+            'received_date': NOW - timedelta(days=rng.randint(0, 300)),
+            'is_read': False,
+        }
+        for i in range(count)
+    ]
+
+
+class TestParallelRulesEngine:
+    """Test rule matching across worker processes"""
+    
+    def test_rules_pickle_without_compiled_predicate(self, rules):
+        """Test rules can be sent to workers and recompile there"""
+        rule = rules[0]
+        rule.compile(NOW)
+        
+        copy = pickle.loads(pickle.dumps(rule))
+        
+        assert copy._predicate is None
+        email = make_emails(1)[0]
+        assert copy.matches(email) == rule.matches(email)
+    
+    def test_parallel_matches_agree_with_local(self, rules):
+        """Test sharded matching returns the same positions, in email order"""
+        emails = make_emails(3 * MIN_SHARD_SIZE + 7)
+        expected = RulesEngine(rules, now=NOW).match_batch_positions(emails)
+        
+        with ParallelRulesEngine(rules, now=NOW, workers=2) as engine:
+            assert engine.match_batch_positions(emails) == expected
+            assert engine._executor is not None
+    
+    def test_small_batches_match_locally(self, rules):
+        """Test batches below one shard never start the pool"""
+        engine = ParallelRulesEngine(rules, now=NOW, workers=4)
+        
+        engine.match_batch_positions(make_emails(MIN_SHARD_SIZE))
+        
+        assert engine._executor is None
+    
+    def test_pool_failure_falls_back_to_local(self, rules, mocker):
+        """Test a broken pool is shut down and the batch matched locally"""
+        emails = make_emails(2 * MIN_SHARD_SIZE + 1)
+        engine = ParallelRulesEngine(rules, now=NOW, workers=2)
+        executor = mocker.MagicMock()
+        executor.map.side_effect = RuntimeError('worker died')
+        engine._executor = executor
+        
+        positions = engine.match_batch_positions(emails)
+        
+        assert positions == RulesEngine(rules, now=NOW).match_batch_positions(emails)
+        executor.shutdown.assert_called_once()
+        assert engine._executor is None
+    
+    def test_actions_run_in_parent(self, rules, mock_gmail_provider):
+        """Test process_emails applies actions for matches found by workers"""
+        emails = make_emails(2 * MIN_SHARD_SIZE + 1)
+        expected = RulesEngine(rules, now=NOW).match_batch_positions(emails)
+        
+        with ParallelRulesEngine(rules, now=NOW, workers=2) as engine:
+            results = engine.process_emails(mock_gmail_provider, emails)
+        
+        matched = sum(len(positions) for positions in expected)
+        assert sum(len(result['rules_matched']) for result in results) == matched
+        assert mock_gmail_provider.mark_as_read.call_count == matched
+    
+    def test_build_rules_engine_uses_workers_setting(self, rules):
+        """Test the processing script only starts workers when configured"""
+        from process_emails_main import build_rules_engine
+        assert type(build_rules_engine(rules, workers=1)) is RulesEngine
+        engine = build_rules_engine(rules, workers=3)
+        assert isinstance(engine, ParallelRulesEngine)
+        assert engine.workers == 3
+    
+    def test_batches_are_split_across_all_workers(self, rules, mocker):
+        """Test a default-sized batch gives every one of many workers a shard"""
+        from config.settings import PROCESS_BATCH_SIZE
+        emails = make_emails(PROCESS_BATCH_SIZE)
+        engine = ParallelRulesEngine(rules, now=NOW, workers=16)
+        local = RulesEngine(rules, now=NOW)
+        executor = mocker.MagicMock()
+        executor.map.side_effect = lambda func, shards: [
+            [(email['id'], positions) for email, positions in zip(shard, local.match_batch_positions(shard))]
+            for shard in shards
+        ]
+        engine._executor = executor
+        
+        positions = engine.match_batch_positions(emails)
+        
+        shards = executor.map.call_args.args[1]
+        assert len(shards) == 16
+        assert positions == local.match_batch_positions(emails)
+    
+    def test_batch_size_scales_with_workers(self):
+        """Test the processing batch grows to give every worker a full shard"""
+        from rules.parallel import batch_size_for_workers
+        assert batch_size_for_workers(1000, 1) == 1000
+        assert batch_size_for_workers(1000, 8) == 1000
+        assert batch_size_for_workers(1000, 32) == 32 * MIN_SHARD_SIZE
@@ -0,0 +1,78 @@
+import pytest
+from datetime import datetime
+from process_emails_main import process_batch
+from rules.engine import Rule, RulesEngine
+from rules.conditions.string_conditions import ContainsCondition
+from rules.actions.mark_actions import MarkAsReadAction
+
+
+class TestProcessBatch:
+    """Test batch processing and the processing watermark"""
+    
+    @pytest.fixture
+    def engine(self):
+        rule = Rule('Boss', 'all', [ContainsCondition('from', 'boss')], [MarkAsReadAction()])
+        return RulesEngine([rule])
+    
+    def test_process_batch_marks_emails_processed(self, engine, email_repository,
+                                                  mock_gmail_provider, sample_email, old_email):
+        """Test evaluated emails are not returned again for the same rules"""
+        email_repository.save_emails([sample_email, old_email])
+        emails = next(email_repository.iter_emails_for_processing(rules_version='v1'))
+        
+        results = process_batch(engine, mock_gmail_provider, email_repository,
+                                emails, 'v1', datetime.utcnow())
+        
+        assert sum(1 for r in results if r['rules_matched']) == 1
+        assert list(email_repository.iter_emails_for_processing(rules_version='v1')) == []
+        assert len(email_repository.get_rule_executions(sample_email['id'])) == 1
+    
+    def test_failed_actions_stay_pending(self, engine, email_repository,
+                                         mock_gmail_provider, sample_email):
+        """Test emails whose actions failed are retried next run"""
+        mock_gmail_provider.modify_labels.return_value = False
+        email_repository.save_emails([{**sample_email, 'labels': ['INBOX', 'UNREAD']}])
+        emails = next(email_repository.iter_emails_for_processing(rules_version='v1'))
+        
+        process_batch(engine, mock_gmail_provider, email_repository,
+                      emails, 'v1', datetime.utcnow())
+        
+        assert len(email_repository.get_emails_for_processing(rules_version='v1')) == 1
+    
+    def test_rows_without_stored_labels_execute_actions(self, engine, email_repository,
+                                                        mock_gmail_provider, sample_email):
+        """Test rows saved before labels were stored run their actions instead of a no-op delta"""
+        from sqlalchemy import text
+        email_repository.save_emails([sample_email])
+        with email_repository.engine.begin() as conn:
+            conn.execute(text("UPDATE email_info SET labels = NULL"))
+        emails = next(email_repository.iter_emails_for_processing(rules_version='v1'))
+        assert emails[0]['labels'] is None
+        
+        results = process_batch(engine, mock_gmail_provider, email_repository,
+                                emails, 'v1', datetime.utcnow())
+        
+        assert results[0]['actions_executed'] == ['MarkAsReadAction']
+        mock_gmail_provider.mark_as_read.assert_called_once_with(sample_email['id'])
+    
+    def test_threshold_passing_during_the_run_is_rescheduled(self, email_repository,
+                                                           mock_gmail_provider, sample_email):
+        """Test a date threshold crossed between start_run and process_batch is not lost"""
+        from freezegun import freeze_time
+        from rules.conditions.date_conditions import GreaterThanDaysCondition
+        rule = Rule('Week old', 'all', [GreaterThanDaysCondition('received_date', 7)], [MarkAsReadAction()])
+        
+        with freeze_time('2024-03-01 12:00:00') as clock:
+            engine = RulesEngine([rule])
+            run_started = datetime.utcnow()
+            email_repository.save_emails([{**sample_email, 'received_date': datetime(2024, 2, 23, 12, 30)}])
+            emails = next(email_repository.iter_emails_for_processing(rules_version='v1'))
+            
+            # The threshold passes 30 minutes into the run
+            clock.move_to('2024-03-01 13:00:00')
+            results = process_batch(engine, mock_gmail_provider, email_repository,
+                                    emails, 'v1', run_started)
+            
+            assert results[0]['rules_matched'] == []
+            pending = list(email_repository.iter_emails_for_processing(rules_version='v1'))
+            assert [email['id'] for batch in pending for email in batch] == [sample_email['id']]
@@ -0,0 +1,272 @@
+import pytest
+import random
+from datetime import datetime, timedelta
+from rules.engine import Rule
+from rules.conditions.conditions import Condition
+from rules.conditions.factory import ConditionFactory
+from datastore.query_planner import QueryPlanner
+
+
+NOW = datetime(2024, 6, 1, 12, 0, 0)
+
+
+def make_rule(predicate, conditions):
+    """Build a rule from (condition, field, value) tuples"""
+    return Rule('Rule', predicate,
+                [ConditionFactory.create(kind, field, value) for kind, field, value in conditions], [])
+
+
+class SenderLengthCondition(Condition):
+    """Custom condition with no SQL translation"""
+    
+    def evaluate(self, email):
+        return len(email.get('from') or '') > 16
+
+
+@pytest.fixture(params=[False, True], ids=['plain', 'full_text'])
+def repository(request):
+    """Repository with and without the full-text index"""
+    from datastore.email_datastore import EmailRepository
+    return EmailRepository('sqlite:///:memory:', full_text_index=request.param)
+
+
+@pytest.fixture
+def stored_emails(repository):
+    """A store of varied emails, returned as the dicts rules see"""
+    rng = random.Random(11)
+    senders = ['boss@company.com', ' BOSS@company.com', 'news@example.com', '100%_off@shop.com', 'café@x.fr']
+    words = ['Urgent', 'project', 'invoice', 'weekly', '50% off', 'naïve']
+    emails = []
+    for i in range(120):
+        emails.append({
+            'id': f'msg_{i:03d}',
+            'thread_id': None if i % 7 == 0 else f'thread_{i % 10}',
+            'from': rng.choice(senders),
+            'to': None if i % 5 == 0 else 'me@company.com',
+            'subject': ' '.join(rng.sample(words, rng.randint(0, 3))),
+            'received_date': NOW - timedelta(days=rng.randint(0, 400), minutes=rng.randint(0, 600)),
+            'is_read': rng.random() < 0.5,
+            'labels': ['INBOX'],
+        })
+    repository.save_emails(emails)
+    return [email.to_dict() for email in repository.get_all_emails()]
+
+
+RULES = [
+    ('all', [('contains', 'from', 'company.com'), ('less_than_days', 'received_date', 30)]),
+    ('all', [('equals', 'from', 'boss@company.com'), ('equals', 'is_read', 'false')]),
+    ('all', [('does_not_contain', 'subject', 'weekly'), ('greater_than_months', 'received_date', 6)]),
+    ('any', [('contains', 'subject', '50% off'), ('contains', 'from', '100%_off')]),
+    ('any', [('equals', 'to', 'None'), ('contains', 'thread_id', 'none')]),
+    ('all', [('does_not_equal', 'from', 'news@example.com'), ('greater_than_days', 'received_date', 10),
+             ('less_than_months', 'received_date', 9)]),
+    ('all', [('contains', 'subject', 'NAÏVE'), ('contains', 'from', 'x.fr')]),
+    ('any', [('equals', 'is_read', 'yes')]),
+    ('all', [('does_not_equal', 'is_read', 'true')]),
+]
+
+
+class TestQueryPlanner:
+    """Test SQL pushdown of rule conditions"""
+    
+    @pytest.mark.parametrize('predicate,conditions', RULES)
+    def test_pushdown_agrees_with_python_matching(self, repository, stored_emails, predicate, conditions):
+        """Test the planned query returns exactly the emails the rule matches"""
+        rule = make_rule(predicate, conditions)
+        rule.compile(NOW)
+        
+        found = repository.find_matching_emails(rule, now=NOW)
+        
+        expected = [email['id'] for email in stored_emails if rule.matches(email)]
+        assert sorted(email['id'] for email in found) == sorted(expected)
+    
+    def test_equals_strips_the_same_whitespace_as_python(self, repository, sample_email):
+        """Test newlines, tabs and non-breaking spaces are stripped like str.strip() does"""
+        repository.save_emails([dict(sample_email, subject='Report\n'),
+                                dict(sample_email, id='tabbed', subject='\treport\xa0')])
+        rule = make_rule('all', [('equals', 'subject', 'report')])
+        
+        found = repository.find_matching_emails(rule, now=NOW)
+        
+        assert sorted(email['id'] for email in found) == ['tabbed', sample_email['id']]
+    
+    def test_whitespace_is_what_str_strip_removes(self):
+        """Test the trimmed characters are exactly those str.isspace() accepts"""
+        from datastore.query_planner import WHITESPACE
+        assert WHITESPACE == ''.join(c for c in map(chr, range(0x110000)) if c.isspace())
+    
+    def test_all_rule_keeps_untranslatable_conditions_as_residual(self):
+        """Test ALL rules push what they can and check the rest in Python"""
+        rule = Rule('Mixed', 'all', [
+            ConditionFactory.create('contains', 'from', 'boss'),
+            ConditionFactory.create('contains', 'labels', 'INBOX'),
+            SenderLengthCondition('from', None),
+        ], [])
+        
+        plan = QueryPlanner(NOW).plan(rule)
+        
+        assert plan.filter is not None
+        assert plan.residual == rule.conditions[1:]
+    
+    def test_any_rule_with_untranslatable_condition_is_not_pushed(self):
+        """Test ANY rules are left to Python unless every condition translates"""
+        rule = Rule('Mixed', 'any', [
+            ConditionFactory.create('contains', 'from', 'boss'),
+            SenderLengthCondition('from', None),
+        ], [])
+        
+        plan = QueryPlanner(NOW).plan(rule)
+        
+        assert plan.filter is None
+        assert plan.residual == rule.conditions
+    
+    def test_non_ascii_values_are_not_pushed(self):
+        """Test values SQL cannot case-fold reliably stay in Python"""
+        condition = ConditionFactory.create('contains', 'subject', 'Ünïcode')
+        assert QueryPlanner(NOW).condition_filter(condition) is None
+    
+    def test_date_condition_filters_on_indexed_column(self):
+        """Test date conditions compile to a range on received_date"""
+        condition = ConditionFactory.create('less_than_days', 'received_date', 2)
+        sql = str(QueryPlanner(NOW).condition_filter(condition))
+        assert sql.startswith('email_info.received_date >')
+    
+    def test_rule_without_conditions_matches_nothing(self, repository, stored_emails):
+        """Test empty rules select no rows"""
+        assert repository.find_matching_emails(Rule('Empty', 'all', [], []), now=NOW) == []
+    
+    def test_find_matching_emails_with_custom_condition(self, repository, stored_emails):
+        """Test residual conditions are applied to the candidate rows"""
+        rule = Rule('Long boss', 'all', [
+            ConditionFactory.create('contains', 'from', 'boss'),
+            SenderLengthCondition('from', None),
+        ], [])
+        
+        found = repository.find_matching_emails(rule, now=NOW)
+        
+        assert found
+        assert all(email['from'] == ' BOSS@company.com' for email in found)
+    
+    def test_find_matching_emails_only_pending(self, repository, stored_emails):
+        """Test rules_version restricts results to emails pending for that version"""
+        rule = make_rule('all', [('contains', 'from', 'company.com')])
+        matching = repository.find_matching_emails(rule, now=NOW)
+        repository.mark_processed([email['id'] for email in matching[1:]], 'v1')
+        
+        pending = repository.find_matching_emails(rule, now=NOW, rules_version='v1')
+        
+        assert [email['id'] for email in pending] == [matching[0]['id']]
+
+    
+    def test_processing_loads_only_candidates(self, repository, stored_emails):
+        """Test processing batches hold only the rows some rule may match"""
+        rules = [make_rule('all', [('equals', 'from', 'news@example.com')]),
+                 make_rule('any', [('contains', 'subject', 'invoice'), ('less_than_days', 'received_date', 7)])]
+        for rule in rules:
+            rule.compile(NOW)
+        
+        batches = list(repository.iter_emails_for_processing(batch_size=10, rules_version='v1',
+                                                             rules=rules, now=NOW))
+        
+        loaded = [email['id'] for batch in batches for email in batch]
+        expected = [email['id'] for email in stored_emails if any(rule.matches(email) for rule in rules)]
+        assert sorted(loaded) == sorted(expected)
+        assert 0 < len(loaded) < len(stored_emails)
+    
+    def test_processing_loads_everything_for_unnarrowable_rules(self, repository, stored_emails):
+        """Test a rule SQL cannot narrow keeps every pending row in the scan"""
+        rules = [make_rule('all', [('equals', 'from', 'news@example.com')]),
+                 Rule('Custom', 'any', [SenderLengthCondition('from', None)], [])]
+        
+        batches = list(repository.iter_emails_for_processing(rules_version='v1', rules=rules, now=NOW))
+        
+        assert sum(len(batch) for batch in batches) == len(stored_emails)
+
+
+class TestTextIndex:
+    """Test the optional full-text index"""
+    
+    @pytest.fixture
+    def indexed_repository(self, sample_email, old_email):
+        """Repository with the full-text index and two stored emails"""
+        from datastore.email_datastore import EmailRepository
+        repository = EmailRepository('sqlite:///:memory:', full_text_index=True)
+        repository.save_emails([sample_email, old_email])
+        return repository
+    
+    def test_find_contains_candidates(self, indexed_repository):
+        """Test contains lookups resolve ids from the index, ignoring case"""
+        assert indexed_repository.find_contains_candidates('subject', 'PROJECT') == ['test_email_123']
+        assert indexed_repository.find_contains_candidates('from', 'example.com') == ['old_email_456']
+        assert indexed_repository.find_contains_candidates('subject', 'missing') == []
+    
+    def test_unanswerable_lookups_return_none(self, indexed_repository, email_repository):
+        """Test short needles, other fields and disabled indexes fall back to None"""
+        assert indexed_repository.find_contains_candidates('subject', 'up') is None
+        assert indexed_repository.find_contains_candidates('to', 'company') is None
+        assert email_repository.find_contains_candidates('subject', 'project') is None
+    
+    def test_index_follows_saves_and_deletes(self, indexed_repository, sample_email):
+        """Test new emails are indexed and deleted ones removed"""
+        indexed_repository.save_emails([{**sample_email, 'id': 'new_1', 'subject': 'Quarterly "report"'}])
+        assert indexed_repository.find_contains_candidates('subject', '"report"') == ['new_1']
+        
+        indexed_repository.delete_emails(['new_1', 'test_email_123'])
+        assert indexed_repository.find_contains_candidates('subject', 'report') == []
+        assert indexed_repository.find_contains_candidates('subject', 'project') == []
+    
+    def test_existing_emails_are_indexed_when_enabled(self, tmp_path, sample_email):
+        """Test enabling the index on an existing database backfills it"""
+        from datastore.email_datastore import EmailRepository
+        database_url = f"sqlite:///{tmp_path / 'emails.db'}"
+        EmailRepository(database_url).save_emails([sample_email])
+        
+        repository = EmailRepository(database_url, full_text_index=True)
+        
+        assert repository.find_contains_candidates('subject', 'urgent') == ['test_email_123']
+    
+    def test_index_catches_up_after_being_turned_off(self, tmp_path, sample_email, old_email):
+        """Test emails saved or deleted while the index was off are synced when it is turned back on"""
+        from datastore.email_datastore import EmailRepository
+        database_url = f"sqlite:///{tmp_path / 'emails.db'}"
+        EmailRepository(database_url, full_text_index=True).save_emails([sample_email])
+        
+        unindexed = EmailRepository(database_url)
+        unindexed.delete_emails([sample_email['id']])
+        unindexed.save_emails([old_email])
+        
+        repository = EmailRepository(database_url, full_text_index=True)
+        
+        assert repository.find_contains_candidates('subject', 'newsletter') == [old_email['id']]
+        assert repository.find_contains_candidates('subject', 'urgent') == []
+        rule = make_rule('all', [('contains', 'subject', 'weekly')])
+        assert [email['id'] for email in repository.find_matching_emails(rule, now=NOW)] == [old_email['id']]
+    
+    def test_index_in_step_is_not_resynced(self, tmp_path, sample_email, old_email, mocker):
+        """Test reopening a database whose index saw every write skips the sync"""
+        from datastore.email_datastore import EmailRepository
+        from datastore.text_index import SqliteTextIndex
+        database_url = f"sqlite:///{tmp_path / 'emails.db'}"
+        repository = EmailRepository(database_url, full_text_index=True)
+        repository.save_emails([sample_email, old_email])
+        repository.delete_emails([sample_email['id']])
+        sync = mocker.spy(SqliteTextIndex, '_sync')
+        
+        repository = EmailRepository(database_url, full_text_index=True)
+        
+        sync.assert_not_called()
+        assert repository.find_contains_candidates('subject', 'newsletter') == [old_email['id']]
+    
+    def test_writes_while_turned_off_trigger_a_resync(self, tmp_path, sample_email, mocker):
+        """Test a save made without the index is noticed on the next indexed open"""
+        from datastore.email_datastore import EmailRepository
+        from datastore.text_index import SqliteTextIndex
+        database_url = f"sqlite:///{tmp_path / 'emails.db'}"
+        EmailRepository(database_url, full_text_index=True)
+        EmailRepository(database_url).save_emails([sample_email])
+        sync = mocker.spy(SqliteTextIndex, '_sync')
+        
+        repository = EmailRepository(database_url, full_text_index=True)
+        
+        sync.assert_called_once()
+        assert repository.find_contains_candidates('subject', 'urgent') == [sample_email['id']]
@@ -0,0 +1,87 @@
+import pytest
+import threading
+from utils.rate_limit import TokenBucket
+
+
+class FakeClock:
+    """Clock whose sleep advances time instantly"""
+    
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+    
+    def __call__(self):
+        return self.now
+    
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class TestTokenBucket:
+    """Test the token bucket rate limiter"""
+    
+    @pytest.fixture
+    def clock(self):
+        return FakeClock()
+    
+    def test_starts_full(self, clock):
+        """Test a new bucket allows a burst up to its capacity"""
+        bucket = TokenBucket(rate=10, clock=clock, sleep=clock.sleep)
+        assert all(bucket.try_acquire() for _ in range(10))
+        assert bucket.try_acquire() is False
+    
+    def test_refills_at_rate(self, clock):
+        """Test tokens come back in proportion to elapsed time"""
+        bucket = TokenBucket(rate=10, capacity=10, clock=clock, sleep=clock.sleep)
+        bucket.try_acquire(10)
+        
+        clock.now += 0.5
+        
+        assert bucket.try_acquire(5) is True
+        assert bucket.try_acquire(1) is False
+    
+    def test_acquire_waits_for_tokens(self, clock):
+        """Test acquire sleeps just long enough for the missing tokens"""
+        bucket = TokenBucket(rate=250, clock=clock, sleep=clock.sleep)
+        bucket.acquire(250)
+        
+        waited = bucket.acquire(5)
+        
+        assert waited == pytest.approx(0.02)
+        assert clock.now == pytest.approx(0.02)
+    
+    def test_sustained_rate(self, clock):
+        """Test many acquisitions are spread out at the configured rate"""
+        bucket = TokenBucket(rate=250, clock=clock, sleep=clock.sleep)
+        for _ in range(100):
+            bucket.acquire(5)
+        # 500 units at 250/s, the first 250 served from the initial burst
+        assert clock.now == pytest.approx(1.0)
+    
+    def test_oversized_request_is_capped(self, clock):
+        """Test a request larger than the bucket waits for a full bucket instead of forever"""
+        bucket = TokenBucket(rate=10, capacity=10, clock=clock, sleep=clock.sleep)
+        bucket.acquire(10)
+        assert bucket.acquire(50) == pytest.approx(1.0)
+    
+    def test_rejects_non_positive_rate(self):
+        """Test a zero rate is refused"""
+        with pytest.raises(ValueError):
+            TokenBucket(rate=0)
+    
+    def test_thread_safe(self):
+        """Test concurrent acquirers never take more than the bucket holds"""
+        bucket = TokenBucket(rate=0.001, capacity=100)
+        granted = []
+        
+        def worker():
+            granted.append(sum(bucket.try_acquire() for _ in range(50)))
+        
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert sum(granted) == 100
@@ -0,0 +1,260 @@
+import pytest
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+from provider.request_executor import AimdLimiter, ErrorKind, RequestExecutor, classify, retry_after
+from tests.conftest import make_http_error
+
+
+class FakeClock:
+    """Manually advanced clock"""
+    
+    def __init__(self):
+        self.now = 0.0
+    
+    def __call__(self):
+        return self.now
+
+
+class FlakyCall:
+    """Callable raising the given errors before returning 'ok'"""
+    
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.calls = 0
+    
+    def __call__(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return 'ok'
+
+
+class TestErrorClassification:
+    """Test which API errors are retried"""
+    
+    @pytest.mark.parametrize('status, reason, kind', [
+        (429, 'rateLimitExceeded', ErrorKind.RATE_LIMITED),
+        (403, 'userRateLimitExceeded', ErrorKind.RATE_LIMITED),
+        (403, 'rateLimitExceeded', ErrorKind.RATE_LIMITED),
+        (403, 'insufficientPermissions', ErrorKind.FATAL),
+        (500, 'backendError', ErrorKind.TRANSIENT),
+        (503, 'backendError', ErrorKind.TRANSIENT),
+        (400, 'invalidArgument', ErrorKind.FATAL),
+        (404, 'notFound', ErrorKind.FATAL),
+    ])
+    def test_http_errors(self, status, reason, kind):
+        """Test status codes and Gmail reasons map to retry decisions"""
+        assert classify(make_http_error(status, reason)) is kind
+    
+    def test_connection_errors_are_transient(self):
+        """Test dropped and timed out connections are retried"""
+        assert classify(ConnectionResetError()) is ErrorKind.TRANSIENT
+        assert classify(TimeoutError()) is ErrorKind.TRANSIENT
+        assert classify(ValueError()) is ErrorKind.FATAL
+    
+    def test_retry_after_seconds_and_date(self):
+        """Test both Retry-After formats are understood"""
+        assert retry_after(make_http_error(429, headers={'retry-after': '7'})) == 7
+        when = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=30), usegmt=True)
+        assert 25 < retry_after(make_http_error(429, headers={'retry-after': when})) <= 30
+        assert retry_after(make_http_error(429)) is None
+
+
+class TestRequestExecutor:
+    """Test retries with backoff"""
+    
+    @pytest.fixture
+    def sleeps(self):
+        return []
+    
+    @pytest.fixture
+    def executor(self, sleeps):
+        return RequestExecutor(max_attempts=4, base_delay=0.5, max_delay=2, sleep=sleeps.append, jitter=lambda: 1.0)
+    
+    def test_transient_errors_are_retried(self, executor, sleeps):
+        """Test a call succeeds after transient failures with growing delays"""
+        call = FlakyCall(make_http_error(503), make_http_error(500))
+        
+        assert executor.call(call) == 'ok'
+        assert call.calls == 3
+        assert sleeps == [0.5, 1.0]
+    
+    def test_backoff_is_capped_and_jittered(self, sleeps):
+        """Test delays never exceed the cap and are scaled by the jitter"""
+        executor = RequestExecutor(base_delay=1, max_delay=4, sleep=sleeps.append, jitter=lambda: 0.5)
+        assert [executor.backoff(attempt) for attempt in range(5)] == [0.5, 1.0, 2.0, 2.0, 2.0]
+    
+    def test_retry_after_is_honored(self, executor, sleeps):
+        """Test the wait is at least what the server asked for"""
+        call = FlakyCall(make_http_error(429, headers={'retry-after': '7'}))
+        
+        assert executor.call(call) == 'ok'
+        assert sleeps == [7.0]
+    
+    def test_fatal_errors_are_raised_at_once(self, executor, sleeps):
+        """Test errors that cannot succeed on retry are not retried"""
+        call = FlakyCall(make_http_error(404))
+        
+        with pytest.raises(Exception):
+            executor.call(call)
+        assert call.calls == 1
+        assert sleeps == []
+    
+    def test_gives_up_after_max_attempts(self, executor, sleeps):
+        """Test the last error is raised once attempts run out"""
+        errors = [make_http_error(503) for _ in range(4)]
+        call = FlakyCall(*errors)
+        
+        with pytest.raises(Exception) as raised:
+            executor.call(call)
+        assert raised.value is errors[-1]
+        assert call.calls == 4
+        assert len(sleeps) == 3
+    
+    def test_rate_limits_lower_the_concurrency_limit(self, executor):
+        """Test a 429 lowers the concurrency limit"""
+        limit = executor.limiter.limit
+        executor.call(FlakyCall(make_http_error(429)))
+        
+        assert executor.limiter.limit < limit
+
+
+class TestAimdLimiter:
+    """Test the additive increase / multiplicative decrease concurrency limit"""
+    
+    def test_decrease_and_increase(self):
+        """Test halving on rate limits and additive growth on success"""
+        clock = FakeClock()
+        limiter = AimdLimiter(maximum=8, clock=clock)
+        
+        limiter.throttle()
+        assert limiter.limit == 4
+        
+        for _ in range(4):
+            limiter.acquire()
+            limiter.release(True)
+        assert 4.9 < limiter.limit < 5
+    
+    def test_cooldown_merges_bursts(self):
+        """Test rate limits within the cooldown count once"""
+        clock = FakeClock()
+        limiter = AimdLimiter(maximum=8, cooldown=1.0, clock=clock)
+        
+        limiter.throttle()
+        limiter.throttle()
+        assert limiter.limit == 4
+        
+        clock.now = 1.0
+        limiter.throttle()
+        assert limiter.limit == 2
+    
+    def test_limit_has_a_floor(self):
+        """Test the limit never drops below the minimum"""
+        clock = FakeClock()
+        limiter = AimdLimiter(maximum=2, minimum=1, cooldown=0, clock=clock)
+        for _ in range(5):
+            limiter.throttle()
+        assert limiter.limit == 1
+    
+    def test_acquire_blocks_at_the_limit(self):
+        """Test no more than `limit` calls run at once across threads"""
+        limiter = AimdLimiter(maximum=2)
+        running = []
+        peak = []
+        lock = threading.Lock()
+        
+        def worker():
+            with limiter.slot():
+                with lock:
+                    running.append(1)
+                    peak.append(len(running))
+                time.sleep(0.01)
+                with lock:
+                    running.pop()
+        
+        threads = [threading.Thread(target=worker) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        assert max(peak) == 2
+
+
+class TestAsyncRequestExecutor:
+    """Test retries and the concurrency limit for coroutines"""
+    
+    @staticmethod
+    def status_error(status, headers=None):
+        import httpx
+        request = httpx.Request('GET', 'https://gmail.googleapis.com/gmail/v1/users/me/messages')
+        response = httpx.Response(status, headers=headers, request=request)
+        return httpx.HTTPStatusError(f'{status}', request=request, response=response)
+    
+    def test_httpx_errors_are_classified(self):
+        """Test httpx status and transport errors share the Gmail classification"""
+        import httpx
+        assert classify(self.status_error(429)) is ErrorKind.RATE_LIMITED
+        assert classify(self.status_error(503)) is ErrorKind.TRANSIENT
+        assert classify(self.status_error(404)) is ErrorKind.FATAL
+        assert classify(httpx.ConnectError('reset')) is ErrorKind.TRANSIENT
+        assert retry_after(self.status_error(429, {'Retry-After': '7'})) == 7.0
+    
+    def test_retries_and_throttles(self):
+        """Test retryable errors are retried, waiting out Retry-After, and lower the limit"""
+        import asyncio
+        from provider.request_executor import AsyncAimdLimiter, AsyncRequestExecutor
+        sleeps = []
+        
+        async def sleep(seconds):
+            sleeps.append(seconds)
+        
+        errors = [self.status_error(503), self.status_error(429, {'Retry-After': '3'})]
+        
+        async def call():
+            if errors:
+                raise errors.pop(0)
+            return 'ok'
+        
+        executor = AsyncRequestExecutor(limiter=AsyncAimdLimiter(8), sleep=sleep, jitter=lambda: 1.0)
+        
+        assert asyncio.run(executor.call(call)) == 'ok'
+        assert sleeps == [executor.base_delay, 3.0]
+        assert executor.limiter.limit < 8
+        assert executor.limiter.in_flight == 0
+    
+    def test_fatal_errors_are_raised_at_once(self):
+        """Test a 404 is not retried"""
+        import asyncio
+        from provider.request_executor import AsyncRequestExecutor
+        error = self.status_error(404)
+        
+        async def call():
+            raise error
+        
+        with pytest.raises(Exception) as raised:
+            asyncio.run(AsyncRequestExecutor().call(call))
+        assert raised.value is error
+    
+    def test_limit_caps_coroutines_in_flight(self):
+        """Test a lowered limit holds back coroutines until slots free up"""
+        import asyncio
+        from provider.request_executor import AsyncAimdLimiter
+        limiter = AsyncAimdLimiter(8)
+        limiter.throttle()
+        in_flight = []
+        
+        async def request():
+            async with limiter.slot():
+                in_flight.append((limiter.in_flight, int(limiter.limit)))
+                await asyncio.sleep(0.001)
+        
+        async def run_all():
+            await asyncio.gather(*(request() for _ in range(20)))
+        
+        asyncio.run(run_all())
+        
+        assert max(count for count, _ in in_flight) < 8
+        assert all(count <= limit for count, limit in in_flight)
@@ -144,4 +144,159 @@ class TestRuleEngine:
         
         # Should complete without infinite loop
         result = engine.process_email(mock_provider, email)
-        assert result is not None
\ No newline at end of file
+        assert result is not None
+    
+    def test_rule_fields(self):
+        """Test a rule reports the email fields its conditions read"""
+        rule = Rule('Fields', 'any',
+                    [ContainsCondition('from', 'a'), ContainsCondition('subject', 'b')],
+                    [MarkAsReadAction()])
+        assert rule.fields == {'from', 'subject'}
+
+    def test_next_evaluation_at(self):
+        """Test the engine reports when a date rule could start matching"""
+        from datetime import datetime
+        from rules.conditions.date_conditions import GreaterThanDaysCondition
+        now = datetime(2024, 1, 15)
+        rule = Rule('Old', 'all', [GreaterThanDaysCondition('received_date', 30)], [MarkAsReadAction()])
+        engine = RulesEngine([rule])
+        
+        recent = {'id': '1', 'received_date': datetime(2024, 1, 10)}
+        ancient = {'id': '2', 'received_date': datetime(2023, 1, 10)}
+        
+        assert engine.next_evaluation_at(recent, now) == datetime(2024, 2, 9)
+        assert engine.next_evaluation_at(ancient, now) is None
+
+    def test_compiled_all_rule_short_circuits(self, sample_email):
+        """Test an ALL rule stops at the first failing condition"""
+        from rules.conditions.conditions import Condition
+        
+        class CountingCondition(Condition):
+            cost = 5.0
+            calls = 0
+            
+            def evaluate(self, email):
+                CountingCondition.calls += 1
+                return True
+        
+        rule = Rule('Short', 'all',
+                    [CountingCondition('from', None), ContainsCondition('subject', 'not_present')],
+                    [MarkAsReadAction()])
+        
+        assert rule.matches(sample_email) is False
+        assert CountingCondition.calls == 0
+    
+    def test_compiled_any_rule_short_circuits(self, sample_email):
+        """Test an ANY rule stops at the first passing condition"""
+        from rules.conditions.conditions import Condition
+        
+        class ExplodingCondition(Condition):
+            cost = 50.0
+            
+            def evaluate(self, email):
+                raise AssertionError("should not be evaluated")
+        
+        rule = Rule('Short', 'any',
+                    [ExplodingCondition('from', None), ContainsCondition('subject', 'urgent')],
+                    [MarkAsReadAction()])
+        
+        assert rule.matches(sample_email) is True
+    
+    def test_rule_without_conditions_never_matches(self, sample_email):
+        """Test a rule with no conditions does not match"""
+        assert Rule('Empty', 'all', [], [MarkAsReadAction()]).matches(sample_email) is False
+        assert Rule('Empty', 'any', [], [MarkAsReadAction()]).matches(sample_email) is False
+    
+    def test_context_normalizes_fields_once(self, sample_email):
+        """Test rules sharing a context reuse normalized field values"""
+        from rules.context import EvaluationContext
+        context = EvaluationContext(sample_email)
+        
+        first = context.lower('from')
+        assert context.lower('from') is first
+        assert context.stripped('subject') == 'urgent: project update'
+
+    def test_engine_indexes_many_contains_needles(self, mock_gmail_provider, sample_email):
+        """Test indexed substring matching gives the same results as plain scans"""
+        from rules.engine import MIN_INDEXED_NEEDLES
+        from rules.conditions.string_conditions import DoesNotContainCondition
+        rules = [
+            Rule(f'Rule {i}', 'all', [ContainsCondition('subject', f'topic {i}')], [MarkAsReadAction()])
+            for i in range(MIN_INDEXED_NEEDLES)
+        ]
+        rules.append(Rule('Urgent', 'all', [ContainsCondition('subject', 'URGENT')], [MarkAsReadAction()]))
+        rules.append(Rule('Not spam', 'all', [DoesNotContainCondition('subject', 'spam')], [MarkAsReadAction()]))
+        engine = RulesEngine(rules)
+        
+        result = engine.process_email(mock_gmail_provider, sample_email)
+        
+        assert 'subject' in engine.substring_indexes
+        assert result['rules_matched'] == ['Urgent', 'Not spam']
+        # Overlapping needles all match through the automaton
+        topical = engine.process_email(mock_gmail_provider, dict(sample_email, subject='Re: TOPIC 12 notes'))
+        assert topical['rules_matched'] == ['Rule 1', 'Rule 12', 'Not spam']
+    
+    def test_engine_dispatches_equality_rules_by_value(self, mock_gmail_provider, sample_email):
+        """Test only rules keyed on the email's sender are evaluated"""
+        from rules.conditions.string_conditions import EqualsCondition
+        allow_list = Rule('Allow list', 'any',
+                          [EqualsCondition('from', f'user{i}@company.com') for i in range(1000)]
+                          + [EqualsCondition('from', 'BOSS@company.com')],
+                          [MarkAsReadAction()])
+        exact = Rule('Exact', 'all',
+                     [EqualsCondition('from', 'other@company.com'), ContainsCondition('subject', 'urgent')],
+                     [MarkAsReadAction()])
+        fallback = Rule('Fallback', 'all', [ContainsCondition('subject', 'project')], [MarkAsReadAction()])
+        engine = RulesEngine([allow_list, exact, fallback])
+        
+        from rules.context import EvaluationContext
+        assert engine.equality_index.candidates(EvaluationContext(sample_email)) == [0, 2]
+        result = engine.process_email(mock_gmail_provider, sample_email)
+        assert result['rules_matched'] == ['Allow list', 'Fallback']
+    
+    def test_grouped_does_not_equal_block_list(self, sample_email):
+        """Test an ALL rule of does_not_equal conditions acts as a block list"""
+        from rules.conditions.string_conditions import DoesNotEqualCondition
+        blocked = Rule('Block', 'all',
+                       [DoesNotEqualCondition('from', 'spam@x.com'), DoesNotEqualCondition('from', 'boss@company.com')],
+                       [MarkAsReadAction()])
+        allowed = Rule('Allow', 'all',
+                       [DoesNotEqualCondition('from', 'spam@x.com'), DoesNotEqualCondition('from', 'junk@x.com')],
+                       [MarkAsReadAction()])
+        
+        assert blocked.matches(sample_email) is False
+        assert allowed.matches(sample_email) is True
+    
+    def test_prepare_ensures_move_destinations(self, mock_gmail_provider):
+        """Test the pre-flight pass asks the provider for all destinations at once"""
+        from rules.actions.move_actions import MoveMessageAction
+        rules = [
+            Rule('Archive', 'all', [ContainsCondition('subject', 'a')],
+                 [MoveMessageAction({'destination': 'Archive'}), MarkAsReadAction()]),
+            Rule('Receipts', 'all', [ContainsCondition('subject', 'b')],
+                 [MoveMessageAction({'destination': 'Receipts'})]),
+        ]
+        
+        RulesEngine(rules).prepare(mock_gmail_provider)
+        
+        mock_gmail_provider.ensure_labels.assert_called_once_with({'Archive', 'Receipts'})
+    
+    def test_prepare_without_destinations_skips_provider(self, mock_gmail_provider):
+        """Test rules without label actions need no provider calls"""
+        rule = Rule('Read', 'all', [ContainsCondition('subject', 'a')], [MarkAsReadAction()])
+        
+        assert RulesEngine([rule]).prepare(mock_gmail_provider) == {}
+        mock_gmail_provider.ensure_labels.assert_not_called()
+    
+    def test_prepare_with_provider_without_labels(self):
+        """Test providers that do not manage labels pass the pre-flight pass"""
+        from provider.email_provider import EmailProvider
+        from rules.actions.move_actions import MoveMessageAction
+        
+        class FolderProvider(EmailProvider):
+            authenticate = fetch_emails = mark_as_read = mark_as_unread = move_email = MagicMock()
+        
+        rule = Rule('Archive', 'all', [ContainsCondition('subject', 'a')],
+                    [MoveMessageAction({'destination': 'Archive'})])
+        
+        assert RulesEngine([rule]).prepare(FolderProvider()) == {}
@@ -0,0 +1,67 @@
+from rules.index import SubstringIndex
+
+
+class TestSubstringIndex:
+    """Test the Aho-Corasick substring index"""
+    
+    def test_search_finds_all_needles(self):
+        """Test every occurring needle is reported"""
+        index = SubstringIndex(['boss', 'company', 'urgent', 'missing'])
+        assert index.search('boss@company.com urgent') == {'boss', 'company', 'urgent'}
+    
+    def test_search_finds_overlapping_needles(self):
+        """Test needles sharing text or prefixes are all found"""
+        index = SubstringIndex(['he', 'she', 'his', 'hers'])
+        assert index.search('ushers') == {'she', 'he', 'hers'}
+    
+    def test_search_without_match(self):
+        """Test a text with no needles returns an empty set"""
+        assert SubstringIndex(['abc']).search('xyz') == frozenset()
+    
+    def test_empty_needle_always_matches(self):
+        """Test the empty needle behaves like '' in text"""
+        assert SubstringIndex(['', 'x']).search('abc') == {''}
+    
+    def test_add_after_search_rebuilds(self):
+        """Test needles added later are picked up"""
+        index = SubstringIndex(['abc'])
+        index.search('abc')
+        index.add('bcd')
+        assert index.search('abcd') == {'abc', 'bcd'}
+        assert len(index) == 2
+    
+    def test_matches_python_in_operator(self):
+        """Test results agree with naive substring checks"""
+        import random
+        rng = random.Random(7)
+        needles = {''.join(rng.choice('abc') for _ in range(rng.randint(1, 4))) for _ in range(40)}
+        index = SubstringIndex(needles)
+        for _ in range(200):
+            text = ''.join(rng.choice('abcd') for _ in range(rng.randint(0, 30)))
+            assert index.search(text) == {n for n in needles if n in text}
+
+
+class TestEqualityIndex:
+    """Test hash-indexed equality dispatch"""
+    
+    def test_candidates_by_value(self):
+        """Test keyed rules are only candidates for their value"""
+        from rules.context import EvaluationContext
+        from rules.index import EqualityIndex
+        index = EqualityIndex()
+        index.add(0, [('from', 'a@x.com')])
+        index.add(1, None)
+        index.add(2, [('from', 'b@x.com'), ('from', 'c@x.com')])
+        
+        assert index.candidates(EvaluationContext({'from': ' C@x.com'})) == [1, 2]
+        assert index.candidates(EvaluationContext({'from': 'a@x.com'})) == [0, 1]
+        assert index.candidates(EvaluationContext({'from': 'z@x.com'})) == [1]
+    
+    def test_unkeyed_rules_only(self):
+        """Test an index without keyed rules returns every registered rule"""
+        from rules.context import EvaluationContext
+        from rules.index import EqualityIndex
+        index = EqualityIndex()
+        index.add(0, None)
+        index.add(1, None)
+        assert index.candidates(EvaluationContext({})) == [0, 1]
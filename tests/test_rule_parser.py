@@ -47,4 +47,24 @@ class TestRuleParser:
         
         parser = RuleParser()
         with pytest.raises(Exception):
-            parser.parse_file(str(invalid_file))
\ No newline at end of file
+            parser.parse_file(str(invalid_file))
+    
+    def test_rules_version_fingerprint(self, sample_rules_json, tmp_path):
+        """Test the rules version changes only when the rules do"""
+        import json
+        parser = RuleParser()
+        parser.parse_file(sample_rules_json)
+        first_version = parser.rules_version
+        
+        with open(sample_rules_json) as f:
+            data = json.load(f)
+        reformatted = tmp_path / "reformatted.json"
+        reformatted.write_text(json.dumps(data, indent=4))
+        parser.parse_file(str(reformatted))
+        assert parser.rules_version == first_version
+        
+        data['rules'][0]['conditions'][0]['value'] = 'manager'
+        changed = tmp_path / "changed.json"
+        changed.write_text(json.dumps(data))
+        parser.parse_file(str(changed))
+        assert parser.rules_version != first_version
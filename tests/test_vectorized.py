@@ -0,0 +1,162 @@
+import random
+from datetime import datetime, timedelta
+from rules.engine import Rule, RulesEngine, VECTORIZE_MIN_BATCH
+from rules.conditions.conditions import Condition
+from rules.conditions.factory import ConditionFactory
+from rules.actions.mark_actions import MarkAsReadAction
+from rules.vectorized import ColumnarBatch, match_matrix, matched_positions
+
+
+NOW = datetime(2024, 6, 1, 12, 0, 0)
+
+
+def make_emails(count, seed=3):
+    """Generate emails with overlapping senders, subjects and dates"""
+    rng = random.Random(seed)
+    senders = ['boss@company.com', ' Boss@Company.com ', 'news@example.com', 'spam@x.com', '']
+    words = ['urgent', 'project', 'invoice', 'weekly', 'Newsletter', 'meeting']
+    emails = []
+    for i in range(count):
+        emails.append({
+            'id': f'msg_{i}',
+            'from': rng.choice(senders),
+            'subject': ' '.join(rng.sample(words, rng.randint(0, 3))),
+            'received_date': NOW - timedelta(days=rng.randint(0, 400), hours=rng.randint(0, 23)),
+            'is_read': rng.random() < 0.5,
+        })
+    return emails
+
+
+def make_rules():
+    """Rules covering every built-in condition type and both predicates"""
+    specs = [
+        ('all', [('contains', 'subject', 'URGENT'), ('less_than_days', 'received_date', 30)]),
+        ('any', [('equals', 'from', 'boss@company.com'), ('equals', 'from', 'news@example.com'),
+                 ('contains', 'subject', 'invoice')]),
+        ('all', [('does_not_equal', 'from', 'spam@x.com'), ('does_not_equal', 'from', ''),
+                 ('does_not_contain', 'subject', 'weekly')]),
+        ('any', [('greater_than_months', 'received_date', 6), ('equals', 'is_read', 'True')]),
+        ('all', [('greater_than_days', 'received_date', 100), ('less_than_months', 'received_date', 12)]),
+        ('any', []),
+    ]
+    return [
+        Rule(f'Rule {i}', predicate,
+             [ConditionFactory.create(kind, field, value) for kind, field, value in conditions],
+             [MarkAsReadAction()])
+        for i, (predicate, conditions) in enumerate(specs)
+    ]
+
+
+class TestVectorizedMatching:
+    """Test column-wise rule evaluation"""
+    
+    def test_matrix_agrees_with_scalar_matching(self):
+        """Test the match matrix equals per-email evaluation for every rule"""
+        emails = make_emails(300)
+        rules = make_rules()
+        for rule in rules:
+            rule.compile(NOW)
+        
+        matrix = match_matrix(rules, emails, NOW)
+        
+        assert matrix.shape == (300, len(rules))
+        for row, email in enumerate(emails):
+            assert matrix[row].tolist() == [rule.matches(email) for rule in rules]
+    
+    def test_rule_without_conditions_never_matches(self):
+        """Test empty rules give an all-False column"""
+        matrix = match_matrix([Rule('Empty', 'all', [], [])], make_emails(5), NOW)
+        assert not matrix.any()
+    
+    def test_invalid_dates_never_match(self):
+        """Test missing or malformed dates drop out of date conditions"""
+        emails = [{'received_date': 'not a date'}, {}, {'received_date': (NOW - timedelta(days=2)).isoformat()}]
+        rule = Rule('Recent', 'all', [ConditionFactory.create('less_than_days', 'received_date', 7)], [])
+        
+        assert match_matrix([rule], emails, NOW)[:, 0].tolist() == [False, False, True]
+    
+    def test_invalid_condition_value_never_matches(self):
+        """Test a non-numeric date value yields no matches instead of an error"""
+        rule = Rule('Broken', 'all', [ConditionFactory.create('less_than_days', 'received_date', 'abc')], [])
+        assert not match_matrix([rule], make_emails(10), NOW).any()
+    
+    def test_custom_condition_falls_back_to_predicate(self):
+        """Test conditions without a vector form are evaluated row by row"""
+        class EvenIdCondition(Condition):
+            def evaluate(self, email):
+                return int(email['id'].split('_')[1]) % 2 == 0
+        
+        rule = Rule('Even', 'all', [EvenIdCondition('id', None)], [])
+        column = match_matrix([rule], make_emails(6), NOW)[:, 0]
+        
+        assert column.tolist() == [True, False, True, False, True, False]
+    
+    def test_failing_condition_only_affects_its_emails(self):
+        """Test a condition raising on some emails falls back to scalar matching for that rule"""
+        class FragileCondition(Condition):
+            def evaluate(self, email):
+                if email['id'] == 'msg_1':
+                    raise ValueError('boom')
+                return True
+        
+        rules = [Rule('Fragile', 'all', [FragileCondition('id', None)], []),
+                 Rule('Urgent', 'all', [ConditionFactory.create('contains', 'subject', 'urgent')], [])]
+        emails = make_emails(4)
+        
+        matrix = match_matrix(rules, emails, NOW)
+        
+        assert matrix[:, 0].tolist() == [True, False, True, True]
+        assert matrix[:, 1].tolist() == ['urgent' in email['subject'] for email in emails]
+    
+    def test_columns_are_normalized_once(self):
+        """Test a field column is built once and shared across conditions"""
+        batch = ColumnarBatch([{'subject': ' Hello '}, {'subject': 'WORLD'}])
+        
+        assert batch.lower('subject') is batch.lower('subject')
+        assert batch.stripped('subject').tolist() == ['hello', 'world']
+        assert batch.contains('subject', 'wor').tolist() == [False, True]
+    
+    def test_matched_positions(self):
+        """Test matrix rows convert to matched rule positions"""
+        import numpy as np
+        matrix = np.array([[True, False, True], [False, False, False]])
+        assert matched_positions(matrix) == [[0, 2], []]
+    
+    def test_engine_uses_matrix_for_large_batches(self, mock_gmail_provider):
+        """Test process_emails gives the same results on the vectorized path"""
+        emails = make_emails(VECTORIZE_MIN_BATCH + 10)
+        engine = RulesEngine(make_rules(), now=NOW)
+        
+        results = engine.process_emails(mock_gmail_provider, emails)
+        
+        expected = [engine.process_email(mock_gmail_provider, email)['rules_matched'] for email in emails]
+        assert [result['rules_matched'] for result in results] == expected
+    
+    def test_large_batches_keep_using_the_indexes(self, mocker):
+        """Test equality-keyed rules bypass the matrix and results still match per-email matching"""
+        import rules.engine as engine_module
+        equality_rules = [
+            Rule(f'Sender {i}', 'all', [ConditionFactory.create('equals', 'from', sender)], [])
+            for i, sender in enumerate(['boss@company.com', 'news@example.com', 'nobody@x.com'])
+        ]
+        rules = make_rules() + equality_rules
+        emails = make_emails(VECTORIZE_MIN_BATCH + 10)
+        engine = RulesEngine(rules, now=NOW)
+        spy = mocker.spy(engine_module, 'match_matrix')
+        
+        positions = engine.match_batch_positions(emails)
+        
+        assert positions == [engine.match_positions(email) for email in emails]
+        assert not any(rule in spy.call_args.args[0] for rule in equality_rules)
+        assert any(len(row) > 1 and row[-1] >= len(make_rules()) for row in positions)
+    
+    def test_indexed_contains_agrees_with_column_scan(self):
+        """Test contains on a field with a substring index gives the same vectors"""
+        from rules.index import SubstringIndex
+        emails = make_emails(50)
+        needles = ['urgent', 'invoice', 'ly', 'zzz']
+        indexed = ColumnarBatch(emails, {'subject': SubstringIndex(needles)})
+        plain = ColumnarBatch(emails)
+        
+        for needle in needles + ['meeting']:
+            assert indexed.contains('subject', needle).tolist() == plain.contains('subject', needle).tolist()